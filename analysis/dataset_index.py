@@ -0,0 +1,468 @@
+"""
+dataset_index.py
+--------------------------------------------------------------------
+Query-able dataset index (SQLite) for EDA and subset creation.
+
+Tables:
+- images  : one row per image file (dataset, split, path, width/height from
+            the file header, bytes, md5, crawl query / origin stem parsed from
+            the crawler's `<date>_<time>_<query>_<idx>` names, augmented flag)
+- boxes   : one row per label line (class, normalized x/y/w/h, area, and the
+            fused confidence / agreement from the ensemble agreement files
+            when they exist)
+- classes : class id -> name from data.yaml
+
+`build` is incremental: a dataset whose split folders did not change since
+the last build is skipped without reading any image or label. The stamp is
+the mtime of every images/labels folder, which moves when files are added,
+removed or written atomically, plus the newest label file mtime, for labels
+edited in place; that last part costs one scandir + stat per label file, the
+images folders are never listed. Otherwise only images whose file or label
+changed (size / mtime) are re-hashed and re-parsed, and rows of removed files
+are deleted. `--full` rescans anyway, e.g. after an image was overwritten in
+place.
+
+`export` works on one dataset (`--dataset` is required): data/labeled and
+data/processed share file names, and a subset mixing them would pair an image
+with the other dataset's label.
+
+Usage:
+    python analysis/dataset_index.py build --dataset_dir data/labeled data/processed
+    python analysis/dataset_index.py find --split val --class banana --min_count 3 --max_area 0.05
+    python analysis/dataset_index.py query "SELECT split, COUNT(*) FROM images GROUP BY split"
+    python analysis/dataset_index.py export data/subsets/small_bananas --dataset data/processed \
+        --class banana --max_area 0.05
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from analysis.run_analysis import load_class_names
+from logs.log import get_logger
+from utils.memory import image_shape, iter_images
+
+log = get_logger("dataset_index")
+
+DEFAULT_DB = "data/stats/dataset_index.sqlite"
+SPLITS = ("train", "val", "test")
+SCHEMA_VERSION = 1
+# Tên file của crawler: <yymmdd>_<hhmmss>_<query>_<idx>[_aug|_augN]
+_CRAWL_NAME = re.compile(r"^\d{6}_\d{6}_(?P<query>.+)_\d{4}$")
+_AUG_SUFFIX = re.compile(r"_aug\d*$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS classes (id INTEGER PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS images (
+    id          INTEGER PRIMARY KEY,
+    dataset     TEXT NOT NULL,
+    split       TEXT NOT NULL,
+    path        TEXT NOT NULL UNIQUE,
+    label_path  TEXT,
+    stem        TEXT NOT NULL,
+    origin      TEXT NOT NULL,
+    query       TEXT,
+    augmented   INTEGER NOT NULL,
+    width       INTEGER,
+    height      INTEGER,
+    bytes       INTEGER NOT NULL,
+    md5         TEXT NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    label_mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS boxes (
+    image_id    INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    class_id    INTEGER NOT NULL,
+    x REAL NOT NULL, y REAL NOT NULL, w REAL NOT NULL, h REAL NOT NULL,
+    area        REAL NOT NULL,
+    confidence  REAL,
+    agreement   REAL
+);
+CREATE INDEX IF NOT EXISTS idx_images_split ON images(dataset, split);
+CREATE INDEX IF NOT EXISTS idx_images_query ON images(query);
+CREATE INDEX IF NOT EXISTS idx_images_md5 ON images(md5);
+CREATE INDEX IF NOT EXISTS idx_images_origin ON images(origin);
+CREATE INDEX IF NOT EXISTS idx_boxes_image ON boxes(image_id);
+CREATE INDEX IF NOT EXISTS idx_boxes_class_area ON boxes(class_id, area);
+"""
+
+
+def connect(db_path=DEFAULT_DB) -> sqlite3.Connection:
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path))
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA)
+    conn.execute("INSERT OR REPLACE INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+    return conn
+
+
+def _meta(conn, key):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else None
+
+
+# ==============================================================================
+# Build
+# ==============================================================================
+def file_md5(path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def parse_source(stem: str):
+    """(origin stem, crawl query or None, augmented) from the file name."""
+    origin = _AUG_SUFFIX.sub("", stem)
+    m = _CRAWL_NAME.match(origin)
+    query = m.group("query").replace("_", " ") if m else None
+    return origin, query, origin != stem
+
+
+def _box_key(x, y, w, h):
+    return round(x, 5), round(y, 5), round(w, 5), round(h, 5)
+
+
+def load_agreement(path: Path) -> dict:
+    """Box key -> (confidence, agreement) from an ensemble agreement file."""
+    scores = {}
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 7:
+                    x, y, w, h, conf, agree = map(float, parts[1:7])
+                    scores[_box_key(x, y, w, h)] = (conf, agree)
+    except FileNotFoundError:
+        pass
+    return scores
+
+
+def parse_boxes(label_path: Path, scores: dict):
+    """(class, x, y, w, h, area, confidence, agreement) per valid YOLO label line."""
+    boxes = []
+    try:
+        with open(label_path, "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 5:
+                    continue
+                cls_id = int(parts[0])
+                x, y, w, h = map(float, parts[1:5])
+                conf = float(parts[5]) if len(parts) >= 6 else None
+                agree = None
+                match = scores.get(_box_key(x, y, w, h)) if scores else None
+                if match:
+                    conf, agree = match
+                boxes.append((cls_id, x, y, w, h, w * h, conf, agree))
+    except FileNotFoundError:
+        pass
+    return boxes
+
+
+def _tree_stamp(dataset_dir: Path):
+    """Change stamp of a dataset's split folders, None when it has none."""
+    parts = []
+    for split in SPLITS:
+        for sub in ("images", "labels"):
+            folder = dataset_dir / split / sub
+            try:
+                parts.append(f"{split}/{sub}:{folder.stat().st_mtime_ns}")
+            except FileNotFoundError:
+                continue
+            if sub == "labels":
+                # Sửa label tại chỗ (không qua rename) không đổi mtime của thư mục
+                with os.scandir(folder) as it:
+                    newest = max((e.stat().st_mtime_ns for e in it if e.is_file()), default=0)
+                parts.append(f"{split}/newest_label:{newest}")
+    return ";".join(parts) or None
+
+
+def index_split(conn, dataset: str, dataset_dir: Path, split: str, agreement_dir: Path = None):
+    """Sync one split folder into the index. Returns (added_or_updated, unchanged, removed)."""
+    image_dir = dataset_dir / split / "images"
+    label_dir = dataset_dir / split / "labels"
+    known = {row["path"]: row for row in conn.execute(
+        "SELECT id, path, bytes, mtime_ns, label_mtime_ns FROM images WHERE dataset = ? AND split = ?",
+        (dataset, split))}
+
+    updated = unchanged = 0
+    seen = set()
+    for img_path in iter_images(image_dir):
+        key = img_path.as_posix()
+        seen.add(key)
+        st = img_path.stat()
+        label_path = label_dir / (img_path.stem + ".txt")
+        try:
+            label_mtime = label_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            label_mtime = None
+
+        row = known.get(key)
+        if row is not None and row["bytes"] == st.st_size and row["mtime_ns"] == st.st_mtime_ns \
+                and row["label_mtime_ns"] == label_mtime:
+            unchanged += 1
+            continue
+
+        origin, query, augmented = parse_source(img_path.stem)
+        shape = image_shape(img_path) or (None, None)
+        values = (dataset, split, key, label_path.as_posix() if label_mtime is not None else None,
+                  img_path.stem, origin, query, int(augmented), shape[0], shape[1],
+                  st.st_size, file_md5(img_path), st.st_mtime_ns, label_mtime)
+        if row is None:
+            image_id = conn.execute(
+                "INSERT INTO images (dataset, split, path, label_path, stem, origin, query, augmented, "
+                "width, height, bytes, md5, mtime_ns, label_mtime_ns) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", values).lastrowid
+        else:
+            image_id = row["id"]
+            conn.execute(
+                "UPDATE images SET dataset = ?, split = ?, path = ?, label_path = ?, stem = ?, origin = ?, "
+                "query = ?, augmented = ?, width = ?, height = ?, bytes = ?, md5 = ?, mtime_ns = ?, "
+                "label_mtime_ns = ? WHERE id = ?", values + (image_id,))
+            conn.execute("DELETE FROM boxes WHERE image_id = ?", (image_id,))
+
+        # Confidence / agreement chỉ có cho ảnh gốc (augment làm box thay đổi)
+        scores = {}
+        if agreement_dir is not None and not augmented:
+            scores = load_agreement(agreement_dir / (origin + ".txt"))
+        conn.executemany(
+            "INSERT INTO boxes (image_id, class_id, x, y, w, h, area, confidence, agreement) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(image_id,) + b for b in parse_boxes(label_path, scores)])
+        updated += 1
+
+    gone = [row["id"] for path, row in known.items() if path not in seen]
+    conn.executemany("DELETE FROM images WHERE id = ?", [(i,) for i in gone])
+    return updated, unchanged, len(gone)
+
+
+def build_index(conn, dataset_dirs, class_names: dict = None, agreement_dir=None, full: bool = False):
+    """Incremental update of the index from the given dataset folders."""
+    if class_names:
+        with conn:
+            conn.execute("DELETE FROM classes")
+            conn.executemany("INSERT INTO classes VALUES (?, ?)", sorted(class_names.items()))
+
+    for dataset_dir in map(Path, dataset_dirs):
+        dataset = dataset_dir.as_posix()
+        stamp = _tree_stamp(dataset_dir)
+        if not full and stamp is not None and _meta(conn, f"stamp:{dataset}") == stamp:
+            log.info(f"⏭️  {dataset}: images/labels không đổi, bỏ qua")
+            continue
+
+        t0 = time.perf_counter()
+        agree_dir = Path(agreement_dir) if agreement_dir else dataset_dir / "agreement"
+        with conn:  # một transaction cho mỗi dataset
+            totals = [0, 0, 0]
+            for split in SPLITS:
+                counts = index_split(conn, dataset, dataset_dir, split,
+                                     agree_dir if agree_dir.exists() else None)
+                totals = [t + c for t, c in zip(totals, counts)]
+            conn.execute("DELETE FROM images WHERE dataset = ? AND split NOT IN (?, ?, ?)",
+                         (dataset,) + SPLITS)
+            if stamp is not None:
+                conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (f"stamp:{dataset}", stamp))
+        log.info(f"🗂️  {dataset}: {totals[0]} updated, {totals[1]} unchanged, {totals[2]} removed "
+                 f"({time.perf_counter() - t0:.2f}s)")
+
+
+# ==============================================================================
+# Query API
+# ==============================================================================
+def class_ids(conn, classes) -> list:
+    """Class names or ids -> ids."""
+    by_name = {row["name"]: row["id"] for row in conn.execute("SELECT id, name FROM classes")}
+    ids = []
+    for c in classes:
+        c = str(c)
+        if c.isdigit():
+            ids.append(int(c))
+        elif c in by_name:
+            ids.append(by_name[c])
+        else:
+            raise ValueError(f"Unknown class '{c}' (known: {', '.join(sorted(by_name))})")
+    return ids
+
+
+def find_images(conn, dataset: str = None, split: str = None, classes=None, min_count: int = 1,
+                min_area: float = None, max_area: float = None, min_conf: float = None,
+                query: str = None, augmented: bool = None, where: str = None, limit: int = None):
+    """
+    Images having at least `min_count` boxes of `classes` that match the box
+    filters (area, confidence). Without box filters every image matches.
+    """
+    image_cond, params = [], []
+    for column, value in (("i.dataset", dataset), ("i.split", split), ("i.query", query)):
+        if value is not None:
+            image_cond.append(f"{column} = ?")
+            params.append(value)
+    if augmented is not None:
+        image_cond.append("i.augmented = ?")
+        params.append(int(augmented))
+    if where:
+        image_cond.append(f"({where})")
+
+    box_cond, box_params = [], []
+    if classes:
+        ids = class_ids(conn, classes)
+        box_cond.append(f"b.class_id IN ({', '.join('?' * len(ids))})")
+        box_params += ids
+    for cond, value in (("b.area >= ?", min_area), ("b.area <= ?", max_area), ("b.confidence >= ?", min_conf)):
+        if value is not None:
+            box_cond.append(cond)
+            box_params.append(value)
+
+    if box_cond:
+        sql = (f"SELECT i.*, COUNT(*) AS n_boxes FROM images i JOIN boxes b ON b.image_id = i.id "
+               f"WHERE {' AND '.join(image_cond + box_cond)} GROUP BY i.id HAVING COUNT(*) >= ?")
+        params += box_params + [min_count]
+    else:
+        sql = "SELECT i.* FROM images i" + (f" WHERE {' AND '.join(image_cond)}" if image_cond else "")
+    sql += " ORDER BY i.path"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    return conn.execute(sql, params).fetchall()
+
+
+def export_yolo(conn, rows, out_dir, link: bool = True):
+    """
+    Subset as a YOLO folder (<split>/images, <split>/labels, data.yaml) of
+    hardlinks to the indexed files; falls back to copies across filesystems.
+    Rows must come from one dataset. Returns (exported, skipped): an image
+    already in `out_dir` (earlier export) is skipped together with its label.
+    """
+    datasets = {row["dataset"] for row in rows}
+    if len(datasets) > 1:
+        raise ValueError(f"Export một dataset mỗi lần (tên file trùng nhau giữa các dataset): "
+                         f"{', '.join(sorted(datasets))}")
+    out_dir = Path(out_dir)
+    place = _link_or_copy if link else shutil.copy2
+    n = skipped = 0
+    for row in rows:
+        img_dst = out_dir / row["split"] / "images" / Path(row["path"]).name
+        if img_dst.exists():
+            skipped += 1
+            continue
+        # Label trước, ảnh sau (như split_dataset): ảnh có trong subset thì label đã có
+        if row["label_path"] is not None:
+            lbl_dst = out_dir / row["split"] / "labels" / Path(row["label_path"]).name
+            lbl_dst.parent.mkdir(parents=True, exist_ok=True)
+            lbl_dst.unlink(missing_ok=True)
+            place(row["label_path"], lbl_dst)
+        img_dst.parent.mkdir(parents=True, exist_ok=True)
+        place(row["path"], img_dst)
+        n += 1
+
+    import yaml
+    cfg = {"path": out_dir.resolve().as_posix()}
+    splits = {row["split"] for row in rows}
+    cfg.update({split: f"{split}/images" for split in SPLITS if split in splits})
+    cfg["names"] = {row["id"]: row["name"] for row in conn.execute("SELECT id, name FROM classes ORDER BY id")}
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with open(out_dir / "data.yaml", "w") as f:
+        yaml.safe_dump(cfg, f, sort_keys=False, allow_unicode=True)
+    return n, skipped
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+# ==============================================================================
+# CLI
+# ==============================================================================
+def _add_filters(parser, dataset_required=False):
+    parser.add_argument("--dataset", type=str, default=None, required=dataset_required,
+                        help="Chỉ dataset này (vd: data/processed)")
+    parser.add_argument("--split", type=str, default=None, help="train / val / test")
+    parser.add_argument("--class", dest="classes", type=str, default=None,
+                        help="Tên hoặc id class, phân cách bằng dấu phẩy")
+    parser.add_argument("--min_count", type=int, default=1, help="Số box khớp tối thiểu mỗi ảnh")
+    parser.add_argument("--min_area", type=float, default=None, help="Diện tích box tối thiểu (tỉ lệ ảnh)")
+    parser.add_argument("--max_area", type=float, default=None, help="Diện tích box tối đa (tỉ lệ ảnh)")
+    parser.add_argument("--min_conf", type=float, default=None, help="Confidence tối thiểu (ensemble)")
+    parser.add_argument("--query", type=str, default=None, help="Query crawl của ảnh")
+    parser.add_argument("--augmented", type=int, choices=[0, 1], default=None, help="Chỉ ảnh augment (1) / gốc (0)")
+    parser.add_argument("--where", type=str, default=None, help="Điều kiện SQL thêm trên bảng images (alias i)")
+
+
+def _find(conn, args, limit=None):
+    dataset = Path(args.dataset).as_posix() if args.dataset else None  # như khi build
+    return find_images(conn, dataset, args.split, args.classes.split(",") if args.classes else None,
+                       args.min_count, args.min_area, args.max_area, args.min_conf, args.query,
+                       None if args.augmented is None else bool(args.augmented), args.where, limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite dataset index: build, query, export subsets")
+    parser.add_argument("--db", type=str, default=DEFAULT_DB, help="File SQLite của index")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("build", help="Cập nhật index (incremental)")
+    p.add_argument("--dataset_dir", type=str, nargs="+", default=["data/labeled", "data/processed"])
+    p.add_argument("--yaml", type=str, default="data/data.yaml", help="Class names")
+    p.add_argument("--agreement_dir", type=str, default=None,
+                   help="Thư mục agreement của ensemble (mặc định <dataset_dir>/agreement)")
+    p.add_argument("--full", action="store_true", help="Quét lại kể cả khi images/labels không đổi")
+
+    p = sub.add_parser("find", help="Liệt kê ảnh theo filter")
+    _add_filters(p)
+    p.add_argument("--limit", type=int, default=None)
+
+    p = sub.add_parser("query", help="Chạy SQL tuỳ ý")
+    p.add_argument("sql", type=str)
+
+    p = sub.add_parser("export", help="Xuất subset dạng YOLO folder (hardlink)")
+    p.add_argument("out_dir", type=str)
+    _add_filters(p, dataset_required=True)
+    p.add_argument("--copy", action="store_true", help="Copy thay vì hardlink")
+
+    args = parser.parse_args()
+    conn = connect(args.db)
+    t0 = time.perf_counter()
+
+    if args.command == "build":
+        yaml_path = Path(args.yaml)
+        class_names = load_class_names(None, yaml_path) if yaml_path.exists() else None
+        build_index(conn, args.dataset_dir, class_names, args.agreement_dir, args.full)
+        n_images, n_boxes = (conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("images", "boxes"))
+        log.info(f"✅ Index {args.db}: {n_images} images, {n_boxes} boxes ({time.perf_counter() - t0:.2f}s)")
+    elif args.command == "find":
+        rows = _find(conn, args, args.limit)
+        for row in rows:
+            print(row["path"] + (f"\t{row['n_boxes']}" if "n_boxes" in row.keys() else ""))
+        log.info(f"🔎 {len(rows)} images ({(time.perf_counter() - t0) * 1000:.1f} ms)")
+    elif args.command == "query":
+        cur = conn.execute(args.sql)
+        if cur.description:
+            print("\t".join(d[0] for d in cur.description))
+            for row in cur:
+                print("\t".join("" if v is None else str(v) for v in row))
+        conn.commit()
+    else:
+        rows = _find(conn, args)
+        n, skipped = export_yolo(conn, rows, args.out_dir, link=not args.copy)
+        log.info(f"📦 Exported {n} images -> {args.out_dir} ({time.perf_counter() - t0:.2f}s)")
+        if skipped:
+            log.info(f"⏭️  Bỏ qua {skipped} images đã có trong {args.out_dir}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+report.py
+--------------------------------------------------------------------
+Incremental dataset report: charts + one static HTML page.
+
+Stats come from the manifest the stages already write (`<dataset>/stats.json`
+from autolabel / preprocess), so building the report does not re-scan the
+dataset. Each chart is described by a small spec; its md5 is stored in
+`<output_dir>/.report_cache.json` and a chart is only re-rendered when its
+spec hash changes (or the PNG is missing). Charts that do need rendering are
+drawn in parallel worker processes with the Agg canvas.
+
+The HTML embeds the PNGs as data URIs, so the report is a single file that
+can be copied or served as-is.
+"""
+
+import base64
+import hashlib
+import html
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from analysis.visualize import render_chart
+from logs.log import get_logger
+
+log = get_logger("analysis")
+
+CACHE_NAME = ".report_cache.json"
+# Đổi giá trị này khi sửa cách vẽ trong visualize.py để vẽ lại toàn bộ chart
+CHART_VERSION = 2
+
+
+# ==============================================================================
+# Stats
+# ==============================================================================
+def normalize_stats(stats: dict) -> dict:
+    """JSON round trips turn class ids into strings; bring them back to int."""
+    stats = dict(stats)
+    for key in ("objets_per_class", "images_per_class"):
+        stats[key] = {int(k): v for k, v in stats.get(key, {}).items()}
+    return stats
+
+
+def load_stats_manifest(path: Path) -> dict:
+    with open(path, "r") as f:
+        return {split: normalize_stats(s) for split, s in json.load(f).items()}
+
+
+def class_matrix(all_stats: dict, class_names: dict):
+    """(splits, class_ids, counts[split, class]) for the per-class table."""
+    splits = list(all_stats)
+    ids = sorted(set(class_names) | {c for s in all_stats.values() for c in s["objets_per_class"]})
+    counts = np.array([[all_stats[s]["objets_per_class"].get(c, 0) for c in ids] for s in splits],
+                      dtype=np.int64).reshape(len(splits), len(ids))
+    return splits, ids, counts
+
+
+# ==============================================================================
+# Charts
+# ==============================================================================
+def chart_specs(all_stats: dict, class_names: dict) -> dict:
+    """file name -> spec; the spec holds exactly the data the chart is drawn from."""
+    specs = {}
+    for split, stats in all_stats.items():
+        data = {"objets_per_class": stats["objets_per_class"], "total_objects": stats["total_objects"]}
+        specs[f"{split}_objects_per_class.png"] = {
+            "kind": "objects_per_class", "split": split, "stats": data, "class_names": class_names}
+        specs[f"{split}_class_distribution.png"] = {
+            "kind": "class_distribution", "split": split, "stats": data, "class_names": class_names}
+    specs["horizontal_bar_dataset_distribution.png"] = {
+        "kind": "split_distribution",
+        "split_images": {split: s["total_images"] for split, s in all_stats.items()}}
+    return specs
+
+
+def spec_hash(spec: dict) -> str:
+    payload = json.dumps({"version": CHART_VERSION, "spec": spec}, sort_keys=True, default=str)
+    return hashlib.md5(payload.encode()).hexdigest()
+
+
+def _render(args):
+    spec, out_path = args
+    return render_chart(spec, out_path)
+
+
+def render_charts(specs: dict, output_dir: Path, jobs: int = 0, force: bool = False):
+    """Render charts whose spec changed. Returns (rendered, reused) file name lists."""
+    cache_path = output_dir / CACHE_NAME
+    cache = {}
+    if cache_path.exists() and not force:
+        with open(cache_path, "r") as f:
+            cache = json.load(f)
+
+    hashes = {name: spec_hash(spec) for name, spec in specs.items()}
+    todo = [name for name in specs
+            if force or cache.get(name) != hashes[name] or not (output_dir / name).exists()]
+    reused = [name for name in specs if name not in todo]
+
+    if todo:
+        work = [(specs[name], str(output_dir / name)) for name in todo]
+        workers = min(jobs or os.cpu_count() or 1, len(work))
+        if workers > 1:
+            with ProcessPoolExecutor(workers) as pool:
+                list(pool.map(_render, work))
+        else:
+            for item in work:
+                _render(item)
+
+    # Chỉ giữ hash của các chart còn tồn tại trong report hiện tại
+    with open(cache_path, "w") as f:
+        json.dump({name: hashes[name] for name in specs}, f, indent=2)
+    return todo, reused
+
+
+# ==============================================================================
+# HTML
+# ==============================================================================
+def _img_tag(path: Path, alt: str) -> str:
+    data = base64.b64encode(path.read_bytes()).decode()
+    return f'<img src="data:image/png;base64,{data}" alt="{html.escape(alt)}">'
+
+
+def write_html(all_stats: dict, class_names: dict, output_dir: Path, report_path: Path,
+               source: str, charts: dict = None):
+    """Single static page: summary table, per-class table and the charts (if rendered)."""
+    splits, ids, counts = class_matrix(all_stats, class_names)
+    totals = counts.sum(axis=0)
+    share = np.divide(counts, counts.sum(axis=1, keepdims=True),
+                      out=np.zeros(counts.shape), where=counts.sum(axis=1, keepdims=True) > 0)
+
+    rows = []
+    for split in splits:
+        s = all_stats[split]
+        rows.append(f"<tr><td>{html.escape(split)}</td><td>{s['total_images']}</td>"
+                    f"<td>{s['total_labels']}</td><td>{s['total_objects']}</td>"
+                    f"<td>{s['avg_objets_per_image']}</td></tr>")
+
+    head = "".join(f"<th>{html.escape(s)}</th>" for s in splits)
+    class_rows = []
+    for j, c in enumerate(ids):
+        cells = "".join(f"<td>{counts[i, j]} <small>({share[i, j]:.1%})</small></td>"
+                        for i in range(len(splits)))
+        class_rows.append(f"<tr><td>{html.escape(str(class_names.get(c, f'class_{c}')))}</td>"
+                          f"{cells}<td>{totals[j]}</td></tr>")
+
+    figures = []
+    for name in charts or {}:
+        path = output_dir / name
+        if path.exists():
+            figures.append(f"<figure>{_img_tag(path, name)}<figcaption>{html.escape(name)}</figcaption></figure>")
+
+    page = f"""<!DOCTYPE html>
+<html lang="vi">
+<head>
+<meta charset="utf-8">
+<title>Dataset report</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; color: #222; }}
+table {{ border-collapse: collapse; margin-bottom: 2em; }}
+th, td {{ border: 1px solid #ccc; padding: 4px 10px; text-align: right; }}
+th:first-child, td:first-child {{ text-align: left; }}
+figure {{ display: inline-block; margin: 0 1em 1em 0; }}
+img {{ max-width: 640px; }}
+small {{ color: #777; }}
+</style>
+</head>
+<body>
+<h1>Dataset report</h1>
+<p>Source: <code>{html.escape(source)}</code> &middot; generated {time.strftime("%Y-%m-%d %H:%M:%S")}</p>
+<h2>Splits</h2>
+<table>
+<tr><th>Split</th><th>Images</th><th>Labels</th><th>Objects</th><th>Objects / image</th></tr>
+{chr(10).join(rows)}
+</table>
+<h2>Objects per class</h2>
+<table>
+<tr><th>Class</th>{head}<th>Total</th></tr>
+{chr(10).join(class_rows)}
+</table>
+<h2>Charts</h2>
+{chr(10).join(figures) or "<p>No charts (stats only).</p>"}
+</body>
+</html>
+"""
+    tmp = report_path.with_suffix(report_path.suffix + ".tmp")
+    tmp.write_text(page, encoding="utf-8")
+    os.replace(tmp, report_path)
+    return report_path
+
+
+def build_report(all_stats: dict, class_names: dict, output_dir: Path, report_path: Path = None,
+                 source: str = "", charts: bool = True, jobs: int = 0, force: bool = False):
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    report_path = Path(report_path) if report_path else output_dir / "report.html"
+
+    specs = {}
+    if charts:
+        t0 = time.perf_counter()
+        specs = chart_specs(all_stats, class_names)
+        rendered, reused = render_charts(specs, output_dir, jobs, force)
+        log.info(f"🖼️  Charts: {len(rendered)} rendered, {len(reused)} unchanged "
+                 f"({time.perf_counter() - t0:.2f}s)")
+    write_html(all_stats, class_names, output_dir, report_path, source, specs)
+    log.info(f"✅ Report: {report_path}")
+    return report_path
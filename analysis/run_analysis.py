@@ -1,64 +1,96 @@
 import argparse
 from pathlib import Path
 import os
+import sys
 import glob
 import yaml
 import json
-from stats import analyze_split
-from visualize import (
-    bar_chart_objects_per_class,
-    pie_chart_class_distribution,
-    visualize_split_distribution,
-)
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from analysis.stats import analyze_split
+from logs.log import get_logger
+
+log = get_logger("analysis")
+
+def load_class_names(dataset_root, yaml_path=None):
+    if yaml_path is None:
+        yaml_file = glob.glob(os.path.join(dataset_root, "*.yaml")) or \
+                    glob.glob(os.path.join(dataset_root.parent, "*.yaml"))
+        if not yaml_file:
+            return None
+        yaml_path = yaml_file[0]
+    with open(yaml_path, 'r') as f:
+        data_cfg = yaml.safe_load(f)
+    names = data_cfg['names']
+    # data.yaml dùng dạng {0: orange, ...}; vẫn hỗ trợ dạng list
+    if isinstance(names, dict):
+        return {int(k): v for k, v in names.items()}
+    return {i: name for i, name in enumerate(names)}
+
+def collect_stats(dataset_root, splits, manifest, rescan=False):
+    """Stats per split from the stage manifest (stats.json); only scan splits it does not cover."""
+    from analysis.report import load_stats_manifest, normalize_stats
+
+    all_stats = {}
+    if manifest.exists() and not rescan:
+        cached = load_stats_manifest(manifest)
+        all_stats = {s: cached[s] for s in splits if s in cached}
+        log.info(f"📄 Stats từ manifest {manifest}: {list(all_stats)}")
+
+    for split in splits:
+        if split in all_stats:
+            continue
+        split_dir = dataset_root / ("images" if split == "all" else split)
+        if not split_dir.exists():
+            log.warning(f"Split '{split}' không tồn tại trong {dataset_root}, bỏ qua")
+            continue
+        all_stats[split] = normalize_stats(analyze_split(dataset_root, split))
+    return all_stats
 
 def main():
     parser = argparse.ArgumentParser(description="Analyze dataset splits")
     parser.add_argument("--dataset_dir", type=str, required=True, help="Path to the dataset directory")
     parser.add_argument("--output_file", type=str, default="data/stats/statistics.json", help="Path to output JSON")
+    parser.add_argument("--stats_only", action="store_true", help="Only compute stats JSON, skip charts")
+    parser.add_argument("--splits", type=str, default="train,val,test", help="Các split cần phân tích")
+    parser.add_argument("--yaml", type=str, default=None,
+                        help="File class names (mặc định: *.yaml trong dataset_dir hoặc thư mục cha)")
+    parser.add_argument("--manifest", type=str, default=None,
+                        help="Stats manifest của stage (mặc định: <dataset_dir>/stats.json)")
+    parser.add_argument("--rescan", action="store_true", help="Bỏ qua manifest, quét lại dataset")
+    parser.add_argument("--report", type=str, default=None,
+                        help="File HTML report (mặc định: report.html cạnh output_file)")
+    parser.add_argument("--jobs", type=int, default=0, help="Số process vẽ chart (0 = số CPU)")
+    parser.add_argument("--force", action="store_true", help="Vẽ lại toàn bộ chart")
     args = parser.parse_args()
 
     # Dataset root
     dataset_root = Path(args.dataset_dir)
-    yaml_file = glob.glob(os.path.join(dataset_root, "*.yaml"))
-
-    if not yaml_file:
-        print("YAML file does not exist!")
+    class_names = load_class_names(dataset_root, args.yaml)
+    if class_names is None:
+        log.error("YAML file does not exist!")
         return
-    else:
-        yaml_path = yaml_file[0]
-        with open(yaml_path, 'r') as f:
-            data_cfg = yaml.safe_load(f)
-
-    class_names = {i: name for i, name in enumerate(data_cfg['names'])}
 
     # Output dir (parent of output_file)
     output_file_path = Path(args.output_file)
     output_dir = output_file_path.parent
     os.makedirs(output_dir, exist_ok=True)
 
-    split_image_stats = {}
-    all_stats = {}
-
-    splits = ["all"]
-    for split in splits:
-        stats = analyze_split(dataset_root, split)
-        print(f"\nStats for '{split}':\n", stats)
-
-        # Generate visualizations
-        bar_chart_objects_per_class(split, stats, class_names, output_dir)
-        pie_chart_class_distribution(split, stats, class_names, output_dir)
-
-        split_image_stats[split] = stats["total_images"]
-        all_stats[split] = stats
-
-    # Visualize overall split distribution
-    visualize_split_distribution(split_image_stats, output_dir)
+    manifest = Path(args.manifest) if args.manifest else dataset_root / "stats.json"
+    all_stats = collect_stats(dataset_root, args.splits.split(","), manifest, args.rescan)
+    for split, stats in all_stats.items():
+        log.info(f"Stats for '{split}': {stats}")
 
     # Save stats to JSON
     with open(output_file_path, "w") as f:
         json.dump(all_stats, f, indent=2)
+    log.info(f"✅ Statistics saved to {output_file_path}")
 
-    print(f"\n✅ Statistics saved to {output_file_path}")
+    # Charts (chỉ vẽ lại chart có stats thay đổi) + HTML report
+    from analysis.report import build_report
+    source = manifest if manifest.exists() and not args.rescan else dataset_root
+    build_report(all_stats, class_names, output_dir, args.report, source=str(source),
+                 charts=not args.stats_only, jobs=args.jobs, force=args.force)
 
 if __name__ == "__main__":
     main()
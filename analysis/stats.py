@@ -20,26 +20,34 @@ def analyze_split(dataset_root: Path, split: str):
         image_dir = dataset_root / split / "images"
         label_dir = dataset_root / split / "labels"
 
+    if not image_dir.exists():
+        return None
+
     total_objects = 0
-    total_images = 0
     objects_per_class = defaultdict(int)
+    images_per_class = defaultdict(int)
 
-    image_files = [f for f in os.listdir(image_dir) if f.endswith(('.jpg', '.png'))]
-    total_images = len(image_files)
-
-    label_files = [f for f in os.listdir(label_dir) if f.endswith('.txt')]
-    total_labels = len(label_files)
+    # Đếm trực tiếp trên os.scandir, không dựng list tên file của cả split
+    with os.scandir(image_dir) as it:
+        # Bỏ file ẩn: gồm file tạm .tmp-<pid>-* của stage đang ghi (utils/safe_io.py)
+        total_images = sum(1 for e in it if e.name.endswith(('.jpg', '.png')) and not e.name.startswith('.'))
 
-    for label_f in label_files:
-        label_path = os.path.join(label_dir, label_f)
-        with open(label_path, 'r') as f:
-            lines = f.readlines()
-            for line in lines:
-                parts = line.strip().split()
-                if len(parts) >= 5:
-                    cls_id = int(parts[0])
-                    objects_per_class[cls_id] += 1
-                    total_objects += 1
+    total_labels = 0
+    with os.scandir(label_dir) as it:
+        label_paths = (e.path for e in it if e.name.endswith('.txt') and not e.name.startswith('.'))
+        for label_path in label_paths:
+            total_labels += 1
+            present = set()
+            with open(label_path, 'r') as f:
+                for line in f:
+                    parts = line.strip().split()
+                    if len(parts) >= 5:
+                        cls_id = int(parts[0])
+                        objects_per_class[cls_id] += 1
+                        total_objects += 1
+                        present.add(cls_id)
+            for cls_id in present:
+                images_per_class[cls_id] += 1
 
     return {
         'total_images': total_images,
@@ -47,4 +55,5 @@ def analyze_split(dataset_root: Path, split: str):
         'total_objects': total_objects,
         'avg_objets_per_image': round(total_objects / total_images, 2) if total_images > 0 else 0,
         'objets_per_class': dict(objects_per_class),
+        'images_per_class': dict(images_per_class),
     }
\ No newline at end of file
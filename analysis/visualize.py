@@ -1,61 +1,92 @@
 import os
-import matplotlib.pyplot as plt
-
-def bar_chart_objects_per_class(split, stats, class_names, output_dir):
-    class_counts = stats['objets_per_class']
-    class_labels = [class_names.get(k, f"class_{k}") for k in class_counts]
-    class_values = list(class_counts.values())
-
-    plt.figure(figsize=(10, 5))
-    bars = plt.bar(class_labels, class_values, color='#556B2F')
-    plt.title(f"Object Distribution per Class - {split}")
-    plt.xlabel("Class")
-    plt.ylabel("Number of Objects")
-    plt.xticks(rotation=45)
-
-    for bar in bars:
-        height = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width() / 2., height, '%d' % int(height), ha='center', va='bottom')
-
-    plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, f"{split}_objects_per_class.png"))
-    plt.close()
-
-def pie_chart_class_distribution(split, stats, class_names, output_dir):
-    objects_per_class = stats['objets_per_class']
-    total_objects = stats['total_objects']
-    labels = [class_names[cls_id] for cls_id in objects_per_class]
-    sizes = [count / total_objects * 100 for count in objects_per_class.values()]
-    cmap = plt.get_cmap('GnBu', len(labels))
-    colors = [cmap(i) for i in range(len(labels))]
-
-    plt.figure(figsize=(8, 8))
-    plt.pie(sizes, labels=labels, colors=colors, autopct='%1.1f%%',
-            startangle=140, textprops={'fontsize': 12})
-    plt.axis('equal')
-    plt.title(f'Phân bố đối tượng theo class - {split.upper()}', fontsize=14)
-    plt.savefig(os.path.join(output_dir, f"{split}_class_distribution.png"))
-    plt.close()
-
-def visualize_split_distribution(split_image_stats, output_dir):
-    train_imgs = split_image_stats.get('train', 0)
-    val_imgs = split_image_stats.get('val', 0)
-    test_imgs = split_image_stats.get('test', 0)
-    total_imgs = train_imgs + val_imgs + test_imgs
-
-    values = [train_imgs, val_imgs, test_imgs]
-    colors = ["#B4591CB0", "#25612FD8", "#1D4E759E"]
-
-    plt.figure(figsize=(10, 2))
-    plt.barh(['Dataset'], train_imgs, color=colors[0], label=f"Train ({train_imgs})")
-    plt.barh(['Dataset'], val_imgs, left=train_imgs, color=colors[1], label=f"Val ({val_imgs})")
-    plt.barh(['Dataset'], test_imgs, left=train_imgs + val_imgs, color=colors[2], label=f"Test ({test_imgs})")
-
-    plt.text(total_imgs + 50, 0, f"Total: {total_imgs}", va='center', fontsize=12, fontweight='bold')
-    plt.xlabel("Số lượng ảnh")
-    plt.title("Phân bố tổng số ảnh theo từng tập dữ liệu")
-    plt.legend(loc='upper left', bbox_to_anchor=(1.0, 1.0))
-    plt.grid(axis='x', linestyle='--', alpha=0.4)
-    plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, "horizontal_bar_dataset_distribution.png"))
-    plt.close()
\ No newline at end of file
+
+import numpy as np
+
+# Chart được vẽ bằng Figure + canvas Agg (không qua pyplot state), nên an toàn khi
+# render song song ở nhiều process và không cần display.
+SPLIT_COLORS = {"train": "#B4591CB0", "val": "#25612FD8", "test": "#1D4E759E"}
+
+
+def _figure(figsize):
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize)
+    return fig, fig.add_subplot()
+
+
+def _class_arrays(stats, class_names):
+    counts = stats['objets_per_class']
+    ids = np.array(sorted(int(k) for k in counts), dtype=int)
+    values = np.array([counts.get(i, counts.get(str(i), 0)) for i in ids], dtype=np.int64)
+    labels = [class_names.get(i, f"class_{i}") for i in ids]
+    return labels, values
+
+
+def bar_chart_objects_per_class(split, stats, class_names, output_dir, out_path=None):
+    labels, values = _class_arrays(stats, class_names)
+    out_path = out_path or os.path.join(output_dir, f"{split}_objects_per_class.png")
+
+    fig, ax = _figure((10, 5))
+    bars = ax.bar(labels, values, color='#556B2F')
+    ax.bar_label(bars, fmt='%d')
+    ax.set_title(f"Object Distribution per Class - {split}")
+    ax.set_xlabel("Class")
+    ax.set_ylabel("Number of Objects")
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    fig.savefig(out_path)
+    return out_path
+
+
+def pie_chart_class_distribution(split, stats, class_names, output_dir, out_path=None):
+    labels, values = _class_arrays(stats, class_names)
+    out_path = out_path or os.path.join(output_dir, f"{split}_class_distribution.png")
+    from matplotlib import colormaps
+
+    fig, ax = _figure((8, 8))
+    if values.sum() > 0:
+        colors = colormaps['GnBu'](np.linspace(0, 1, len(labels)))
+        ax.pie(values / values.sum() * 100, labels=labels, colors=colors, autopct='%1.1f%%',
+               startangle=140, textprops={'fontsize': 12})
+    else:
+        ax.text(0.5, 0.5, "No objects", ha='center', va='center', fontsize=14)
+    ax.axis('equal')
+    ax.set_title(f'Phân bố đối tượng theo class - {split.upper()}', fontsize=14)
+    fig.savefig(out_path)
+    return out_path
+
+
+def visualize_split_distribution(split_image_stats, output_dir, out_path=None):
+    out_path = out_path or os.path.join(output_dir, "horizontal_bar_dataset_distribution.png")
+    splits = [s for s in ("train", "val", "test") if s in split_image_stats] or list(split_image_stats)
+    values = np.array([split_image_stats[s] for s in splits], dtype=np.int64)
+    lefts = np.concatenate([[0], np.cumsum(values)[:-1]])
+    total_imgs = int(values.sum())
+
+    fig, ax = _figure((10, 2))
+    for split, value, left in zip(splits, values, lefts):
+        ax.barh(['Dataset'], value, left=left, color=SPLIT_COLORS.get(split, "#777777"),
+                label=f"{split.capitalize()} ({value})")
+
+    ax.text(total_imgs * 1.01 + 1, 0, f"Total: {total_imgs}", va='center', fontsize=12, fontweight='bold')
+    ax.set_xlabel("Số lượng ảnh")
+    ax.set_title("Phân bố tổng số ảnh theo từng tập dữ liệu")
+    ax.legend(loc='upper left', bbox_to_anchor=(1.0, 1.0))
+    ax.grid(axis='x', linestyle='--', alpha=0.4)
+    fig.tight_layout()
+    fig.savefig(out_path)
+    return out_path
+
+
+# kind -> hàm vẽ, dùng bởi analysis/report.py (render_chart chạy trong worker process)
+CHARTS = {
+    "objects_per_class": lambda spec, path: bar_chart_objects_per_class(
+        spec["split"], spec["stats"], spec["class_names"], None, path),
+    "class_distribution": lambda spec, path: pie_chart_class_distribution(
+        spec["split"], spec["stats"], spec["class_names"], None, path),
+    "split_distribution": lambda spec, path: visualize_split_distribution(
+        spec["split_images"], None, path),
+}
+
+
+def render_chart(spec, out_path):
+    return CHARTS[spec["kind"]](spec, out_path)
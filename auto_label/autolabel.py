@@ -1,15 +1,24 @@
-from ultralytics import YOLO
 from pathlib import Path
-import cv2
+import logging
 import argparse
 import yaml
 import random
-import shutil
 import json
+import hashlib
+import itertools
 import sys
 import os
+import time
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from analysis.stats import analyze_split
+from logs.log import ProgressLogger, get_logger
+from auto_label.backends import BACKENDS, DEFAULT_IOU, load_backend
+from auto_label.boxes import to_yolo_lines
+from auto_label.tiling import TileConfig, sliced_predict
+from utils.memory import iter_images
+from utils.safe_io import RunJournal, atomic_copy, atomic_write, clean_temp_files
+
+log = get_logger("autolabel")
 
 def load_class_mapping(yaml_path: Path) -> dict:
     with open(yaml_path, "r") as f:
@@ -17,83 +26,202 @@ def load_class_mapping(yaml_path: Path) -> dict:
     return {v: int(k) for k, v in data["names"].items()}
 
 
-def auto_label(input_dir: Path, output_label_dir: Path, class_yaml: Path,
-               model_path: str = "yolov8x.pt", conf_thresh: float = 0.4):
+def first_pass_accepts(dets, names, class_name_to_idx, accept_conf: float) -> bool:
+    """
+    Small-model result is good enough: at least one target-class box, and all
+    of them confident. An empty result always goes to the main model, so an
+    image is never removed on the first pass alone.
+    """
+    target = [i for i, c in enumerate(dets.cls) if names.get(int(c)) in class_name_to_idx]
+    return bool(target) and all(dets.conf[i] >= accept_conf for i in target)
+
+
+def detect(detector, im, tile_cfg: TileConfig = None):
+    if tile_cfg is None:
+        return detector.predict([im])[0]
+    return sliced_predict(detector, im, tile_cfg)
 
-    model = YOLO(model_path)
-    model.conf = conf_thresh
-    output_label_dir.mkdir(parents=True, exist_ok=True)
 
+def auto_label(input_dir: Path, output_label_dir: Path, class_yaml: Path,
+               model_path: str = "yolov8x.pt", conf_thresh: float = 0.4,
+               backend: str = "torch", int8: bool = False, imgsz: int = 640,
+               first_pass_model: str = None, first_pass_accept: float = 0.7,
+               tile_cfg: TileConfig = None, ensemble_views=None, ensemble_models=None,
+               min_agreement: float = 0.0, agreement_dir: Path = None, image_files=None,
+               journal: RunJournal = None, iou: float = DEFAULT_IOU):
+
+    if tile_cfg is not None and (ensemble_views or ensemble_models):
+        raise ValueError("Tiling chưa hỗ trợ ensemble mode: dùng --tile hoặc --ensemble_*, không dùng cả hai")
     class_name_to_idx = load_class_mapping(class_yaml)
 
-    image_files = list(input_dir.glob("*.[jp][pn]g"))
-    print(f"[INFO] Found {len(image_files)} images in {input_dir}")
+    # image_files: micro-batch từ streaming mode (auto_label/stream.py), mặc định quét
+    # input_dir bằng generator (os.scandir) thay vì dựng list toàn bộ đường dẫn
+    if image_files is None:
+        image_files = iter_images(input_dir)
+
+    # ✅ Bỏ qua ảnh đã label trước đó; không có ảnh mới thì không cần load model.
+    # Label được ghi atomic nên file .txt tồn tại nghĩa là đã label xong.
+    skipped = 0
+
+    def unlabeled():
+        nonlocal skipped
+        for p in image_files:
+            if (output_label_dir / (p.stem + ".txt")).exists():
+                skipped += 1
+            else:
+                yield p
+
+    todo = unlabeled()
+    first = next(todo, None)
+    if first is None:
+        if skipped:
+            log.info(f"Đã label: {skipped} images, skipping")
+        return []
+    todo = itertools.chain([first], todo)
+
+    import cv2
+    from auto_label.ensemble import EnsembleLabeler, agreement_lines
+
+    # Ensemble mode: several views and/or models fused with WBF, per-view results cached
+    ensemble = None
+    detector = first_pass = None
+    if ensemble_views or ensemble_models:
+        ensemble = EnsembleLabeler(ensemble_models or [model_path], ensemble_views or ["orig"],
+                                   class_name_to_idx, conf=conf_thresh, imgsz=imgsz,
+                                   backend=backend, int8=int8, min_agreement=min_agreement)
+        agreement_dir = agreement_dir or output_label_dir.parent / "agreement"
+        agreement_dir.mkdir(parents=True, exist_ok=True)
+    else:
+        detector = load_backend(backend, model_path, conf=conf_thresh, iou=iou, imgsz=imgsz, int8=int8)
+        # Optional cheap first pass: only escalate to the main model when the small one is unsure
+        if first_pass_model:
+            first_pass = load_backend(backend, first_pass_model, conf=conf_thresh, iou=iou,
+                                      imgsz=imgsz, int8=int8)
+    output_label_dir.mkdir(parents=True, exist_ok=True)
 
     new_labeled_files = []
+    escalated = 0
+    progress = ProgressLogger("autolabel")
 
-    for img_path in image_files:
+    for img_path in todo:
         label_path = output_label_dir / (img_path.stem + ".txt")
+        t0 = time.perf_counter()
 
-        # ✅ Bỏ qua nếu đã label trước đó
-        if label_path.exists():
-            print(f"[SKIP] Đã label: {img_path.name}")
-            continue
-
-        results = model(img_path)
         im = cv2.imread(str(img_path))
         if im is None:
-            print(f"[WARNING] Cannot read image {img_path}, skipping.")
+            progress.item(img_path.name, "unreadable", msg=f"Cannot read image {img_path}, skipping.",
+                          level=logging.WARNING)
             continue
 
         h, w = im.shape[:2]
-        detections = results[0].boxes
+        model = detector
+        if ensemble is not None:
+            detections, agreement, n_raw = ensemble.predict(img_path, im)
+            if n_raw == 0:
+                progress.item(img_path.name, "removed", time.perf_counter() - t0,
+                              msg=f"No detections in {img_path.name} => removed")
+                img_path.unlink()
+                if journal is not None:
+                    journal.record(img_path.stem, "removed", image=str(img_path))
+                continue
+            with atomic_write(agreement_dir / (img_path.stem + ".txt")) as f:
+                f.writelines(agreement_lines(detections, agreement, w, h))
+            with atomic_write(label_path) as f:
+                f.writelines(to_yolo_lines(detections, ensemble.names, class_name_to_idx, w, h))
+            if journal is not None:
+                journal.record(img_path.stem, "labeled", image=str(img_path))
+            new_labeled_files.append(img_path)
+            progress.item(img_path.name, "labeled", time.perf_counter() - t0)
+            continue
+        elif first_pass is not None:
+            detections = detect(first_pass, im, tile_cfg)
+            if first_pass_accepts(detections, first_pass.names, class_name_to_idx, first_pass_accept):
+                model = first_pass
+            else:
+                escalated += 1
+                detections = detect(detector, im, tile_cfg)
+        else:
+            detections = detect(detector, im, tile_cfg)
 
         if len(detections) == 0:
-            print(f"[INFO] No detections in {img_path.name} => removed")
+            progress.item(img_path.name, "removed", time.perf_counter() - t0,
+                          msg=f"No detections in {img_path.name} => removed")
             img_path.unlink()  # ⚠️ Xóa ảnh gốc nếu không có detection
+            if journal is not None:
+                journal.record(img_path.stem, "removed", image=str(img_path))
             continue
 
-        with open(label_path, "w") as f:
-            for i in range(len(detections)):
-                box = detections.xyxy[i]
-                cls_idx = int(detections.cls[i].item())
-                try:
-                    class_name = model.model.names[cls_idx]
-                except (AttributeError, IndexError):
-                    continue
-
-                if class_name not in class_name_to_idx:
-                    continue
-
-                mapped_cls = class_name_to_idx[class_name]
-                xmin, ymin, xmax, ymax = box
-                x_center = ((xmin + xmax) / 2) / w
-                y_center = ((ymin + ymax) / 2) / h
-                bw = (xmax - xmin) / w
-                bh = (ymax - ymin) / h
-                f.write(f"{mapped_cls} {x_center:.6f} {y_center:.6f} {bw:.6f} {bh:.6f}\n")
+        lines = to_yolo_lines(detections, model.names, class_name_to_idx, w, h)
+        with atomic_write(label_path) as f:
+            f.writelines(lines)
+        if journal is not None:
+            journal.record(img_path.stem, "labeled", image=str(img_path))
 
         new_labeled_files.append(img_path)
+        progress.item(img_path.name, "labeled", time.perf_counter() - t0)
+
+    progress.close()
+    if skipped:
+        log.info(f"Đã label: {skipped} images, skipping")
+    if ensemble is not None:
+        log.info(f"Ensemble: {ensemble.computed} view predictions computed, "
+                 f"{ensemble.reused} reused from cache")
+    if first_pass is not None:
+        log.info(f"First pass ({first_pass_model}) escalated {escalated} images to {model_path}")
 
     return new_labeled_files
 
 
-def split_dataset(image_paths, label_dir: Path, output_base: Path,
-                  train_ratio=0.7, val_ratio=0.2, test_ratio=0.1):
-    if not image_paths:
-        print("[INFO] Không có ảnh mới cần chia tập.")
-        return
+def hash_split(name: str, train_ratio=0.7, val_ratio=0.2) -> str:
+    """Split chosen from a hash of the file name: stable, and keeps the ratios for tiny batches."""
+    u = int(hashlib.md5(name.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+    if u < train_ratio:
+        return "train"
+    return "val" if u < train_ratio + val_ratio else "test"
 
-    random.shuffle(image_paths)
-    total = len(image_paths)
-    train_end = int(total * train_ratio)
-    val_end = train_end + int(total * val_ratio)
 
-    splits = {
-        "train": image_paths[:train_end],
-        "val": image_paths[train_end:val_end],
-        "test": image_paths[val_end:]
-    }
+def split_dataset(image_paths, label_dir: Path, output_base: Path,
+                  train_ratio=0.7, val_ratio=0.2, test_ratio=0.1, by_hash=False,
+                  journal: RunJournal = None):
+    """
+    Copy images + labels into split folders. Returns {split: [image paths]}.
+
+    Two phases: every image's split is journaled first, then label and image
+    are copied (label first, each atomically) and the image is journaled as
+    done. A resumed run reuses the journaled split, and an image never shows
+    up in a split without its label.
+    """
+    if not image_paths:
+        log.info("Không có ảnh mới cần chia tập.")
+        return {}
+
+    splits = {"train": [], "val": [], "test": []}
+    if journal is not None:
+        planned = [p for p in image_paths if journal.state(p.stem) == "assigned"]
+        for img_path in planned:
+            splits[journal.last(img_path.stem)["split"]].append(img_path)
+        image_paths = [p for p in image_paths if journal.state(p.stem) != "assigned"]
+
+    if by_hash:
+        # Streaming micro-batch có thể chỉ vài ảnh: cắt theo tỉ lệ sẽ dồn hết vào test
+        for img_path in image_paths:
+            splits[hash_split(img_path.stem, train_ratio, val_ratio)].append(img_path)
+    else:
+        image_paths = list(image_paths)
+        random.shuffle(image_paths)
+        total = len(image_paths)
+        train_end = int(total * train_ratio)
+        val_end = train_end + int(total * val_ratio)
+
+        splits["train"] += image_paths[:train_end]
+        splits["val"] += image_paths[train_end:val_end]
+        splits["test"] += image_paths[val_end:]
+
+    if journal is not None:
+        for split, files in splits.items():
+            for img_path in files:
+                if journal.state(img_path.stem) != "assigned":
+                    journal.record(img_path.stem, "assigned", image=str(img_path), split=split)
 
     for split, files in splits.items():
         img_out = output_base / split / "images"
@@ -107,36 +235,118 @@ def split_dataset(image_paths, label_dir: Path, output_base: Path,
 
             # ✅ Bỏ qua nếu đã tồn tại
             if target_img_path.exists() and target_lbl_path.exists():
-                print(f"[!] Bỏ qua (đã tồn tại): {img_path.name}")
-                continue
-
-            shutil.copy(img_path, target_img_path)
+                log.debug(f"Bỏ qua (đã tồn tại): {img_path.name}")
+            else:
+                lbl_path = label_dir / (img_path.stem + ".txt")
+                if not lbl_path.exists():
+                    log.warning(f"Thiếu label cho {img_path.name}, không đưa vào {split}")
+                    continue
+                # Label trước, ảnh sau: ảnh xuất hiện trong split thì label đã có
+                atomic_copy(lbl_path, target_lbl_path)
+                atomic_copy(img_path, target_img_path)
+            if journal is not None:
+                journal.record(img_path.stem, "split", split=split)
 
-            lbl_path = label_dir / (img_path.stem + ".txt")
-            if lbl_path.exists():
-                shutil.copy(lbl_path, target_lbl_path)
+        log.info(f"{split}: {len(files)} images")
 
-        print(f"[✓] {split}: {len(files)} images")
+    return splits
 
 
-def main():
+def build_parser():
     parser = argparse.ArgumentParser(description="Auto-label images and split dataset")
     parser.add_argument("--input_dir", type=str, default="data/raw/images", help="Folder chứa ảnh input")
     parser.add_argument("--output_dir", type=str, default="data/labeled", help="Folder output chứa labels và splits")
     parser.add_argument("--yaml", type=str, default="data/data.yaml", help="Đường dẫn tới file data.yaml")
     parser.add_argument("--model", type=str, default="yolov8x.pt", help="Đường dẫn tới model YOLOv8")
     parser.add_argument("--conf", type=float, default=0.4, help="Confidence threshold")
-    args = parser.parse_args()
-
+    parser.add_argument("--iou", type=float, default=DEFAULT_IOU,
+                        help="NMS IoU threshold của detector (mặc định 0.7 như ultralytics)")
+    parser.add_argument("--backend", type=str, choices=BACKENDS, default="torch",
+                        help="Detector backend: torch, onnx (onnxruntime) hoặc cv2 (OpenCV DNN)")
+    parser.add_argument("--int8", action="store_true", help="Dùng ONNX export đã quantize INT8")
+    parser.add_argument("--imgsz", type=int, default=640, help="Inference size")
+    parser.add_argument("--first_pass_model", type=str, default=None,
+                        help="Model nhỏ chạy trước (vd: yolov8n.pt), chỉ gọi --model khi không chắc chắn")
+    parser.add_argument("--first_pass_accept", type=float, default=0.7,
+                        help="Min confidence để chấp nhận kết quả của first pass")
+    parser.add_argument("--tile", action="store_true", help="Bật sliced inference cho ảnh lớn (không dùng cùng ensemble mode)")
+    parser.add_argument("--tile_size", type=int, default=640, help="Kích thước tile (px)")
+    parser.add_argument("--tile_overlap", type=float, default=0.2, help="Tỉ lệ overlap giữa các tile")
+    parser.add_argument("--tile_min_side", type=int, default=1280,
+                        help="Chỉ tile ảnh có cạnh dài >= giá trị này")
+    parser.add_argument("--tile_batch", type=int, default=8, help="Số tile mỗi lần forward")
+    parser.add_argument("--tile_merge", type=str, choices=["nms", "wbf"], default="nms",
+                        help="Cách gộp box từ các tile")
+    parser.add_argument("--ensemble_views", type=str, default=None,
+                        help="TTA views, vd: orig,hflip,s0.75,s1.25 (bật ensemble mode)")
+    parser.add_argument("--ensemble_models", type=str, default=None,
+                        help="Danh sách model cho ensemble, vd: yolov8x.pt,yolov8l.pt")
+    parser.add_argument("--min_agreement", type=float, default=0.0,
+                        help="Bỏ box có tỉ lệ đồng thuận giữa các view/model thấp hơn giá trị này")
+    parser.add_argument("--watch", action="store_true",
+                        help="Service mode: theo dõi --input_dir và label ảnh mới liên tục (Ctrl+C để dừng)")
+    parser.add_argument("--feed", type=str, default=None,
+                        help="Service mode: tail ingest manifest (mỗi dòng một đường dẫn ảnh)")
+    parser.add_argument("--batch_size", type=int, default=16, help="Số ảnh tối đa mỗi micro-batch")
+    parser.add_argument("--batch_window", type=float, default=5.0,
+                        help="Thời gian chờ tối đa (s) để gom một micro-batch")
+    parser.add_argument("--max_pending", type=int, default=256,
+                        help="Số ảnh tối đa trong hàng đợi (back-pressure)")
+    parser.add_argument("--poll_interval", type=float, default=2.0, help="Chu kỳ polling (s)")
+    parser.add_argument("--no_inotify", action="store_true", help="Dùng polling thay vì inotify")
+    parser.add_argument("--worker", action="store_true",
+                        help="Gửi job tới warm worker (utils/warm_worker.py) nếu đang chạy")
+    return parser
+
+
+def run(args):
     input_dir = Path(args.input_dir)
     output_dir = Path(args.output_dir)
     label_dir = output_dir / "labels"
 
+    # Lần chạy trước bị ngắt: dọn file tạm, lấy lại ảnh đã label nhưng chưa chia tập
+    journal = RunJournal(output_dir / ".journal" / "autolabel.jsonl", "autolabel")
+    for d in [label_dir] + [output_dir / s / k for s in ("train", "val", "test") for k in ("images", "labels")]:
+        clean_temp_files(d)
+    unsplit = [Path(journal.last(k)["image"]) for k in journal.keys("labeled") + journal.keys("assigned")]
+    unsplit = [p for p in unsplit if p.exists()]
+
+    tile_cfg = None
+    if args.tile:
+        tile_cfg = TileConfig(args.tile_size, args.tile_overlap, args.tile_min_side,
+                              args.tile_batch, args.tile_merge)
+
+    def label(image_files=None):
+        return auto_label(input_dir, label_dir, Path(args.yaml), args.model, args.conf,
+                          backend=args.backend, int8=args.int8, imgsz=args.imgsz,
+                          first_pass_model=args.first_pass_model,
+                          first_pass_accept=args.first_pass_accept, tile_cfg=tile_cfg,
+                          ensemble_views=args.ensemble_views.split(",") if args.ensemble_views else None,
+                          ensemble_models=args.ensemble_models.split(",") if args.ensemble_models else None,
+                          min_agreement=args.min_agreement, image_files=image_files, journal=journal,
+                          iou=args.iou)
+
+    # Service mode: micro-batch ảnh mới từ watcher / manifest, stats.json cập nhật tăng dần
+    if args.watch or args.feed:
+        from auto_label.stream import DirectoryWatcher, ManifestTailer, run_stream
+        if args.feed:
+            source = ManifestTailer(Path(args.feed), poll_interval=args.poll_interval)
+        else:
+            source = DirectoryWatcher(input_dir, args.poll_interval, use_inotify=not args.no_inotify)
+        run_stream(source, label, output_dir, label_dir, batch_size=args.batch_size,
+                   batch_window=args.batch_window, max_pending=args.max_pending,
+                   journal=journal, backlog=unsplit)
+        journal.finish()
+        return
+
     # Step 1: Chỉ label ảnh mới
-    new_labeled_imgs = auto_label(input_dir, label_dir, Path(args.yaml), args.model, args.conf)
+    new_labeled_imgs = label()
+    if unsplit:
+        log.info(f"♻️  {len(unsplit)} ảnh đã label ở lần chạy trước nhưng chưa chia tập")
+        new_labeled_imgs = list(dict.fromkeys(unsplit + new_labeled_imgs))
 
     # Step 2: Chỉ chia tập ảnh vừa mới label
-    split_dataset(new_labeled_imgs, label_dir, output_dir)
+    split_dataset(new_labeled_imgs, label_dir, output_dir, journal=journal)
 
     # Optional: Xoá label tạm nếu cần
     # if label_dir.exists():
@@ -147,16 +357,27 @@ def main():
     for split in ["train", "val", "test"]:
         stats = analyze_split(output_dir, split)
         if stats:
-            print(f"\n📊 Stats for {split.upper()}:")
-            for k, v in stats.items():
-                print(f"  {k}: {v}")
+            log.info(f"📊 Stats for {split.upper()}: {stats}")
             all_stats[split] = stats
 
     # Lưu thống kê ra file JSON trong thư mục output_dir/stats.json
     stats_json_path = output_dir / "stats.json"
-    with open(stats_json_path, "w") as f:
+    with atomic_write(stats_json_path) as f:
         json.dump(all_stats, f, indent=2)
-    print(f"\n✅ Đã lưu thống kê vào file: {stats_json_path}")
+    log.info(f"✅ Đã lưu thống kê vào file: {stats_json_path}")
+    journal.finish()
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.tile and (args.ensemble_views or args.ensemble_models):
+        parser.error("--tile không dùng được cùng --ensemble_views / --ensemble_models")
+    if args.worker:
+        from utils.warm_worker import submit_job
+        if submit_job("autolabel", sys.argv[1:]):
+            return
+    run(args)
 
 
 if __name__ == "__main__":
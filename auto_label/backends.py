@@ -0,0 +1,261 @@
+"""
+backends.py
+--------------------------------------------------------------------
+Pluggable detector backends for auto-labeling.
+
+- `torch` : ultralytics YOLO through PyTorch (original behaviour)
+- `onnx`  : the same weights exported once to ONNX (optionally INT8 dynamic
+            quantized) and run with onnxruntime on CPU
+- `cv2`   : the exported ONNX model run with OpenCV DNN (no onnxruntime needed)
+
+Exports are cached in `cache_dir` under the md5 of the weights file, so the
+export cost is only paid once per weights version.
+
+NMS IoU defaults to 0.7 (ultralytics' own default, which autolabel used before
+backends existed) for every backend; `autolabel.py --iou` overrides it.
+"""
+
+import ast
+import hashlib
+import json
+import shutil
+import sys
+import os
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from auto_label.boxes import Detections, nms
+from logs.log import get_logger
+
+log = get_logger("autolabel")
+
+# ultralytics predict() default
+DEFAULT_IOU = 0.7
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / ".export_cache"
+BACKENDS = ("torch", "onnx", "cv2")
+
+# Loaded detectors, keyed by their settings. A one-shot CLI run loads each model once
+# anyway; the warm worker (utils/warm_worker.py) reuses them across jobs.
+_LOADED = {}
+
+
+def file_md5(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _resolve_weights(model_path: str) -> Path:
+    """Local weights path; lets ultralytics download known names like `yolov8n.pt`."""
+    path = Path(model_path)
+    if path.exists():
+        return path
+    from ultralytics import YOLO
+    model = YOLO(model_path)
+    return Path(model.ckpt_path)
+
+
+def export_onnx(model_path: str, imgsz: int = 640, int8: bool = False,
+                cache_dir: Path = DEFAULT_CACHE_DIR) -> Path:
+    """Export `model_path` to ONNX once and return the cached file path."""
+    weights = _resolve_weights(model_path)
+    digest = file_md5(weights)
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    suffix = "_int8" if int8 else ""
+    onnx_path = cache_dir / f"{weights.stem}_{digest[:12]}_{imgsz}{suffix}.onnx"
+    names_path = onnx_path.with_suffix(".names.json")
+    if onnx_path.exists() and names_path.exists():
+        return onnx_path
+
+    fp32_path = cache_dir / f"{weights.stem}_{digest[:12]}_{imgsz}.onnx"
+    if not fp32_path.exists():
+        from ultralytics import YOLO
+        log.info(f"Exporting {weights} to ONNX (imgsz={imgsz}) ...")
+        model = YOLO(str(weights))
+        exported = Path(model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True))
+        shutil.move(str(exported), str(fp32_path))
+        with open(fp32_path.with_suffix(".names.json"), "w") as f:
+            json.dump({str(k): v for k, v in model.names.items()}, f)
+
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        log.info(f"Quantizing {fp32_path.name} to INT8 ...")
+        quantize_dynamic(str(fp32_path), str(onnx_path), weight_type=QuantType.QUInt8)
+        shutil.copy(fp32_path.with_suffix(".names.json"), names_path)
+
+    log.info(f"Cached ONNX export: {onnx_path}")
+    return onnx_path
+
+
+def letterbox(img: np.ndarray, size: int = 640, color=(114, 114, 114)):
+    """Resize keeping aspect ratio and pad to `size` x `size`. Returns image, ratio, (pad_x, pad_y)."""
+    import cv2
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    new_w, new_h = int(round(w * r)), int(round(h * r))
+    if (new_w, new_h) != (w, h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return img, r, (left, top)
+
+
+def _read(source):
+    if isinstance(source, np.ndarray):
+        return source
+    import cv2
+    img = cv2.imread(str(source))
+    if img is None:
+        raise FileNotFoundError(f"Cannot load image {source}")
+    return img
+
+
+class TorchBackend:
+    name = "torch"
+
+    def __init__(self, model_path: str = "yolov8x.pt", conf: float = 0.4, iou: float = DEFAULT_IOU,
+                 imgsz: int = 640, device=None):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.conf = conf
+        self.iou = iou
+        self.imgsz = imgsz
+        self.device = device
+        self.names = {int(k): v for k, v in self.model.names.items()}
+
+    def predict(self, sources, augment: bool = False):
+        """Run on a list of paths or BGR arrays; returns one `Detections` per source."""
+        results = self.model(list(sources), conf=self.conf, iou=self.iou, imgsz=self.imgsz,
+                             augment=augment, device=self.device, verbose=False)
+        out = []
+        for res in results:
+            boxes = res.boxes
+            out.append(Detections(boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(),
+                                  boxes.cls.cpu().numpy()))
+        return out
+
+
+class OnnxBackend:
+    """YOLOv8 ONNX model with numpy pre/post-processing; runtime is onnxruntime or OpenCV DNN."""
+
+    def __init__(self, onnx_path: Path, conf: float = 0.4, iou: float = DEFAULT_IOU, imgsz: int = 640,
+                 runtime: str = "onnx", threads: int = 0):
+        self.onnx_path = Path(onnx_path)
+        self.conf = conf
+        self.iou = iou
+        self.imgsz = imgsz
+        self.runtime = runtime
+        self.name = runtime
+
+        if runtime == "onnx":
+            import onnxruntime as ort
+            opts = ort.SessionOptions()
+            if threads:
+                opts.intra_op_num_threads = threads
+            self.session = ort.InferenceSession(str(self.onnx_path), sess_options=opts,
+                                                providers=["CPUExecutionProvider"])
+            self.input_name = self.session.get_inputs()[0].name
+        else:
+            import cv2
+            self.net = cv2.dnn.readNetFromONNX(str(self.onnx_path))
+            self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.names = self._load_names()
+
+    def _load_names(self):
+        names_path = self.onnx_path.with_suffix(".names.json")
+        if names_path.exists():
+            with open(names_path, "r") as f:
+                return {int(k): v for k, v in json.load(f).items()}
+        if self.runtime == "onnx":
+            meta = self.session.get_modelmeta().custom_metadata_map
+            if "names" in meta:
+                return {int(k): v for k, v in ast.literal_eval(meta["names"]).items()}
+        raise FileNotFoundError(f"No class names found for {self.onnx_path}")
+
+    def _forward(self, batch: np.ndarray) -> np.ndarray:
+        if self.runtime == "onnx":
+            return self.session.run(None, {self.input_name: batch})[0]
+        if len(batch) == 1:
+            self.net.setInput(batch)
+            return self.net.forward()
+        # OpenCV DNN handles dynamic batch poorly, run images one by one
+        outs = []
+        for i in range(len(batch)):
+            self.net.setInput(batch[i:i + 1])
+            outs.append(self.net.forward())
+        return np.concatenate(outs, axis=0)
+
+    def predict(self, sources, augment: bool = False):
+        import cv2
+        images = [_read(s) for s in sources]
+        if not images:
+            return []
+
+        blobs, metas = [], []
+        for img in images:
+            boxed, r, pad = letterbox(img, self.imgsz)
+            blobs.append(cv2.cvtColor(boxed, cv2.COLOR_BGR2RGB).transpose(2, 0, 1))
+            metas.append((r, pad, img.shape[:2]))
+        batch = np.ascontiguousarray(np.stack(blobs), dtype=np.float32) / 255.0
+
+        preds = self._forward(batch)  # (B, 4 + nc, A)
+        return [self._decode(p, *m) for p, m in zip(preds, metas)]
+
+    def _decode(self, pred: np.ndarray, r: float, pad, shape) -> Detections:
+        pred = pred.T  # (A, 4 + nc)
+        scores = pred[:, 4:]
+        cls = scores.argmax(axis=1)
+        conf = scores[np.arange(len(scores)), cls]
+        mask = conf >= self.conf
+        if not mask.any():
+            return Detections()
+        boxes, conf, cls = pred[mask, :4], conf[mask], cls[mask]
+
+        xyxy = np.empty_like(boxes)
+        xyxy[:, 0] = boxes[:, 0] - boxes[:, 2] / 2
+        xyxy[:, 1] = boxes[:, 1] - boxes[:, 3] / 2
+        xyxy[:, 2] = boxes[:, 0] + boxes[:, 2] / 2
+        xyxy[:, 3] = boxes[:, 1] + boxes[:, 3] / 2
+        xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] - pad[0]) / r
+        xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] - pad[1]) / r
+        h, w = shape
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+
+        keep = nms(xyxy, conf, cls, self.iou)
+        return Detections(xyxy[keep], conf[keep], cls[keep])
+
+
+def load_backend(kind: str = "torch", model_path: str = "yolov8x.pt", conf: float = 0.4,
+                 iou: float = DEFAULT_IOU, imgsz: int = 640, int8: bool = False,
+                 cache_dir: Path = DEFAULT_CACHE_DIR, threads: int = 0):
+    """
+    Build (or reuse) a detector backend. An `.onnx` model_path is used directly
+    without export.
+    """
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown backend '{kind}', expected one of {BACKENDS}")
+    key = (kind, str(model_path), conf, iou, imgsz, int8, str(cache_dir), threads)
+    if key in _LOADED:
+        return _LOADED[key]
+
+    if kind == "torch":
+        backend = TorchBackend(model_path, conf=conf, iou=iou, imgsz=imgsz)
+    else:
+        if str(model_path).endswith(".onnx"):
+            onnx_path = Path(model_path)
+        else:
+            onnx_path = export_onnx(model_path, imgsz=imgsz, int8=int8, cache_dir=cache_dir)
+        backend = OnnxBackend(onnx_path, conf=conf, iou=iou, imgsz=imgsz, runtime=kind, threads=threads)
+    _LOADED[key] = backend
+    return backend
@@ -0,0 +1,136 @@
+"""
+boxes.py
+--------------------------------------------------------------------
+Small numpy helpers for detections shared by the auto-label backends:
+box IoU / intersection-over-smaller-area, class-aware NMS, weighted box fusion and conversion to YOLO
+label lines.
+"""
+
+import numpy as np
+
+
+class Detections:
+    """Detections for one image: `xyxy` in pixels, `conf`, `cls` (model class ids)."""
+
+    def __init__(self, xyxy=None, conf=None, cls=None):
+        self.xyxy = np.zeros((0, 4), dtype=np.float32) if xyxy is None else np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        self.conf = np.zeros(0, dtype=np.float32) if conf is None else np.asarray(conf, dtype=np.float32).reshape(-1)
+        self.cls = np.zeros(0, dtype=np.int64) if cls is None else np.asarray(cls, dtype=np.int64).reshape(-1)
+
+    def __len__(self):
+        return len(self.conf)
+
+    def filter(self, mask):
+        return Detections(self.xyxy[mask], self.conf[mask], self.cls[mask])
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy arrays."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(br - tl, 0, None).prod(axis=2)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def box_ios(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise intersection over the smaller box area between (N, 4) and (M, 4) xyxy arrays."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(br - tl, 0, None).prod(axis=2)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (np.minimum(area_a[:, None], area_b[None, :]) + 1e-9)
+
+
+def nms(xyxy: np.ndarray, conf: np.ndarray, cls: np.ndarray, iou_thresh: float = 0.45) -> np.ndarray:
+    """Class-aware NMS. Returns kept indices sorted by confidence."""
+    if len(conf) == 0:
+        return np.zeros(0, dtype=np.int64)
+    # Shift boxes of each class into a disjoint region so one pass handles all classes
+    offset = cls.astype(np.float32)[:, None] * (float(xyxy.max()) + 1.0)
+    boxes = xyxy + offset
+    order = np.argsort(-conf)
+    keep = []
+    while len(order):
+        i = order[0]
+        keep.append(i)
+        if len(order) == 1:
+            break
+        ious = box_iou(boxes[i:i + 1], boxes[order[1:]])[0]
+        order = order[1:][ious <= iou_thresh]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def concat_detections(dets_list):
+    dets_list = [d for d in dets_list if len(d)]
+    if not dets_list:
+        return Detections()
+    return Detections(np.concatenate([d.xyxy for d in dets_list]),
+                      np.concatenate([d.conf for d in dets_list]),
+                      np.concatenate([d.cls for d in dets_list]))
+
+
+def weighted_box_fusion(xyxy: np.ndarray, conf: np.ndarray, cls: np.ndarray, sources=None,
+                        iou_thresh: float = 0.55, n_sources: int = 1):
+    """
+    Class-aware weighted box fusion. Boxes of the same class overlapping a fused
+    cluster by more than `iou_thresh` are merged into a confidence-weighted
+    average box. `sources` tells which view/model produced each box; the fused
+    confidence is scaled by the share of sources that agree on the cluster.
+    Returns (Detections, agreement) where agreement is in [0, 1] per fused box.
+    """
+    if len(conf) == 0:
+        return Detections(), np.zeros(0, dtype=np.float32)
+    sources = np.zeros(len(conf), dtype=np.int64) if sources is None else np.asarray(sources)
+    n_sources = max(n_sources, 1)
+
+    out_xyxy, out_conf, out_cls, out_agree = [], [], [], []
+    for c in np.unique(cls):
+        idx = np.where(cls == c)[0]
+        idx = idx[np.argsort(-conf[idx])]
+        fused, members = [], []
+        for i in idx:
+            if fused:
+                ious = box_iou(xyxy[i:i + 1], np.asarray(fused))[0]
+                j = int(np.argmax(ious))
+                if ious[j] > iou_thresh:
+                    members[j].append(i)
+                    m = np.asarray(members[j])
+                    w = conf[m][:, None]
+                    fused[j] = (xyxy[m] * w).sum(axis=0) / w.sum()
+                    continue
+            fused.append(xyxy[i].copy())
+            members.append([i])
+
+        for box, m in zip(fused, members):
+            m = np.asarray(m)
+            agree = len(np.unique(sources[m])) / n_sources
+            out_xyxy.append(box)
+            out_conf.append(conf[m].mean() * min(agree, 1.0))
+            out_cls.append(c)
+            out_agree.append(min(agree, 1.0))
+
+    return (Detections(np.asarray(out_xyxy), np.asarray(out_conf), np.asarray(out_cls)),
+            np.asarray(out_agree, dtype=np.float32))
+
+
+def to_yolo_lines(dets: Detections, names: dict, class_name_to_idx: dict, w: int, h: int):
+    """Map model classes to dataset classes and format YOLO label lines."""
+    lines = []
+    for (xmin, ymin, xmax, ymax), cls_idx in zip(dets.xyxy, dets.cls):
+        class_name = names.get(int(cls_idx))
+        if class_name not in class_name_to_idx:
+            continue
+        mapped_cls = class_name_to_idx[class_name]
+        x_center = ((xmin + xmax) / 2) / w
+        y_center = ((ymin + ymax) / 2) / h
+        bw = (xmax - xmin) / w
+        bh = (ymax - ymin) / h
+        lines.append(f"{mapped_cls} {x_center:.6f} {y_center:.6f} {bw:.6f} {bh:.6f}\n")
+    return lines
@@ -0,0 +1,156 @@
+"""
+compare_backends.py
+--------------------------------------------------------------------
+Agreement check between the PyTorch reference backend and a faster candidate
+(ONNX / INT8 / OpenCV DNN / smaller model) on a sample of images.
+
+The reference detections are treated as ground truth, so the reported mAP50
+is "how well the candidate reproduces the labels we would have written",
+shown next to the measured speedup.
+"""
+
+import argparse
+import random
+import sys
+import os
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from auto_label.backends import BACKENDS, load_backend
+from auto_label.boxes import box_iou
+from logs.log import get_logger
+
+log = get_logger("compare_backends")
+
+
+def average_precision(tp: np.ndarray, conf: np.ndarray, n_gt: int) -> float:
+    """VOC-style all-point AP from per-prediction TP flags and confidences."""
+    if n_gt == 0:
+        return float("nan")
+    if len(tp) == 0:
+        return 0.0
+    order = np.argsort(-conf)
+    tp = tp[order]
+    tpc = np.cumsum(tp)
+    fpc = np.cumsum(1 - tp)
+    recall = tpc / n_gt
+    precision = tpc / (tpc + fpc)
+    mrec = np.concatenate([[0.0], recall, [1.0]])
+    mpre = np.concatenate([[1.0], precision, [0.0]])
+    mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+    idx = np.where(mrec[1:] != mrec[:-1])[0]
+    return float(np.sum((mrec[idx + 1] - mrec[idx]) * mpre[idx + 1]))
+
+
+def match_detections(ref, cand, iou_thresh: float = 0.5):
+    """Greedy same-class matching of candidate boxes to reference boxes. Returns TP flags."""
+    tp = np.zeros(len(cand), dtype=np.float32)
+    if len(ref) == 0 or len(cand) == 0:
+        return tp
+    ious = box_iou(cand.xyxy, ref.xyxy)
+    ious[cand.cls[:, None] != ref.cls[None, :]] = 0
+    used = np.zeros(len(ref), dtype=bool)
+    for i in np.argsort(-cand.conf):
+        j = int(np.argmax(np.where(used, 0, ious[i])))
+        if ious[i, j] >= iou_thresh and not used[j]:
+            used[j] = True
+            tp[i] = 1
+    return tp
+
+
+def timed_predict(backend, paths, batch_size: int):
+    dets = []
+    start = time.perf_counter()
+    for i in range(0, len(paths), batch_size):
+        dets.extend(backend.predict(paths[i:i + batch_size]))
+    return dets, time.perf_counter() - start
+
+
+def compare(reference, candidate, paths, batch_size: int = 1, iou_thresh: float = 0.5):
+    # Warm-up so lazy initialisation is not counted as inference time
+    reference.predict(paths[:1])
+    candidate.predict(paths[:1])
+
+    ref_dets, ref_time = timed_predict(reference, paths, batch_size)
+    cand_dets, cand_time = timed_predict(candidate, paths, batch_size)
+
+    per_class_tp, per_class_conf = defaultdict(list), defaultdict(list)
+    n_gt = defaultdict(int)
+    ref_counts, cand_counts = defaultdict(int), defaultdict(int)
+    images_changed = 0
+
+    for ref, cand in zip(ref_dets, cand_dets):
+        tp = match_detections(ref, cand, iou_thresh)
+        for c in ref.cls:
+            n_gt[int(c)] += 1
+            ref_counts[reference.names[int(c)]] += 1
+        for c, flag, conf in zip(cand.cls, tp, cand.conf):
+            per_class_tp[int(c)].append(flag)
+            per_class_conf[int(c)].append(conf)
+            cand_counts[candidate.names[int(c)]] += 1
+        if len(ref) != len(cand) or tp.sum() != len(ref):
+            images_changed += 1
+
+    aps = {}
+    for c in set(n_gt) | set(per_class_tp):
+        ap = average_precision(np.asarray(per_class_tp[c]), np.asarray(per_class_conf[c]), n_gt[c])
+        if not np.isnan(ap):
+            aps[reference.names.get(c, str(c))] = ap
+
+    return {
+        "images": len(paths),
+        "reference_s_per_img": ref_time / len(paths),
+        "candidate_s_per_img": cand_time / len(paths),
+        "speedup": ref_time / cand_time if cand_time > 0 else float("inf"),
+        "map50": float(np.mean(list(aps.values()))) if aps else float("nan"),
+        "ap50_per_class": aps,
+        "images_with_label_changes": images_changed,
+        "box_count_delta": {k: cand_counts.get(k, 0) - ref_counts.get(k, 0)
+                            for k in sorted(set(ref_counts) | set(cand_counts))},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a detector backend against the PyTorch reference")
+    parser.add_argument("--input_dir", type=str, default="data/raw/images", help="Folder chứa ảnh mẫu")
+    parser.add_argument("--model", type=str, default="yolov8x.pt", help="Reference YOLOv8 weights")
+    parser.add_argument("--backend", type=str, choices=BACKENDS, default="onnx", help="Candidate backend")
+    parser.add_argument("--candidate_model", type=str, default=None,
+                        help="Candidate weights (default: same as --model), e.g. yolov8n.pt")
+    parser.add_argument("--int8", action="store_true", help="Quantize the ONNX export to INT8")
+    parser.add_argument("--imgsz", type=int, default=640, help="Inference size")
+    parser.add_argument("--conf", type=float, default=0.4, help="Confidence threshold")
+    parser.add_argument("--sample", type=int, default=50, help="Number of images to compare on")
+    parser.add_argument("--batch", type=int, default=1, help="Images per forward call")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = sorted(Path(args.input_dir).glob("*.[jp][pn]g"))
+    if not paths:
+        log.info(f"No images in {args.input_dir}")
+        return
+    random.Random(args.seed).shuffle(paths)
+    paths = paths[:args.sample]
+
+    reference = load_backend("torch", args.model, conf=args.conf, imgsz=args.imgsz)
+    candidate = load_backend(args.backend, args.candidate_model or args.model, conf=args.conf,
+                             imgsz=args.imgsz, int8=args.int8)
+
+    report = compare(reference, candidate, paths, batch_size=args.batch)
+    label = f"{args.backend}{' int8' if args.int8 else ''} ({args.candidate_model or args.model})"
+    log.info(f"📊 torch ({args.model}) vs {label} on {report['images']} images")
+    log.info(f"  speed     : {report['reference_s_per_img'] * 1000:.1f} ms/img -> "
+             f"{report['candidate_s_per_img'] * 1000:.1f} ms/img  (x{report['speedup']:.2f})")
+    log.info(f"  mAP50     : {report['map50']:.4f} (reference labels as ground truth)")
+    for name, ap in sorted(report["ap50_per_class"].items()):
+        log.info(f"    {name}: {ap:.4f}")
+    log.info(f"  changed   : {report['images_with_label_changes']}/{report['images']} images")
+    log.info(f"  box delta : {report['box_count_delta']}")
+
+
+if __name__ == "__main__":
+    main()
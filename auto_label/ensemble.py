@@ -0,0 +1,186 @@
+"""
+ensemble.py
+--------------------------------------------------------------------
+Test-time-augmentation / multi-model ensemble labeling.
+
+Every (model, view) pair is a "source". Each source's detections are mapped
+back to original-image pixels, cached on disk by image md5 and source key,
+and all sources are fused with weighted box fusion. The agreement of a fused
+box is the share of sources that produced it.
+
+Adding a view or a model only runs the missing sources; images already seen
+with the same settings are answered entirely from the cache. All missing
+views of one model go to the backend in a single `predict` call.
+
+View specs: `orig`, `hflip`, `s<factor>` (e.g. `s0.75`, `s1.25`).
+"""
+
+import json
+import sys
+import os
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from auto_label.backends import file_md5, load_backend, _resolve_weights
+from auto_label.boxes import Detections, weighted_box_fusion
+from utils.safe_io import atomic_write
+
+DEFAULT_CACHE_DIR = Path("data/cache/detections")
+
+
+def parse_view(view: str):
+    if view in ("orig", "hflip"):
+        return view, 1.0
+    if view.startswith("s"):
+        return "scale", float(view[1:])
+    raise ValueError(f"Unknown view '{view}', expected orig, hflip or s<factor>")
+
+
+def apply_view(img: np.ndarray, view: str) -> np.ndarray:
+    kind, factor = parse_view(view)
+    if kind == "hflip":
+        return np.ascontiguousarray(img[:, ::-1])
+    if kind == "scale":
+        import cv2
+        h, w = img.shape[:2]
+        return cv2.resize(img, (max(1, int(round(w * factor))), max(1, int(round(h * factor)))),
+                          interpolation=cv2.INTER_LINEAR)
+    return img
+
+
+def invert_view(dets: Detections, view: str, w: int, h: int) -> Detections:
+    """Map boxes predicted on the transformed image back to the original image."""
+    kind, factor = parse_view(view)
+    xyxy = dets.xyxy.copy()
+    if kind == "hflip":
+        xyxy[:, [0, 2]] = w - xyxy[:, [2, 0]]
+    elif kind == "scale":
+        xyxy /= factor
+    xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+    xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+    return Detections(xyxy, dets.conf, dets.cls)
+
+
+def backend_key(kind: str, model_path: str, imgsz: int, conf: float, int8: bool = False) -> str:
+    """Identifies a model + settings, so cached detections are invalidated when weights change."""
+    if str(model_path).endswith(".onnx"):
+        digest = file_md5(Path(model_path))
+    else:
+        digest = file_md5(_resolve_weights(model_path))
+    return f"{kind}{'-int8' if int8 else ''}:{digest[:12]}:{imgsz}:{conf}"
+
+
+class DetectionCache:
+    """One json file per image md5: {source_key: {"xyxy": [...], "conf": [...], "names": [...]}}."""
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+
+    def _path(self, digest: str) -> Path:
+        return self.cache_dir / digest[:2] / f"{digest}.json"
+
+    def get(self, digest: str) -> dict:
+        path = self._path(digest)
+        if not path.exists():
+            return {}
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return {}
+
+    def put(self, digest: str, entries: dict):
+        path = self._path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_write(path) as f:  # .tmp-<pid>-*: không đụng nhau giữa các run song song
+            json.dump(entries, f)
+
+
+class EnsembleLabeler:
+    """
+    Fuses detections of several (model, view) sources. `names` is the dataset
+    class mapping so the fused detections can be written with `to_yolo_lines`.
+    """
+
+    def __init__(self, models, views, class_name_to_idx: dict, conf: float = 0.4, imgsz: int = 640,
+                 backend: str = "torch", int8: bool = False, iou: float = 0.55,
+                 min_agreement: float = 0.0, cache_dir: Path = DEFAULT_CACHE_DIR):
+        for v in views:
+            parse_view(v)
+        self.views = list(views)
+        self.class_name_to_idx = class_name_to_idx
+        self.names = {v: k for k, v in class_name_to_idx.items()}
+        self.iou = iou
+        self.min_agreement = min_agreement
+        self.cache = DetectionCache(cache_dir)
+        self._models = [(backend_key(backend, m, imgsz, conf, int8), backend, m) for m in models]
+        self._load_args = dict(conf=conf, imgsz=imgsz, int8=int8)
+        self.sources = [f"{key}|{v}" for key, _, _ in self._models for v in self.views]
+        self.computed = 0
+        self.reused = 0
+
+    def _backend(self, kind, model_path):
+        # Models are only loaded once some image actually misses their cache entry
+        return load_backend(kind, model_path, **self._load_args)
+
+    def predict(self, img_path: Path, im: np.ndarray):
+        """
+        Returns (fused Detections in dataset class ids, agreement per box, number of
+        raw detections of any class over all sources).
+        """
+        digest = file_md5(img_path)
+        entries = self.cache.get(digest)
+        h, w = im.shape[:2]
+
+        dirty = False
+        for key, kind, model_path in self._models:
+            missing = [v for v in self.views if f"{key}|{v}" not in entries]
+            self.reused += len(self.views) - len(missing)
+            if not missing:
+                continue
+            backend = self._backend(kind, model_path)
+            dets = backend.predict([apply_view(im, v) for v in missing])
+            for v, d in zip(missing, dets):
+                d = invert_view(d, v, w, h)
+                entries[f"{key}|{v}"] = {
+                    "xyxy": d.xyxy.round(2).tolist(),
+                    "conf": d.conf.round(4).tolist(),
+                    "names": [backend.names[int(c)] for c in d.cls],
+                }
+            self.computed += len(missing)
+            dirty = True
+        if dirty:
+            self.cache.put(digest, entries)
+
+        xyxy, conf, cls, src = [], [], [], []
+        n_raw = 0
+        for si, source in enumerate(self.sources):
+            entry = entries[source]
+            n_raw += len(entry["conf"])
+            for box, c, name in zip(entry["xyxy"], entry["conf"], entry["names"]):
+                if name not in self.class_name_to_idx:
+                    continue
+                xyxy.append(box)
+                conf.append(c)
+                cls.append(self.class_name_to_idx[name])
+                src.append(si)
+        if not xyxy:
+            return Detections(), np.zeros(0, dtype=np.float32), n_raw
+
+        fused, agreement = weighted_box_fusion(
+            np.asarray(xyxy, dtype=np.float32), np.asarray(conf, dtype=np.float32),
+            np.asarray(cls), sources=np.asarray(src), iou_thresh=self.iou,
+            n_sources=len(self.sources))
+        keep = agreement >= self.min_agreement
+        return fused.filter(keep), agreement[keep], n_raw
+
+
+def agreement_lines(dets: Detections, agreement: np.ndarray, w: int, h: int):
+    """YOLO box + fused confidence + agreement, one line per kept box."""
+    lines = []
+    for (xmin, ymin, xmax, ymax), c, conf, agree in zip(dets.xyxy, dets.cls, dets.conf, agreement):
+        lines.append(f"{int(c)} {(xmin + xmax) / 2 / w:.6f} {(ymin + ymax) / 2 / h:.6f} "
+                     f"{(xmax - xmin) / w:.6f} {(ymax - ymin) / h:.6f} {conf:.4f} {agree:.3f}\n")
+    return lines
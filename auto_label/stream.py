@@ -0,0 +1,406 @@
+"""
+stream.py
+--------------------------------------------------------------------
+Service mode for auto-labeling: label images as the crawler delivers them.
+
+Sources (one producer thread each):
+- `DirectoryWatcher` : inotify on Linux (IN_CLOSE_WRITE / IN_MOVED_TO, so
+                       half-written files are never picked up), polling with
+                       os.scandir elsewhere or when inotify is unavailable
+- `ManifestTailer`   : follows an append-only ingest manifest (one image path
+                       or {"path": ...} JSON object per line); the offset saved
+                       next to it only moves past a line once its image has been
+                       labeled and routed, so a restart (even after kill -9)
+                       re-reads every line that was still in flight
+
+Both put paths on a bounded queue. When labeling falls behind the queue fills
+and the producer blocks, so memory stays bounded by `max_pending` paths plus
+one micro-batch of images. The consumer collects up to `batch_size` paths or
+whatever arrived within `batch_window` seconds, labels them, routes them to
+train/val/test by file-name hash and updates `stats.json` from the new label
+files only. SIGINT/SIGTERM stop the producers; paths already queued are
+labeled before exit.
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import queue
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from analysis.stats import analyze_split
+from logs.log import get_logger
+from utils.safe_io import atomic_write
+
+log = get_logger("autolabel")
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+SPLITS = ("train", "val", "test")
+PER_CLASS_KEYS = ("objets_per_class", "images_per_class")
+# inotify mode: how often `seen` is intersected with the directory listing
+SEEN_PRUNE_INTERVAL = 30.0
+
+
+def _is_image(name: str) -> bool:
+    # Tên ẩn gồm cả file tạm .tmp-<pid>-* của writer khác (utils/safe_io.py) đang ghi dở
+    base = os.path.basename(name)
+    return base.lower().endswith(IMAGE_EXTS) and not base.startswith(".")
+
+
+# ==============================================================================
+# Sources
+# ==============================================================================
+class _Inotify:
+    """Minimal inotify binding through libc (Linux only); raises OSError when unavailable."""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, path: Path):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or libc_name is None:
+            raise OSError("inotify not available")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, str(path).encode(), self.IN_CLOSE_WRITE | self.IN_MOVED_TO) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+
+    def read(self, timeout: float):
+        """File names closed-after-write or moved into the directory within `timeout` seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        names, offset = [], 0
+        while offset < len(data):
+            _, _, _, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            names.append(data[offset:offset + length].rstrip(b"\0").decode(errors="replace"))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DirectoryWatcher:
+    """New image files in `path`. Files already present at start are emitted first."""
+
+    def __init__(self, path: Path, poll_interval: float = 2.0, use_inotify: bool = True):
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+
+    def _scan(self):
+        with os.scandir(self.path) as it:
+            return {e.name: (e.stat().st_size, e.stat().st_mtime)
+                    for e in it if e.is_file() and _is_image(e.name)}
+
+    def _names(self):
+        return {name for name in os.listdir(self.path) if _is_image(name)}
+
+    def run(self, out: queue.Queue, stop: threading.Event):
+        self.path.mkdir(parents=True, exist_ok=True)
+        notify = None
+        if self.use_inotify:
+            try:
+                notify = _Inotify(self.path)
+                log.info(f"👀 Watching {self.path} (inotify)")
+            except OSError as e:
+                log.info(f"inotify không dùng được ({e}), chuyển sang polling")
+        if notify is None:
+            log.info(f"👀 Watching {self.path} (polling mỗi {self.poll_interval}s)")
+
+        # Watch is set up before the initial scan, so nothing written in between is lost
+        seen = set()
+        for name in sorted(self._scan()):
+            if not _put(out, self.path / name, stop):
+                break
+            seen.add(name)
+
+        pending = {}  # polling: name -> (size, mtime) at previous scan, emitted once unchanged
+        last_prune = time.monotonic()
+        try:
+            while not stop.is_set():
+                if notify is not None:
+                    for name in notify.read(self.poll_interval):
+                        if _is_image(name) and name not in seen:
+                            seen.add(name)
+                            _put(out, self.path / name, stop)
+                    if time.monotonic() - last_prune >= SEEN_PRUNE_INTERVAL:
+                        seen &= self._names()  # như polling: quên file đã bị xoá
+                        last_prune = time.monotonic()
+                    continue
+
+                current = self._scan()
+                for name, sig in sorted(current.items()):
+                    if name in seen:
+                        continue
+                    if pending.get(name) == sig:
+                        seen.add(name)
+                        pending.pop(name)
+                        if not _put(out, self.path / name, stop):
+                            break
+                    else:
+                        pending[name] = sig  # still being written, or just appeared
+                seen &= current.keys()  # forget deleted files (e.g. removed for no detections)
+                stop.wait(self.poll_interval)
+        finally:
+            if notify is not None:
+                notify.close()
+
+
+class ManifestTailer:
+    """Image paths appended to an ingest manifest; relative paths are relative to `base_dir`."""
+
+    def __init__(self, manifest: Path, base_dir: Path = Path("."), poll_interval: float = 1.0):
+        self.manifest = Path(manifest)
+        self.base_dir = Path(base_dir)
+        self.poll_interval = poll_interval
+        self.offset_path = self.manifest.with_name(self.manifest.name + ".offset")
+        # End offset of every queued line, in queue order; the consumer takes paths in the
+        # same order, so `commit(n)` acknowledges the n oldest
+        self._inflight = deque()
+        self._scanned = 0
+        self._lock = threading.Lock()
+
+    def _load_offset(self) -> int:
+        if self.offset_path.exists():
+            return int(self.offset_path.read_text().strip() or 0)
+        return 0
+
+    def save_offset(self, offset: int):
+        tmp = self.offset_path.with_suffix(".tmp")
+        tmp.write_text(str(offset))
+        os.replace(tmp, self.offset_path)
+
+    @staticmethod
+    def _parse(line: str):
+        line = line.strip()
+        if not line:
+            return None
+        if line.startswith("{"):
+            return json.loads(line).get("path")
+        return line
+
+    def commit(self, n: int):
+        """The `n` oldest queued paths are labeled and routed: save the offset past their lines."""
+        with self._lock:
+            end = None
+            for _ in range(min(n, len(self._inflight))):
+                end = self._inflight.popleft()
+            if not self._inflight:
+                # also covers skipped (non-image / malformed) lines after them
+                end = self._scanned if end is None else max(end, self._scanned)
+            if end is not None:
+                self.save_offset(end)
+
+    def run(self, out: queue.Queue, stop: threading.Event):
+        offset = self._load_offset()
+        self._scanned = offset
+        log.info(f"📜 Tailing {self.manifest} from byte {offset}")
+        while not stop.is_set():
+            if not self.manifest.exists():
+                stop.wait(self.poll_interval)
+                continue
+            if self.manifest.stat().st_size < offset:
+                log.warning(f"{self.manifest} bị rút ngắn, đọc lại từ đầu")
+                offset = 0
+            with open(self.manifest, "rb") as f:
+                f.seek(offset)
+                for raw in iter(f.readline, b""):
+                    if not raw.endswith(b"\n"):
+                        break  # incomplete last line, wait for the writer to finish it
+                    try:
+                        rel = self._parse(raw.decode())
+                    except ValueError:
+                        log.warning(f"Bỏ qua dòng manifest lỗi: {raw[:200]!r}")
+                        rel = None
+                    if rel and _is_image(rel):
+                        with self._lock:
+                            self._inflight.append(offset + len(raw))
+                        if not _put(out, self.base_dir / rel, stop):
+                            with self._lock:
+                                self._inflight.pop()
+                            break
+                    offset += len(raw)
+            # Queued lines are not consumed yet: the offset is saved by `commit()` once run_stream
+            # has routed them. With nothing in flight, skipped lines can be committed right away.
+            with self._lock:
+                self._scanned = offset
+                if not self._inflight:
+                    self.save_offset(offset)
+            stop.wait(self.poll_interval)
+
+
+def _put(out: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put that still notices shutdown. This is where back-pressure happens."""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+# ==============================================================================
+# Incremental stats
+# ==============================================================================
+class SplitStats:
+    """stats.json kept up to date from newly routed label files, without rescanning splits."""
+
+    def __init__(self, output_dir: Path):
+        self.path = Path(output_dir) / "stats.json"
+        self.stats = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                self.stats = json.load(f)
+        else:
+            for split in SPLITS:
+                if (Path(output_dir) / split / "images").exists():
+                    self.stats[split] = analyze_split(Path(output_dir), split)
+        for s in self.stats.values():
+            for key in PER_CLASS_KEYS:
+                s[key] = defaultdict(int, {int(k): v for k, v in s.get(key, {}).items()})
+
+    def add(self, split: str, label_path: Path):
+        s = self.stats.setdefault(split, {"total_images": 0, "total_labels": 0, "total_objects": 0,
+                                          "avg_objets_per_image": 0,
+                                          **{key: defaultdict(int) for key in PER_CLASS_KEYS}})
+        s["total_images"] += 1
+        if label_path.exists():
+            s["total_labels"] += 1
+            present = set()
+            with open(label_path, "r") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) >= 5:
+                        s["objets_per_class"][int(parts[0])] += 1
+                        s["total_objects"] += 1
+                        present.add(int(parts[0]))
+            for cls_id in present:
+                s["images_per_class"][cls_id] += 1
+        s["avg_objets_per_image"] = round(s["total_objects"] / s["total_images"], 2)
+
+    def save(self):
+        out = {split: {**s, **{key: dict(s[key]) for key in PER_CLASS_KEYS}}
+               for split, s in self.stats.items()}
+        with atomic_write(self.path) as f:
+            json.dump(out, f, indent=2)
+
+
+# ==============================================================================
+# Service loop
+# ==============================================================================
+def next_batch(pending: queue.Queue, batch_size: int, window: float):
+    """
+    Up to `batch_size` paths, or what arrived within `window`s of the first one.
+    Empty when nothing arrived for 0.5s, so the caller can check stop / the producer.
+    """
+    try:
+        batch = [pending.get(timeout=0.5)]
+    except queue.Empty:
+        return []
+
+    deadline = time.monotonic() + window
+    while len(batch) < batch_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            item = pending.get(timeout=remaining)
+        except queue.Empty:
+            break
+        batch.append(item)
+    return batch
+
+
+def run_stream(source, label_batch, output_dir: Path, label_dir: Path,
+               batch_size: int = 16, batch_window: float = 5.0, max_pending: int = 256,
+               journal=None, backlog=()):
+    """
+    Run until SIGINT/SIGTERM. `label_batch(paths)` labels a micro-batch and
+    returns the image paths that got a label file. `backlog` holds images an
+    interrupted run labeled but did not route yet; they are routed first.
+    Sources with a `commit(n)` method are told after each batch is routed.
+    """
+    from auto_label.autolabel import split_dataset
+
+    pending = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+    commit = getattr(source, "commit", None)
+    stats = SplitStats(output_dir)
+
+    def _on_signal(signum, _frame):
+        if not stop.is_set():
+            log.info(f"🛑 Nhận signal {signum}, dừng nhận ảnh mới và flush batch đang chờ...")
+        stop.set()
+
+    previous = {sig: signal.signal(sig, _on_signal) for sig in (signal.SIGINT, signal.SIGTERM)}
+
+    def in_split(split, img_path):
+        return (output_dir / split / "images" / img_path.name).exists()
+
+    def route(labeled):
+        # Ảnh đã có trong một split (event lặp lại / giao lại) đã được tính trong stats.json
+        before = {p for p in labeled if any(in_split(s, p) for s in SPLITS)}
+        routed = split_dataset(labeled, label_dir, output_dir, by_hash=True, journal=journal)
+        for split, files in routed.items():
+            for img_path in files:
+                if img_path not in before and in_split(split, img_path):  # không tính ảnh thiếu label
+                    stats.add(split, label_dir / (img_path.stem + ".txt"))
+        if routed:
+            stats.save()
+        if journal is not None:
+            journal.compact(("split", "removed"))
+
+    if backlog:
+        route(list(backlog))
+    producer = threading.Thread(target=source.run, args=(pending, stop), name="stream-source", daemon=True)
+    producer.start()
+
+    total = 0
+    try:
+        while True:
+            batch = next_batch(pending, batch_size, batch_window)
+            if not batch:
+                if not producer.is_alive() and not stop.is_set():
+                    log.error("❌ Nguồn ảnh (watcher/manifest) đã dừng bất thường, tắt service")
+                    stop.set()
+                if stop.is_set() and not producer.is_alive() and pending.empty():
+                    break
+                if stop.is_set():
+                    producer.join(timeout=1.0)
+                continue
+
+            t0 = time.perf_counter()
+            taken = len(batch)
+            batch = [p for p in dict.fromkeys(batch) if p.exists()]
+            labeled = label_batch(batch) if batch else []
+            route(labeled)
+            if commit is not None:
+                commit(taken)
+            total += len(labeled)
+            log.info(f"📦 Batch: {len(batch)} ảnh, {len(labeled)} labeled "
+                     f"({time.perf_counter() - t0:.2f}s), queue {pending.qsize()}/{max_pending}, "
+                     f"tổng {total}")
+    finally:
+        stop.set()
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+    log.info(f"✅ Streaming mode dừng, đã label {total} ảnh")
+    return total
@@ -0,0 +1,137 @@
+"""
+tiling.py
+--------------------------------------------------------------------
+Sliced inference for large images: the image is cut into overlapping tiles,
+tiles are sent to the backend in batches, detections are shifted back to
+full-image pixels and merged with class-aware NMS or weighted box fusion
+(IoU). Boxes touching an inner tile edge are cut-off pieces of an object: they
+lie inside the full box from the neighbouring tile or overlap the other
+piece, with a low IoU, so they are matched by intersection over the smaller
+box (IoS) instead and the merged box covers all pieces. A full-image pass is
+added so objects larger than a tile are still found.
+
+Images whose longest side is below `min_side` skip tiling entirely and cost
+exactly one forward pass, as before.
+"""
+
+import numpy as np
+
+from auto_label.boxes import Detections, box_ios, box_iou, concat_detections
+
+
+class TileConfig:
+    def __init__(self, tile_size: int = 640, overlap: float = 0.2, min_side: int = 1280,
+                 batch_size: int = 8, merge: str = "nms", iou: float = 0.5, full_pass: bool = True):
+        if not 0 <= overlap < 1:
+            raise ValueError("overlap must be in [0, 1)")
+        if merge not in ("nms", "wbf"):
+            raise ValueError("merge must be 'nms' or 'wbf'")
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.min_side = min_side
+        self.batch_size = batch_size
+        self.merge = merge
+        self.iou = iou
+        self.full_pass = full_pass
+
+    def needs_tiling(self, h: int, w: int) -> bool:
+        return max(h, w) >= self.min_side
+
+
+def _starts(length: int, tile: int, stride: int):
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)  # last tile flush with the border
+    return starts
+
+
+def make_tiles(h: int, w: int, tile_size: int, overlap: float):
+    """Overlapping (x0, y0, x1, y1) windows covering an h x w image."""
+    stride = max(1, int(tile_size * (1 - overlap)))
+    return [(x0, y0, min(x0 + tile_size, w), min(y0 + tile_size, h))
+            for y0 in _starts(h, tile_size, stride)
+            for x0 in _starts(w, tile_size, stride)]
+
+
+def _union(box: np.ndarray, others: np.ndarray) -> np.ndarray:
+    return np.concatenate([np.minimum(box[:2], others[:, :2].min(axis=0)),
+                           np.maximum(box[2:], others[:, 2:].max(axis=0))])
+
+
+def merge_detections(dets: Detections, cfg: TileConfig, cut=None) -> Detections:
+    """
+    Greedy, class-aware, most confident box first. A box joins the group of
+    the current one when IoU > `cfg.iou` (duplicate), or when IoS with the
+    group's extent >= `cfg.iou` and the box or the group has a `cut` piece.
+    nms keeps the top box, wbf the confidence-weighted average of the
+    duplicates; a group with cut pieces is then grown to cover all of them.
+    """
+    if len(dets) == 0:
+        return dets
+    order = np.argsort(-dets.conf, kind="stable")
+    xyxy, conf, cls = dets.xyxy[order], dets.conf[order], dets.cls[order]
+    cut = np.zeros(len(conf), dtype=bool) if cut is None else np.asarray(cut, dtype=bool)[order]
+    used = np.zeros(len(conf), dtype=bool)
+    out_xyxy, out_conf, out_cls = [], [], []
+    for i in range(len(conf)):
+        if used[i]:
+            continue
+        used[i] = True
+        group, dup = [i], [i]
+        extent, has_cut = xyxy[i], cut[i]
+        while True:  # mảnh mới có thể chạm tới mảnh kế tiếp (vật cắt qua nhiều tile)
+            cand = np.flatnonzero(~used & (cls == cls[i]))
+            if not len(cand):
+                break
+            is_dup = box_iou(xyxy[i:i + 1], xyxy[cand])[0] > cfg.iou
+            is_piece = (box_ios(extent[None], xyxy[cand])[0] >= cfg.iou) & (cut[cand] | has_cut)
+            new = cand[is_dup | is_piece]
+            if not len(new):
+                break
+            used[new] = True
+            group += new.tolist()
+            dup += cand[is_dup].tolist()
+            extent = _union(extent, xyxy[new])
+            has_cut = has_cut or cut[new].any()
+
+        box, score = xyxy[i], conf[i]
+        if cfg.merge == "wbf":
+            box = (xyxy[dup] * conf[dup, None]).sum(axis=0) / conf[dup].sum()
+            score = conf[dup].mean()
+        out_xyxy.append(_union(box, xyxy[group]) if has_cut else box)
+        out_conf.append(score)
+        out_cls.append(cls[i])
+    return Detections(np.stack(out_xyxy), out_conf, out_cls)
+
+
+def _touches_inner_edge(d: Detections, tile, w: int, h: int, margin: float = 2.0) -> np.ndarray:
+    """Boxes (tile coordinates) ending at a tile edge that is not the image border."""
+    x0, y0, x1, y1 = tile
+    b = d.xyxy
+    return (((b[:, 0] <= margin) & (x0 > 0)) | ((b[:, 1] <= margin) & (y0 > 0))
+            | ((b[:, 2] >= x1 - x0 - margin) & (x1 < w)) | ((b[:, 3] >= y1 - y0 - margin) & (y1 < h)))
+
+
+def sliced_predict(backend, img: np.ndarray, cfg: TileConfig) -> Detections:
+    """Detect on one BGR image, tiling it when it is large enough."""
+    h, w = img.shape[:2]
+    if not cfg.needs_tiling(h, w):
+        return backend.predict([img])[0]
+
+    tiles = make_tiles(h, w, cfg.tile_size, cfg.overlap)
+    crops = [img[y0:y1, x0:x1] for x0, y0, x1, y1 in tiles]
+    if cfg.full_pass:
+        tiles.append((0, 0, w, h))
+        crops.append(img)
+
+    parts, cut = [], []
+    for i in range(0, len(crops), cfg.batch_size):
+        batch_dets = backend.predict(crops[i:i + cfg.batch_size])
+        for tile, d in zip(tiles[i:i + cfg.batch_size], batch_dets):
+            if len(d):
+                cut.append(_touches_inner_edge(d, tile, w, h))
+                d.xyxy = d.xyxy + np.array([tile[0], tile[1], tile[0], tile[1]], dtype=np.float32)
+                parts.append(d)
+
+    return merge_detections(concat_detections(parts), cfg, np.concatenate(cut) if cut else None)
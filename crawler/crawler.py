@@ -12,9 +12,7 @@ import shutil
 import yaml
 from pathlib import Path
 from typing import List, Optional
-from icrawler.builtin import GoogleImageCrawler
 from dotenv import load_dotenv
-from youtube_crawler.Youtube_fixed import YoutubevideoCrawler
 import sys
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 from logs.log import logger  # 👉 THÊM logger vào đây
@@ -41,12 +39,31 @@ def clear_temp_folder():
 def crawl_google_images(query: str,
                         n_imgs: int,
                         save_dir: Path,
-                        filters: Optional[dict] = None) -> List[Path]:
+                        filters: Optional[dict] = None,
+                        downloader: str = "icrawler",
+                        fetch_cfg: Optional[dict] = None) -> List[Path]:
     """
     Crawl Google Images vào thư mục tạm, rồi đổi tên và chuyển về `save_dir`.
+    Với `downloader="async"`, icrawler chỉ dùng để lấy URL, ảnh được tải bằng `fetcher.py`.
     """
     logger.info(f"🔍 Crawling Google Images: '{query}' with max {n_imgs} images")
 
+    if downloader == "async":
+        from fetcher import FetchConfig, fetch_urls, google_image_urls
+
+        save_dir.mkdir(parents=True, exist_ok=True)
+        urls = google_image_urls(query, n_imgs * 2, filters)
+        timestamp = time.strftime("%y%d%m_%H%M%S")
+        start_idx = len(list(save_dir.glob("*.jpg")))
+        final_files = fetch_urls(
+            urls, save_dir,
+            lambda i: f"{timestamp}_{query.replace(' ', '_')}_{start_idx + i:04d}",
+            max_num=n_imgs, cfg=FetchConfig(**(fetch_cfg or {})))
+        logger.info(f"✅ Saved {len(final_files)} images to {save_dir}")
+        return final_files
+
+    from icrawler.builtin import GoogleImageCrawler
+
     clear_temp_folder()
     save_dir.mkdir(parents=True, exist_ok=True)
 
@@ -73,6 +90,8 @@ def crawl_youtube_videos(query: str,
                          n_videos: int,
                          save_dir: Path,
                          filters: Optional[dict] = None) -> List[Path]:
+    from youtube_crawler.Youtube_fixed import YoutubevideoCrawler
+
     logger.info(f"📺 Crawling YouTube videos: '{query}' into {save_dir}")
     save_dir.mkdir(parents=True, exist_ok=True)
 
@@ -100,6 +119,8 @@ def main():
     )
     parser.add_argument("--config", type=str, default=DEFAULT_CONFIG_PATH,
                         help="Path to crawl_config.yaml")
+    parser.add_argument("--plan", type=str, default=None,
+                        help="Sampling plan (processing/balance.py): crawl theo quota từng class thay vì query/num_images")
 
     args = parser.parse_args()
     cfg = load_config(args.config)
@@ -109,10 +130,23 @@ def main():
     crawl_type = cfg.get("type", "images")
     save_dir = Path(cfg.get("save_dir", RAW_DIR / ("images" if crawl_type == "images" else "videos")))
     filters = cfg.get("filters", {})
-
-    logger.info(f"🚀 Start crawling pipeline: query='{query}' type='{crawl_type}' num={num}")
+    downloader = cfg.get("downloader", "icrawler")
+    fetch_cfg = cfg.get("fetch", {})
+
+    jobs = {query: num}
+    if args.plan and crawl_type == "images":
+        from processing.balance import load_plan
+        plan = load_plan(args.plan)
+        if plan and plan["crawl"]:
+            logger.info(f"📐 Crawl theo sampling plan {args.plan}: {plan['crawl']}")
+            jobs = plan["crawl"]
+        elif plan:
+            logger.info(f"📐 Plan {args.plan} không cần crawl thêm, dùng config")
+
+    logger.info(f"🚀 Start crawling pipeline: queries={jobs} type='{crawl_type}'")
     if crawl_type == "images":
-        crawl_google_images(query, num, save_dir, filters)
+        for q, n in jobs.items():
+            crawl_google_images(q, n, save_dir, filters, downloader, fetch_cfg)
     else:
         crawl_youtube_videos(query, num, save_dir, filters)
 
@@ -0,0 +1,312 @@
+"""
+fetcher.py
+--------------------------------------------------------------------
+Asyncio image fetcher used instead of icrawler's threaded downloader.
+
+- one pooled keep-alive `aiohttp` session for the whole run
+- global concurrency limit + one semaphore per host (politeness)
+- optional HEAD request to reject by status / content type / size early
+- streamed GET to a hidden `.tmp-<pid>-fetch_N.part` file (never picked up
+  as an image by listings / watchers) with a hard max-bytes cap, then a
+  magic-bytes check that also decides the extension, and one atomic rename
+  to the final name in `save_dir`
+- retries with exponential backoff on timeouts, 429 and 5xx; the per-host
+  slot is released while backing off
+
+URLs can come from any feeder: Google Images (icrawler feeder + parser only),
+YouTube thumbnails, or a plain text file with one URL per line.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import sys
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from logs.log import logger
+from utils.safe_io import TMP_PREFIX, clean_temp_files
+
+CONTENT_TYPES = {
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/png": ".png",
+}
+MAGIC = {
+    ".jpg": (b"\xff\xd8\xff",),
+    ".png": (b"\x89PNG\r\n\x1a\n",),
+}
+RETRY_STATUS = {429, 500, 502, 503, 504}
+USER_AGENT = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/124.0 Safari/537.36")
+
+
+class FetchConfig:
+    def __init__(self, concurrency: int = 32, per_host: int = 4, timeout: float = 15.0,
+                 connect_timeout: float = 5.0, retries: int = 2, backoff: float = 0.5,
+                 min_bytes: int = 2 * 1024, max_bytes: int = 15 * 1024 * 1024,
+                 head_check: bool = True, content_types: Optional[dict] = None,
+                 chunk_size: int = 64 * 1024, ingest_manifest: Optional[str] = None):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.head_check = head_check
+        self.content_types = content_types or CONTENT_TYPES
+        self.chunk_size = chunk_size
+        # Append-only list of saved files, tailed by `autolabel.py --feed` (streaming mode)
+        self.ingest_manifest = ingest_manifest
+
+
+class FetchStats:
+    def __init__(self):
+        self.saved = 0
+        self.bytes = 0
+        self.rejected = defaultdict(int)
+        self.failed = 0
+        self.start = time.perf_counter()
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self.start
+        rate = self.bytes / elapsed / 1024 / 1024 if elapsed > 0 else 0.0
+        return (f"saved={self.saved} failed={self.failed} rejected={dict(self.rejected)} "
+                f"{self.bytes / 1024 / 1024:.1f} MB in {elapsed:.1f}s ({rate:.2f} MB/s)")
+
+
+class Rejected(Exception):
+    """Response is valid HTTP but not something we want to keep (type, size, status)."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def _content_type(headers) -> str:
+    return headers.get("Content-Type", "").split(";")[0].strip().lower()
+
+
+def _check_headers(resp, cfg: FetchConfig):
+    """Validate status/type/size from headers (the extension comes from the magic bytes)."""
+    if resp.status in RETRY_STATUS:
+        raise aiohttp.ClientResponseError(resp.request_info, resp.history, status=resp.status)
+    if resp.status != 200:
+        raise Rejected(f"status_{resp.status}")
+    ctype = _content_type(resp.headers)
+    if ctype and ctype not in cfg.content_types:
+        raise Rejected("content_type")
+    length = resp.headers.get("Content-Length")
+    if length is not None and length.isdigit():
+        if int(length) > cfg.max_bytes:
+            raise Rejected("too_large")
+        if int(length) < cfg.min_bytes:
+            raise Rejected("too_small")
+
+
+class AsyncImageFetcher:
+    def __init__(self, cfg: Optional[FetchConfig] = None):
+        self.cfg = cfg or FetchConfig()
+        self._host_sems = {}
+        self.stats = FetchStats()
+
+    def _host_sem(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        if host not in self._host_sems:
+            self._host_sems[host] = asyncio.Semaphore(self.cfg.per_host)
+        return self._host_sems[host]
+
+    async def _head(self, session, url: str):
+        async with session.head(url, allow_redirects=True) as resp:
+            # Many CDNs do not implement HEAD; fall through to GET in that case
+            if resp.status in (403, 405, 501):
+                return
+            _check_headers(resp, self.cfg)
+
+    async def _get(self, session, url: str, part: Path):
+        """Download into `part`; returns (part, extension sniffed from the magic bytes)."""
+        cfg = self.cfg
+        async with session.get(url, allow_redirects=True) as resp:
+            _check_headers(resp, cfg)
+            size = 0
+            head = b""
+            try:
+                with open(part, "wb") as f:
+                    async for chunk in resp.content.iter_chunked(cfg.chunk_size):
+                        size += len(chunk)
+                        if size > cfg.max_bytes:
+                            raise Rejected("too_large")
+                        if len(head) < 16:
+                            head += chunk[:16]
+                        f.write(chunk)
+                if size < cfg.min_bytes:
+                    raise Rejected("too_small")
+                # Content-Type của server hay sai (png gửi kèm image/jpeg): đuôi file lấy theo magic bytes
+                sniffed = next((e for e, sigs in MAGIC.items() if head.startswith(sigs)), None)
+                if sniffed is None:
+                    raise Rejected("not_image")
+            except BaseException:
+                part.unlink(missing_ok=True)
+                raise
+        self.stats.bytes += size
+        return part, sniffed
+
+    async def fetch_one(self, session, url: str, part: Path):
+        """(part file, extension) or None. The caller renames `part` to its final name."""
+        cfg = self.cfg
+        for attempt in range(cfg.retries + 1):
+            try:
+                async with self._host_sem(url):
+                    if cfg.head_check:
+                        await self._head(session, url)
+                    result = await self._get(session, url, part)
+                self.stats.saved += 1
+                return result
+            except Rejected as e:
+                self.stats.rejected[e.reason] += 1
+                logger.debug(f"Rejected {url}: {e.reason}")
+                return None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status in RETRY_STATUS
+                if attempt < cfg.retries and retryable:
+                    # Ngủ ngoài semaphore: URL khác cùng host vẫn tải được trong lúc backoff
+                    await asyncio.sleep(cfg.backoff * (2 ** attempt) * (1 + random.random()))
+                    continue
+                self.stats.failed += 1
+                logger.debug(f"Failed {url}: {e!r}")
+                return None
+
+    async def fetch_all(self, urls: Iterable[str], save_dir: Path,
+                        name_fn: Callable[[int], str], max_num: Optional[int] = None) -> List[Path]:
+        """
+        Download `urls` into `save_dir`, naming the i-th saved file `name_fn(i)` + extension.
+        Stops scheduling new downloads once `max_num` files are saved.
+        """
+        cfg = self.cfg
+        save_dir.mkdir(parents=True, exist_ok=True)
+        clean_temp_files(save_dir)  # .part của lần chạy bị ngắt
+        timeout = aiohttp.ClientTimeout(total=cfg.timeout, connect=cfg.connect_timeout)
+        connector = aiohttp.TCPConnector(limit=cfg.concurrency, limit_per_host=cfg.per_host,
+                                         ttl_dns_cache=300, enable_cleanup_closed=True)
+        queue = asyncio.Queue()
+        for i, url in enumerate(dict.fromkeys(urls)):
+            queue.put_nowait((i, url))
+
+        saved = []
+        lock = asyncio.Lock()
+
+        async def worker(session):
+            while not queue.empty():
+                if max_num is not None and len(saved) >= max_num:
+                    return
+                i, url = queue.get_nowait()
+                part = save_dir / f"{TMP_PREFIX}{os.getpid()}-fetch_{i:06d}.part"
+                result = await self.fetch_one(session, url, part)
+                if result is None:
+                    continue
+                part, ext = result
+                async with lock:
+                    if max_num is not None and len(saved) >= max_num:
+                        part.unlink(missing_ok=True)
+                        return
+                    final = save_dir / (name_fn(len(saved)) + ext)
+                    part.replace(final)
+                    saved.append(final)
+                    if cfg.ingest_manifest:
+                        with open(cfg.ingest_manifest, "a") as f:
+                            f.write(f"{final.resolve()}\n")
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers={"User-Agent": USER_AGENT}) as session:
+            await asyncio.gather(*(worker(session) for _ in range(cfg.concurrency)))
+        return saved
+
+
+def fetch_urls(urls: Iterable[str], save_dir: Path, name_fn: Callable[[int], str],
+               max_num: Optional[int] = None, cfg: Optional[FetchConfig] = None) -> List[Path]:
+    """Synchronous entry point for the crawler scripts."""
+    fetcher = AsyncImageFetcher(cfg)
+    saved = asyncio.run(fetcher.fetch_all(urls, save_dir, name_fn, max_num))
+    logger.info(f"📥 Fetcher: {fetcher.stats.summary()}")
+    return saved
+
+
+# ==============================================================================
+# URL feeders
+# ==============================================================================
+def urls_from_file(path: Path) -> List[str]:
+    with open(path, "r") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def google_image_urls(query: str, max_num: int, filters: Optional[dict] = None) -> List[str]:
+    """Run icrawler's Google feeder + parser only and collect image URLs instead of downloading."""
+    from icrawler import Downloader
+    from icrawler.builtin import GoogleImageCrawler
+
+    class UrlCollector(Downloader):
+        def download(self, task, default_ext, timeout=5, max_retry=3, overwrite=False, **kwargs):
+            with self.lock:
+                self.fetched_num += 1
+                self.urls.append(task["file_url"])
+            task["success"] = True
+            task["filename"] = None
+
+    UrlCollector.urls = []
+    crawler = GoogleImageCrawler(downloader_cls=UrlCollector, storage={"root_dir": str(Path("./temp_download"))})
+    crawler.crawl(keyword=query, max_num=max_num, filters=filters or {})
+    return list(UrlCollector.urls)
+
+
+def youtube_thumbnail_urls(query: str, max_num: int, filters: Optional[dict] = None) -> List[str]:
+    from youtube_crawler.Youtube_fixed import API_KEY, YoutubeFeeder, YoutubeParser
+
+    response = YoutubeFeeder(API_KEY, query, max_results=max_num, filters=filters).feed()
+    return [f"https://i.ytimg.com/vi/{v['video_id']}/hqdefault.jpg"
+            for v in YoutubeParser().parse(response)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Async image fetcher")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--url_file", type=str, help="Text file with one URL per line")
+    src.add_argument("--query", type=str, help="Google Images query")
+    src.add_argument("--youtube_query", type=str, help="Fetch YouTube thumbnails for this query")
+    parser.add_argument("--save_dir", type=str, default="../data/raw/images")
+    parser.add_argument("--num", type=int, default=50, help="Number of images to keep")
+    parser.add_argument("--prefix", type=str, default=None, help="File name prefix")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--per_host", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=15.0)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--max_mb", type=float, default=15.0)
+    parser.add_argument("--no_head", action="store_true", help="Skip the HEAD pre-check")
+    args = parser.parse_args()
+
+    if args.url_file:
+        urls, label = urls_from_file(Path(args.url_file)), Path(args.url_file).stem
+    elif args.query:
+        # Ask for extra URLs, some are always dead or rejected
+        urls, label = google_image_urls(args.query, args.num * 2), args.query
+    else:
+        urls, label = youtube_thumbnail_urls(args.youtube_query, args.num), args.youtube_query
+
+    prefix = args.prefix or f"{time.strftime('%y%d%m_%H%M%S')}_{label.replace(' ', '_')}"
+    cfg = FetchConfig(concurrency=args.concurrency, per_host=args.per_host, timeout=args.timeout,
+                      retries=args.retries, max_bytes=int(args.max_mb * 1024 * 1024),
+                      head_check=not args.no_head)
+    saved = fetch_urls(urls, Path(args.save_dir), lambda i: f"{prefix}_{i:04d}", args.num, cfg)
+    logger.info(f"✅ Saved {len(saved)} images to {args.save_dir}")
+
+
+if __name__ == "__main__":
+    main()
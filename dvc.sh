@@ -13,54 +13,17 @@ fi
 git fetch --tags origin || true
 
 # ==============================================================================
-# Helper: get next version across local + remote for both labeled/augmented
+# Helper: version/tag dùng một lần `git ls-remote` (cache trong .git/dataset_tags.json)
 # ==============================================================================
 get_next_version() {
-  # Collect numbers from both prefixes locally
-  local local_labeled local_aug remote_labeled remote_aug
-  local_labeled=$(git tag -l "labeled_v*"   | sed -E 's/^labeled_v([0-9]+)$/\1/'   || true)
-  local_aug=$(    git tag -l "augmented_v*" | sed -E 's/^augmented_v([0-9]+)$/\1/' || true)
-
-  # Collect numbers from both prefixes remotely
-  remote_labeled=$(git ls-remote --tags origin "labeled_v*"   | awk '{print $2}' | sed -E 's@refs/tags/labeled_v([0-9]+).*@\1@'   || true)
-  remote_aug=$(    git ls-remote --tags origin "augmented_v*" | awk '{print $2}' | sed -E 's@refs/tags/augmented_v([0-9]+).*@\1@' || true)
-
-  # Merge all, keep only integers
-  all_versions=$(printf "%s\n%s\n%s\n%s\n" "$local_labeled" "$local_aug" "$remote_labeled" "$remote_aug" \
-    | grep -E '^[0-9]+$' || true)
-
-  if [[ -z "${all_versions}" ]]; then
-    echo 1
-  else
-    # next = max + 1
-    echo "$all_versions" | sort -nr | head -n1 | awk '{print $1 + 1}'
-  fi
-}
-
-# Check a tag availability both local & remote
-tag_available() {
-  local tag="$1"
-  # local exists?
-  if git show-ref --tags --quiet "refs/tags/${tag}"; then
-    return 1
-  fi
-  # remote exists?
-  if [[ $(git ls-remote --tags origin "${tag}" | wc -l) -gt 0 ]]; then
-    return 1
-  fi
-  return 0
+  python utils/dataset_version.py --refresh next-version
 }
 
 # Find a free tag name by bumping the version if needed
 find_free_tag() {
   local base_prefix="$1"  # labeled_v or augmented_v
   local v="$2"            # starting number
-  local candidate="${base_prefix}${v}"
-  while ! tag_available "${candidate}"; do
-    v=$((v + 1))
-    candidate="${base_prefix}${v}"
-  done
-  echo "${candidate}"
+  python utils/dataset_version.py free-tag "${base_prefix}" "${v}"
 }
 
 version=$(get_next_version)
@@ -73,7 +36,7 @@ created_tags=()
 # ==============================================================================
 echo "🕷️  Crawling data..."
 pushd crawler >/dev/null
-python crawler.py
+python crawler.py --plan ../data/stats/sampling_plan.json
 popd >/dev/null
 
 # ==============================================================================
@@ -82,6 +45,9 @@ popd >/dev/null
 echo "🏷️  Running 'autolabel'..."
 python auto_label/autolabel.py
 
+echo "📐 Cập nhật sampling plan (crawl quota / augment copies / drop)..."
+python processing/balance.py --dataset_dir data/labeled --output data/stats/sampling_plan.json
+
 echo "📌 DVC add labeled data..."
 dvc add data/labeled || echo "⚠️  DVC add failed hoặc không có file mới"
 
@@ -106,7 +72,7 @@ fi
 # Step 3: Augmentation stage
 # ==============================================================================
 echo "🧪 Running 'augment_data'..."
-python processing/preprocess.py
+python processing/preprocess.py --plan data/stats/sampling_plan.json
 
 echo "📌 DVC add augmented data..."
 dvc add data/processed || echo "⚠️  DVC add failed hoặc không có file mới"
@@ -130,19 +96,25 @@ if [[ $augmented_commit_done -eq 1 ]]; then
   echo "✅ Tạo tag: ${augmented_tag}"
 fi
 
+# ==============================================================================
+# Step 3b: Dataset report (đọc stats.json của stage, chỉ vẽ lại chart thay đổi)
+# ==============================================================================
+echo "📊 Cập nhật dataset report..."
+python analysis/run_analysis.py --dataset_dir data/processed --yaml data/data.yaml \
+  --output_file data/stats/statistics.json || echo "⚠️  Report failed"
+
+echo "🗂️  Cập nhật dataset index (SQLite, incremental)..."
+python analysis/dataset_index.py build --dataset_dir data/labeled data/processed \
+  --agreement_dir data/labeled/agreement || echo "⚠️  Dataset index failed"
+
 # ==============================================================================
 # Step 4: Push to DVC + Git remote
 # ==============================================================================
-echo "🔧 Config DVC remote (MinIO)..."
-dvc remote add -f -d myremote s3://data
-dvc remote modify myremote endpointurl http://0.0.0.0:9000
-dvc remote modify myremote access_key_id minioadmin
-dvc remote modify myremote secret_access_key minioadmin
-
-echo "⬆️  DVC push..."
-if ! dvc push; then
-  echo "⚠️  DVC push failed (bỏ qua, tiếp tục Git push)"
-fi
+# Remote (MinIO) được đọc từ .dvc/config, không cấu hình lại mỗi lần chạy.
+# remote_sync.py chỉ upload object chưa có trên remote, kiểm tra từng object và
+# trả về exit code != 0 nếu có lỗi -> không push tag trỏ tới dữ liệu thiếu.
+echo "⬆️  Sync data lên DVC remote..."
+python utils/remote_sync.py push data/labeled.dvc data/processed.dvc
 
 echo "⬆️  Git push main..."
 git push origin HEAD:main || echo "⚠️  Git push main failed"
@@ -1,6 +1,10 @@
+import atexit
+import json
 import logging
+import queue
+import time
 from pathlib import Path
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 
 # Tạo thư mục logs nếu chưa có
 log_dir = Path("logs")
@@ -9,19 +13,128 @@ log_dir.mkdir(exist_ok=True)
 # Tạo logger
 logger = logging.getLogger("pipeline_logger")
 logger.setLevel(logging.INFO)
+logger.propagate = False
+
+# Các field có cấu trúc được đưa vào JSON-lines (truyền qua `extra=`)
+STRUCTURED_FIELDS = ("stage", "image", "duration_ms", "status", "done", "total", "rate", "peak_rss_mb")
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line: time, level, pid, message and any structured fields."""
+
+    def format(self, record):
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "pid": record.process,
+            "msg": record.getMessage(),
+        }
+        for key in STRUCTURED_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class StageFormatter(logging.Formatter):
+    """Plain text format, prefixed with `[stage]` when the record has one."""
+
+    def format(self, record):
+        msg = super().format(record)
+        stage = getattr(record, "stage", None)
+        return f"[{stage}] {msg}" if stage else msg
+
 
 # Ghi log xoay vòng theo ngày
 file_handler = TimedRotatingFileHandler(
     log_dir / "pipeline.log", when="midnight", backupCount=7, encoding="utf-8"
 )
-file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+file_handler.setFormatter(StageFormatter("%(asctime)s - %(levelname)s - %(message)s"))
+
+# Structured records (JSON-lines), cùng chính sách xoay vòng
+json_handler = TimedRotatingFileHandler(
+    log_dir / "pipeline.jsonl", when="midnight", backupCount=7, encoding="utf-8"
+)
+json_handler.setFormatter(JsonLinesFormatter())
 
 # In log ra console
 console_handler = logging.StreamHandler()
-console_handler.setFormatter(logging.Formatter("%(message)s"))
+console_handler.setFormatter(StageFormatter("%(message)s"))
+
+# Worker chỉ đẩy record vào queue; QueueListener ghi file/console trên thread riêng,
+# nên việc emit log không bao giờ block vòng lặp xử lý ảnh.
+_log_queue = queue.Queue(-1)
+_listener = QueueListener(_log_queue, file_handler, json_handler, console_handler,
+                          respect_handler_level=True)
 
 # Tránh thêm handler nhiều lần
 if not logger.handlers:
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    logger.addHandler(QueueHandler(_log_queue))
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logger(stage: str) -> logging.LoggerAdapter:
+    """Logger gắn sẵn field `stage` cho mọi record."""
+    return StageAdapter(logger, {"stage": stage})
+
+
+class StageAdapter(logging.LoggerAdapter):
+    def process(self, msg, kwargs):
+        extra = dict(self.extra)
+        extra.update(kwargs.get("extra") or {})
+        kwargs["extra"] = extra
+        return msg, kwargs
+
+
+# ==============================================================================
+# Sampled per-item logging + aggregate progress
+# ==============================================================================
+class ProgressLogger:
+    """
+    Log một dòng cho mỗi `sample_every` item (lỗi/cảnh báo luôn được log), và một
+    dòng tổng hợp (done/total, tốc độ, số lượng theo status) mỗi `interval` giây.
+    """
+
+    def __init__(self, stage: str, total: int = None, sample_every: int = 50, interval: float = 10.0):
+        self.log = get_logger(stage)
+        self.stage = stage
+        self.total = total
+        self.sample_every = max(1, sample_every)
+        self.interval = interval
+        self.done = 0
+        self.counts = {}
+        self.start = time.perf_counter()
+        self._last = self.start
+
+    def item(self, image, status: str = "ok", duration: float = None, msg: str = None,
+             level: int = logging.INFO):
+        self.done += 1
+        self.counts[status] = self.counts.get(status, 0) + 1
+        extra = {"image": str(image), "status": status}
+        if duration is not None:
+            extra["duration_ms"] = round(duration * 1000, 1)
+        if level >= logging.WARNING or self.done % self.sample_every == 1 or self.sample_every == 1:
+            self.log.log(level, msg or f"{status}: {image}", extra=extra)
+
+        now = time.perf_counter()
+        if now - self._last >= self.interval:
+            self._last = now
+            self.progress()
+
+    def progress(self, final: bool = False):
+        from utils.memory import peak_rss_bytes
+        elapsed = time.perf_counter() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        total = f"/{self.total}" if self.total is not None else ""
+        label = "done" if final else "progress"
+        peak_mb = round(peak_rss_bytes() / (1 << 20), 1)
+        self.log.info(f"{label}: {self.done}{total} items, {rate:.1f} items/s, {self.counts}, "
+                      f"peak RSS {peak_mb} MB",
+                      extra={"done": self.done, "total": self.total, "rate": round(rate, 2),
+                             "peak_rss_mb": peak_mb})
 
+    def close(self):
+        self.progress(final=True)
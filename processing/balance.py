@@ -0,0 +1,290 @@
+"""
+balance.py
+--------------------------------------------------------------------
+Class-balanced sampling plan computed from the dataset statistics.
+
+The planner reads the stats manifest (`data/labeled/stats.json`, per-class
+object and image counts for every split) and the train labels, which are
+loaded once into an (images x classes) count matrix. Everything else is
+array arithmetic over that matrix:
+
+- repeat factors : LVIS-style r_c = max(1, sqrt(t / f_c)) where f_c is the
+                   fraction of train images containing class c; an image gets
+                   the largest r_c of the classes it contains
+- augmentation   : copies per source image = stochastic rounding of r_i,
+                   capped by `max_copies` (1 copy = the current behaviour)
+- drops          : single-class images of classes still above
+                   `max_ratio` x the rarest class after augmentation, in a
+                   random order, until the excess is gone or `max_drop` of
+                   the split is dropped
+
+The random draws (rounding, drop order) come from a hash of each image's stem
+and the seed, like `autolabel.hash_split`: adding images to the split leaves
+the plan of the existing ones alone, so preprocess does not rebuild them.
+- crawl quotas   : images to crawl per class query so every class reaches
+                   the largest class, from its objects/image ratio, expected
+                   augmentation copies and the labeling yield of a crawl
+
+The plan is written as JSON (default `data/stats/sampling_plan.json`) and
+read by `crawler.py --plan` and `preprocess.py --plan`. The plan covers the
+whole train split, so preprocess also brings outputs of earlier runs in line
+with it (missing `_augN` copies added, extra copies and dropped images removed).
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from logs.log import get_logger
+from utils.safe_io import atomic_write
+
+log = get_logger("balance")
+
+PLAN_VERSION = 1
+IMAGE_EXTS = (".jpg", ".png")
+DEFAULT_PLAN = "data/stats/sampling_plan.json"
+
+
+# ==============================================================================
+# Inputs
+# ==============================================================================
+def load_class_names(yaml_path: Path) -> dict:
+    with open(yaml_path, "r") as f:
+        names = yaml.safe_load(f)["names"]
+    return {int(k): v for k, v in names.items()} if isinstance(names, dict) else dict(enumerate(names))
+
+
+def load_label_matrix(image_dir: Path, label_dir: Path, n_classes: int):
+    """Image stems and an (images x classes) object count matrix for one split."""
+    with os.scandir(image_dir) as it:
+        stems = sorted(os.path.splitext(e.name)[0] for e in it
+                       if e.is_file() and e.name.lower().endswith(IMAGE_EXTS) and not e.name.startswith("."))
+
+    img_idx, cls_idx = [], []
+    for i, stem in enumerate(stems):
+        try:
+            with open(label_dir / (stem + ".txt"), "r") as f:
+                ids = [int(line.split(None, 1)[0]) for line in f if len(line.split()) >= 5]
+        except FileNotFoundError:
+            continue
+        img_idx.extend([i] * len(ids))
+        cls_idx.extend(ids)
+
+    img_idx = np.asarray(img_idx, dtype=np.int64)
+    cls_idx = np.asarray(cls_idx, dtype=np.int64)
+    valid = (cls_idx >= 0) & (cls_idx < n_classes)
+    flat = np.bincount(img_idx[valid] * n_classes + cls_idx[valid], minlength=len(stems) * n_classes)
+    return stems, flat.reshape(len(stems), n_classes).astype(np.int32)
+
+
+def load_stats_totals(stats_path: Path, n_classes: int):
+    """Per-class object and image totals over all splits of the stats manifest."""
+    objects = np.zeros(n_classes, dtype=np.int64)
+    images = np.zeros(n_classes, dtype=np.int64)
+    if not stats_path.exists():
+        return objects, images, False
+    with open(stats_path, "r") as f:
+        stats = json.load(f)
+    has_images = True
+    for split in stats.values():
+        for k, v in split.get("objets_per_class", {}).items():
+            if 0 <= int(k) < n_classes:
+                objects[int(k)] += v
+        if "images_per_class" not in split:
+            has_images = False
+        for k, v in split.get("images_per_class", {}).items():
+            if 0 <= int(k) < n_classes:
+                images[int(k)] += v
+    return objects, images, has_images
+
+
+# ==============================================================================
+# Plan
+# ==============================================================================
+def repeat_factors(counts: np.ndarray, threshold: float):
+    """(per-class r_c, per-image r_i) from an (images x classes) count matrix."""
+    present = counts > 0
+    freq = present.mean(axis=0) if len(counts) else np.zeros(counts.shape[1])
+    with np.errstate(divide="ignore"):
+        r_class = np.where(freq > 0, np.maximum(1.0, np.sqrt(threshold / freq)), 1.0)
+    r_image = np.where(present, r_class[None, :], 1.0).max(axis=1) if len(counts) else np.zeros(0)
+    return r_class, r_image
+
+
+def stem_uniform(stems, seed: int, salt: str) -> np.ndarray:
+    """Per-image value in [0, 1) from a hash of the stem: stable when other images come and go."""
+    return np.array([int(hashlib.md5(f"{seed}:{salt}:{stem}".encode()).hexdigest()[:8], 16) / 0x100000000
+                     for stem in stems], dtype=np.float64)
+
+
+def plan_copies(r_image: np.ndarray, max_copies: int, u: np.ndarray) -> np.ndarray:
+    """Stochastic rounding of r_i with per-image draws `u`: E[copies_i] = r_i (before the cap)."""
+    base = np.floor(r_image)
+    copies = base + (u < (r_image - base))
+    return np.clip(copies, 1, max_copies).astype(np.int32)
+
+
+def plan_drops(counts: np.ndarray, copies: np.ndarray, max_ratio: float, max_drop: float,
+               priority: np.ndarray) -> np.ndarray:
+    """
+    Boolean drop mask over images; only single-class images of over-represented
+    classes go, and at most `max_drop` of all images.
+    """
+    contrib = counts * (1 + copies)[:, None]  # objects an image brings after augmentation
+    expected = contrib.sum(axis=0)
+    nonzero = expected[expected > 0]
+    drop = np.zeros(len(counts), dtype=bool)
+    if len(nonzero) < 2:
+        return drop
+    cap = max_ratio * nonzero.min()
+    single = (counts > 0).sum(axis=1) == 1
+    order = np.argsort(priority, kind="stable")
+    budget = int(max_drop * len(counts))
+
+    # Class dư nhiều nhất được drop trước
+    over = np.flatnonzero(expected > cap)
+    for c in over[np.argsort(-(expected[over] - cap))]:
+        excess = expected[c] - cap
+        cand = order[single[order] & (counts[order, c] > 0)]
+        removed = np.cumsum(contrib[cand, c])
+        n = min(int(np.searchsorted(removed, excess, side="right")), budget)
+        drop[cand[:n]] = True
+        budget -= n
+    return drop
+
+
+def plan_crawl(expected: np.ndarray, objects: np.ndarray, images: np.ndarray, r_class: np.ndarray,
+               crawl_yield: float, max_per_query: int) -> np.ndarray:
+    """Images to crawl per class so each class reaches the largest one."""
+    per_image = np.where(images > 0, objects / np.maximum(images, 1), 1.0)
+    gain = per_image * (1 + r_class) * crawl_yield  # objects one crawled image ends up as
+    deficit = np.maximum(expected.max() - expected, 0)
+    quota = np.ceil(deficit / np.maximum(gain, 1e-6)).astype(np.int64)
+    return np.minimum(quota, max_per_query)
+
+
+def build_plan(image_dir: Path, label_dir: Path, stats_path: Path, class_names: dict,
+               queries: dict = None, threshold: float = 0.3, max_copies: int = 4,
+               max_ratio: float = 3.0, max_drop: float = 0.25, crawl_yield: float = 0.6,
+               max_per_query: int = 200, seed: int = 0) -> dict:
+    n_classes = max(class_names) + 1
+
+    stems, counts = load_label_matrix(image_dir, label_dir, n_classes)
+    r_class, r_image = repeat_factors(counts, threshold)
+    copies = plan_copies(r_image, max_copies, stem_uniform(stems, seed, "copies"))
+    drop = plan_drops(counts, copies, max_ratio, max_drop, stem_uniform(stems, seed, "drop"))
+
+    kept = ~drop
+    expected = (counts[kept] * (1 + copies[kept])[:, None]).sum(axis=0)
+    objects, images, has_images = load_stats_totals(stats_path, n_classes)
+    if not objects.any():
+        objects = counts.sum(axis=0)
+    if not has_images:
+        images = (counts > 0).sum(axis=0)
+    quota = plan_crawl(expected, objects, images, r_class, crawl_yield, max_per_query)
+
+    queries = queries or {}
+    classes, crawl = {}, {}
+    for c, name in sorted(class_names.items()):
+        classes[name] = {
+            "objects": int(objects[c]),
+            "images": int(images[c]),
+            "train_objects": int(counts[:, c].sum()),
+            "repeat_factor": round(float(r_class[c]), 3),
+            "expected_train_objects": int(expected[c]),
+            "dropped_images": int((drop & (counts[:, c] > 0)).sum()),
+            "crawl": int(quota[c]),
+        }
+        if quota[c] > 0:
+            query = queries.get(name, name)
+            crawl[query] = crawl.get(query, 0) + int(quota[c])
+
+    return {
+        "version": PLAN_VERSION,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "source": {"image_dir": str(image_dir), "label_dir": str(label_dir), "stats": str(stats_path)},
+        "params": {"threshold": threshold, "max_copies": max_copies, "max_ratio": max_ratio,
+                   "max_drop": max_drop,
+                   "crawl_yield": crawl_yield, "max_per_query": max_per_query, "seed": seed},
+        "classes": classes,
+        "crawl": crawl,
+        "default_copies": 1,
+        "augment": {stem: int(n) for stem, n, d in zip(stems, copies, drop) if n != 1 and not d},
+        "drop": [stem for stem, d in zip(stems, drop) if d],
+    }
+
+
+def load_plan(path) -> dict:
+    """Plan file written by this module, or None when it does not exist."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, "r") as f:
+        plan = json.load(f)
+    if plan.get("version") != PLAN_VERSION:
+        log.warning(f"{path}: plan version {plan.get('version')} != {PLAN_VERSION}, bỏ qua")
+        return None
+    return plan
+
+
+def save_plan(plan: dict, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_write(path) as f:
+        json.dump(plan, f, indent=2)
+
+
+def main():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Class-balanced sampling plan (crawl quotas, augment copies, drops)")
+    parser.add_argument("--dataset_dir", type=str, default="data/labeled", help="Labeled dataset (splits + stats.json)")
+    parser.add_argument("--split", type=str, default="train", help="Split được oversample / drop")
+    parser.add_argument("--yaml", type=str, default="data/data.yaml", help="Class names")
+    parser.add_argument("--output", type=str, default=DEFAULT_PLAN, help="Plan file")
+    parser.add_argument("--queries", type=str, default=None,
+                        help="Query crawl cho từng class, vd: apple=red apple,banana=banana fruit")
+    parser.add_argument("--threshold", type=float, default=0.3,
+                        help="Repeat-factor threshold t (class có tần suất ảnh < t được oversample)")
+    parser.add_argument("--max_copies", type=int, default=4, help="Số bản augment tối đa mỗi ảnh")
+    parser.add_argument("--max_ratio", type=float, default=3.0,
+                        help="Tỉ lệ tối đa giữa class lớn nhất và nhỏ nhất trước khi drop ảnh")
+    parser.add_argument("--max_drop", type=float, default=0.25,
+                        help="Tỉ lệ ảnh tối đa của split được drop")
+    parser.add_argument("--crawl_yield", type=float, default=0.6,
+                        help="Tỉ lệ ảnh crawl về được giữ lại sau auto-label")
+    parser.add_argument("--max_per_query", type=int, default=200, help="Quota crawl tối đa mỗi query")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    dataset_dir = Path(args.dataset_dir)
+    image_dir = dataset_dir / args.split / "images"
+    if not image_dir.exists():
+        log.info(f"Không có {image_dir}, chưa lập plan")
+        return
+    queries = dict(q.split("=", 1) for q in args.queries.split(",")) if args.queries else None
+
+    t0 = time.perf_counter()
+    plan = build_plan(image_dir, dataset_dir / args.split / "labels", dataset_dir / "stats.json",
+                      load_class_names(Path(args.yaml)), queries, args.threshold, args.max_copies,
+                      args.max_ratio, args.max_drop, args.crawl_yield, args.max_per_query, args.seed)
+    save_plan(plan, args.output)
+
+    log.info(f"📐 Sampling plan ({time.perf_counter() - t0:.2f}s) -> {args.output}")
+    for name, c in plan["classes"].items():
+        log.info(f"  {name:<12} objects={c['objects']:<6} r={c['repeat_factor']:<6} "
+                 f"train {c['train_objects']} -> {c['expected_train_objects']}  "
+                 f"drop={c['dropped_images']}  crawl={c['crawl']}")
+    log.info(f"  augment: {len(plan['augment'])} ảnh khác mặc định, drop: {len(plan['drop'])} ảnh, "
+             f"crawl: {plan['crawl']}")
+
+
+if __name__ == "__main__":
+    main()
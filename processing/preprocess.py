@@ -1,20 +1,32 @@
-import cv2
 from pathlib import Path
-import albumentations as A
-from albumentations.augmentations.dropout.coarse_dropout import CoarseDropout
-import shutil
 import sys
 import os
 import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from analysis.stats import analyze_split
+from logs.log import ProgressLogger, get_logger
+from utils.memory import MemoryBudget, image_nbytes, iter_images, parse_size
+from utils.safe_io import RunJournal, atomic_copytree, atomic_imwrite, atomic_write, clean_temp_files
+
+log = get_logger("augment")
+
+# cv2/albumentations được import khi thật sự xử lý ảnh, để `--help` và lần chạy
+# không có ảnh mới không phải trả chi phí import.
+_AUG_PIPELINE = None
+# Bộ nhớ một ảnh chiếm khi xử lý, tính theo kích thước ảnh decode: ảnh gốc
+# + một bản augment + buffer encode / bản tạm của albumentations.
+IN_FLIGHT_FACTOR = 3
 
 def load_image(img_path):
+    import cv2
     img = cv2.imread(str(img_path))
     if img is None:
         raise FileNotFoundError(f"Cannot load image {img_path}")
-    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=img)  # in-place, không cấp phát bản thứ hai
 
 def load_label(label_path):
     labels = []
@@ -31,7 +43,7 @@ def load_label(label_path):
     return labels
 
 def save_label(labels, save_path):
-    with open(save_path, 'w') as f:
+    with atomic_write(save_path) as f:
         for label in labels:
             f.write(' '.join(map(str, label)) + '\n')
 
@@ -63,7 +75,13 @@ def bbox_to_yolo(bbox, img_width, img_height):
     return [int(cls_id), x_c, y_c, w, h]
 
 def get_augmentation_pipeline():
-    return A.Compose([
+    global _AUG_PIPELINE
+    if _AUG_PIPELINE is not None:
+        return _AUG_PIPELINE
+    import albumentations as A
+    from albumentations.augmentations.dropout.coarse_dropout import CoarseDropout
+
+    _AUG_PIPELINE = A.Compose([
         A.HorizontalFlip(p=0.5),
         A.Rotate(limit=30, p=0.5),
         A.RandomBrightnessContrast(brightness_limit=0.2, contrast_limit=0.2, p=0.5),
@@ -76,65 +94,90 @@ def get_augmentation_pipeline():
             fill_value=0, p=0.3
         )
     ], bbox_params=A.BboxParams(format='pascal_voc', label_fields=['category_ids']))
+    return _AUG_PIPELINE
 
-def preprocess_image_and_label(img_path, label_path, output_images_dir, output_labels_dir):
+def aug_suffix(k):
+    """Tên bản augment thứ k: `_aug`, `_aug2`, `_aug3`, ..."""
+    return "_aug" if k == 0 else f"_aug{k + 1}"
+
+def preprocess_image_and_label(img_path, label_path, output_images_dir, output_labels_dir, copies=1, first=0):
+    import cv2
     img = load_image(img_path)
-    height, width = img.shape[:2]
     labels = load_label(label_path)
     labels = check_and_fix_labels(labels)
+    # first > 0: ảnh gốc đã có trong output từ run trước, chỉ tạo thêm bản augment first..copies-1
+    if first > 0:
+        if not labels:
+            return False
+        return _augment_copies(img, labels, img_path, output_images_dir, output_labels_dir, first, copies)
 
-    # Lưu ảnh gốc và nhãn gốc vào output
+    # Ảnh gốc trong output là "commit point" (run sau skip theo stem của nó), nên được
+    # ghi cuối cùng, sau ảnh/nhãn augment và nhãn gốc; mọi file đều ghi atomic.
     out_img_path = output_images_dir / img_path.name
     out_label_path = output_labels_dir / (img_path.stem + '.txt')
 
-    # Chuyển ảnh RGB sang BGR trước khi lưu với cv2
-    cv2.imwrite(str(out_img_path), cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
-    save_label(labels, out_label_path)
+    def save_original():
+        save_label(labels, out_label_path)
+        # Chuyển ảnh RGB sang BGR (in-place, img không còn dùng sau đó) trước khi lưu với cv2
+        atomic_imwrite(out_img_path, cv2.cvtColor(img, cv2.COLOR_RGB2BGR, dst=img))
 
     # Nếu không có nhãn hợp lệ, không augment thêm nữa
     if len(labels) == 0:
+        save_original()
         return False
 
+    _augment_copies(img, labels, img_path, output_images_dir, output_labels_dir, 0, copies)
+    save_original()
+
+    return True
+
+def _augment_copies(img, labels, img_path, output_images_dir, output_labels_dir, first, copies):
+    import cv2
+    height, width = img.shape[:2]
+
     # Chuẩn bị bbox để augment
     bboxes = [yolo_to_bbox(lab, width, height) for lab in labels]
     category_ids = [b[-1] for b in bboxes]
     for b in bboxes:
         b.pop()  # Loại bỏ class_id trước khi augment
 
-    # Augmentation
+    # Augmentation: bản first..copies-1 (theo sampling plan), bản đầu giữ tên `_aug` như trước.
+    # Ghi theo thứ tự nên bản có sẵn luôn là một dãy liên tục `_aug`, `_aug2`, ...
     aug = get_augmentation_pipeline()
-    augmented = aug(image=img, bboxes=bboxes, category_ids=category_ids)
-    img_aug = cv2.cvtColor(augmented['image'], cv2.COLOR_RGB2BGR)
-    aug_bboxes = augmented['bboxes']
-    aug_labels = [bbox_to_yolo(list(b) + [cat], width, height)
-                  for b, cat in zip(aug_bboxes, augmented['category_ids'])]
-
-    # Lưu ảnh augment và nhãn augment
-    aug_img_name = img_path.stem + "_aug" + img_path.suffix
-    aug_lbl_name = img_path.stem + "_aug.txt"
-    aug_img_out = output_images_dir / aug_img_name
-    aug_lbl_out = output_labels_dir / aug_lbl_name
-    cv2.imwrite(str(aug_img_out), img_aug)
-    save_label(aug_labels, aug_lbl_out)
+    for k in range(first, copies):
+        augmented = aug(image=img, bboxes=bboxes, category_ids=category_ids)
+        img_aug = cv2.cvtColor(augmented.pop('image'), cv2.COLOR_RGB2BGR)
+        aug_bboxes = augmented['bboxes']
+        aug_labels = [bbox_to_yolo(list(b) + [cat], width, height)
+                      for b, cat in zip(aug_bboxes, augmented['category_ids'])]
 
+        # Lưu ảnh augment và nhãn augment
+        aug_img_out = output_images_dir / (img_path.stem + aug_suffix(k) + img_path.suffix)
+        aug_lbl_out = output_labels_dir / (img_path.stem + aug_suffix(k) + ".txt")
+        save_label(aug_labels, aug_lbl_out)
+        atomic_imwrite(aug_img_out, img_aug)
+        del img_aug  # chỉ giữ một bản augment trong bộ nhớ tại một thời điểm
     return True
 
-def get_all_stems(images_dir, exts=['.png', '.jpg']):
-    stems = set()
-    for ext in exts:
-        for f in images_dir.glob(f'*{ext}'):
-            stems.add(f.stem)
-    return stems
-
-if __name__ == "__main__":
+def build_parser():
     from argparse import ArgumentParser
 
     parser = ArgumentParser()
     parser.add_argument('--image_dir', type=str, default='data/labeled/train/images', help="Input image folder")
     parser.add_argument('--label_dir', type=str, default='data/labeled/train/labels', help="Input label folder")
     parser.add_argument('--output_dir', type=str, default='data/processed', help="Output base directory")
-    args = parser.parse_args()
+    parser.add_argument('--plan', type=str, default=None,
+                        help="Sampling plan (processing/balance.py): số bản augment mỗi ảnh, ảnh bị drop")
+    parser.add_argument('--exclude', type=str, default=None,
+                        help="Exclude list của processing/prune.py: file output bị xoá và không tạo lại")
+    parser.add_argument('--memory_budget', type=str, default='1G',
+                        help="Bộ nhớ tối đa cho ảnh đang xử lý (vd: 512M, 2G), giới hạn số ảnh in-flight")
+    parser.add_argument('--workers', type=int, default=1, help="Số thread augment song song")
+    parser.add_argument('--worker', action='store_true',
+                        help="Send the job to the warm worker (utils/warm_worker.py) if it is running")
+    return parser
 
+def run(args):
     input_images_dir = Path(args.image_dir)
     input_labels_dir = Path(args.label_dir)
     output_base_dir = Path(args.output_dir)
@@ -144,56 +187,161 @@ if __name__ == "__main__":
 
     output_images_dir.mkdir(parents=True, exist_ok=True)
     output_labels_dir.mkdir(parents=True, exist_ok=True)
+    clean_temp_files(output_images_dir)
+    clean_temp_files(output_labels_dir)
+    journal = RunJournal(output_base_dir / ".journal" / "augment.jsonl", "augment")
 
-    # Lấy tất cả các stem (tên file không đuôi) trong output_images_dir (bao gồm ảnh gốc và ảnh augment)
-    output_stems = get_all_stems(output_images_dir, exts=['.png', '.jpg'])
+    done = set(journal.keys("done")) if journal.resumed else set()
 
-    # Lọc ảnh input: chỉ augment nếu ảnh đó chưa tồn tại trong output (theo stem)
-    img_files = [
-        f for f in list(input_images_dir.glob('*.jpg')) + list(input_images_dir.glob('*.png'))
-        if f.stem not in output_stems
-    ]
+    # Sampling plan (tuỳ chọn): ảnh bị drop không vào processed, ảnh class hiếm được augment nhiều bản
+    copies, drop, plan = {}, set(), None
+    if args.plan:
+        from processing.balance import load_plan
+        plan = load_plan(args.plan)
+        if plan is not None:
+            copies, drop = plan["augment"], set(plan["drop"])
+            log.info(f"📐 Plan {args.plan}: {len(copies)} ảnh augment khác mặc định, {len(drop)} ảnh drop")
+    default_copies = plan["default_copies"] if plan else 1
 
+    # Exclude list (processing/prune.py): file đã bị prune khỏi processed. Chúng bị xoá khỏi
+    # output và được tính như đã có, nên không bao giờ được augment / tạo lại.
+    exclude = set()
+    if args.exclude:
+        from processing.prune import load_selection
+        exclude = set(load_selection(Path(args.exclude)))
+        log.info(f"✂️  Exclude list {args.exclude}: {len(exclude)} file")
+
+    def remove_output(stem, suffix, ext):
+        # Ảnh trước, nhãn sau: không bao giờ còn ảnh trong train mà thiếu nhãn
+        (output_images_dir / (stem + suffix + ext)).unlink(missing_ok=True)
+        (output_labels_dir / (stem + suffix + ".txt")).unlink(missing_ok=True)
+
+    # Plan được lập trên toàn bộ train của labeled, nên output của các run trước cũng được
+    # đối chiếu: ảnh drop bị xoá khỏi processed, bản augment thừa bị xoá, bản thiếu được tạo thêm
+    reconciled = {"dropped": 0, "trimmed": 0, "topped_up": 0, "excluded": 0}
+    out_names = set(os.listdir(output_images_dir)) if plan is not None or exclude else set()
+    for name in sorted(exclude & out_names):
+        remove_output(Path(name).stem, "", Path(name).suffix)
+        reconciled["excluded"] += 1
+    present = out_names | exclude
+
+    def reconcile(f):
+        """Index của bản augment đầu tiên cần tạo thêm cho ảnh đã có trong output, hoặc None."""
+        have = 0
+        while f.stem + aug_suffix(have) + f.suffix in present:
+            have += 1
+        if f.stem in drop:
+            for k in reversed(range(have)):  # bản cao nhất trước, run bị ngắt vẫn đếm đúng dãy còn lại
+                remove_output(f.stem, aug_suffix(k), f.suffix)
+            remove_output(f.stem, "", f.suffix)
+            reconciled["dropped"] += 1
+            return None
+        wanted = copies.get(f.stem, default_copies)
+        if have > wanted:
+            for k in reversed(range(wanted, have)):
+                remove_output(f.stem, aug_suffix(k), f.suffix)
+            reconciled["trimmed"] += have - wanted
+        elif have < wanted and load_label(output_labels_dir / (f.stem + '.txt')):
+            reconciled["topped_up"] += 1
+            return have
+        return None
+
+    def work_items():
+        # Lazy, theo thứ tự os.scandir: ảnh chưa có trong output được augment đầy đủ (first=0)
+        for f in iter_images(input_images_dir):
+            if f.name in present:
+                first = reconcile(f) if plan is not None else None
+                if first is not None:
+                    yield f, first
+            elif f.stem not in drop and f.stem not in done and not (output_images_dir / f.name).exists():
+                yield f, 0
+
+    # Mỗi ảnh giữ trước IN_FLIGHT_FACTOR x kích thước decode (đọc từ header) của budget
+    # cho tới khi xử lý xong, nên số ảnh in-flight tự co lại khi ảnh lớn.
+    budget = MemoryBudget(parse_size(args.memory_budget))
     count = 0
-    for img_path in img_files:
-        label_path = input_labels_dir / (img_path.stem + '.txt')
+    progress = ProgressLogger("augment")
+
+    def process(img_path, first):
+        t0 = time.perf_counter()
+        saved = preprocess_image_and_label(img_path, input_labels_dir / (img_path.stem + '.txt'),
+                                           output_images_dir, output_labels_dir,
+                                           copies=copies.get(img_path.stem, default_copies), first=first)
+        return saved, time.perf_counter() - t0
 
+    def finish(img_path, future):
+        # Chạy ở thread chính: journal và progress không cần lock
+        nonlocal count
         try:
-            saved = preprocess_image_and_label(img_path, label_path, output_images_dir, output_labels_dir)
-            if saved:
-                count += 1
-                print(f"[✓] Saved augmented: {img_path.name}")
-            else:
-                print(f"[!] No valid labels for {img_path.name}, skipped augmentation.")
+            saved, duration = future.result()
         except Exception as e:
-            print(f"[!] Error processing {img_path.name}: {e}")
+            progress.item(img_path.name, "error", msg=f"Error processing {img_path.name}: {e}",
+                          level=logging.ERROR)
+            return
+        journal.record(img_path.stem, "done", augmented=saved)
+        if saved:
+            count += 1
+            progress.item(img_path.name, "augmented", duration)
+        else:
+            progress.item(img_path.name, "no_labels", duration,
+                          msg=f"No valid labels for {img_path.name}, skipped augmentation.")
+
+    pending = []
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        for img_path, first in work_items():
+            nbytes = image_nbytes(img_path) * IN_FLIGHT_FACTOR
+            budget.acquire(nbytes)
+            future = pool.submit(process, img_path, first)
+            future.add_done_callback(lambda _, n=nbytes: budget.release(n))
+            pending.append((img_path, future))
+            for item in [p for p in pending if p[1].done()]:
+                pending.remove(item)
+                finish(*item)
+        for item in pending:
+            finish(*item)
 
-    print(f"\n✅ Total processed and saved images: {count}")
+    progress.close()
+    log.info(f"✅ Total processed and saved images: {count}, "
+             f"peak in-flight {budget.peak / (1 << 20):.0f} MB / budget {budget.budget / (1 << 20):.0f} MB")
+    if plan is not None:
+        log.info(f"📐 Đối chiếu output với plan: {reconciled['dropped']} ảnh drop đã xoá, "
+                 f"{reconciled['trimmed']} bản augment thừa đã xoá, "
+                 f"{reconciled['topped_up']} ảnh được thêm bản augment")
+    if exclude:
+        log.info(f"✂️  {reconciled['excluded']} file trong exclude list đã xoá khỏi output")
 
     # Copy val và test từ labeled sang processed (nếu có)
     for split in ['val', 'test']:
         src = Path('data/labeled') / split
         dst = output_base_dir / split
         if src.exists():
-            if dst.exists():
-                shutil.rmtree(dst)
-            shutil.copytree(src, dst)
-            print(f"[✓] Copied {split} from {src} to {dst}")
+            atomic_copytree(src, dst)
+            log.info(f"Copied {split} from {src} to {dst}")
         else:
-            print(f"[!] Warning: Source folder {src} does not exist. Skipping copy for {split}")
+            log.warning(f"Source folder {src} does not exist. Skipping copy for {split}")
     
-    print("\n📊 Phân tích dữ liệu sau augmentation:")
+    log.info("📊 Phân tích dữ liệu sau augmentation:")
     all_stats = {}
     for split in ['train', 'val', 'test']:
         stats = analyze_split(output_base_dir, split)
         if stats:
-            print(f"\n📂 Stats cho {split.upper()}:")
-            for k, v in stats.items():
-                print(f"  {k}: {v}")
+            log.info(f"📂 Stats cho {split.upper()}: {stats}")
             all_stats[split] = stats
 
     # Ghi lại thống kê ra file JSON
     stats_path = output_base_dir / "stats.json"
-    with open(stats_path, "w") as f:
+    with atomic_write(stats_path) as f:
         json.dump(all_stats, f, indent=2)
-    print(f"\n✅ Đã lưu thống kê vào: {stats_path}")
+    log.info(f"✅ Đã lưu thống kê vào: {stats_path}")
+    journal.finish()
+
+def main():
+    args = build_parser().parse_args()
+    if args.worker:
+        from utils.warm_worker import submit_job
+        if submit_job("augment", sys.argv[1:]):
+            return
+    run(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+prune.py
+--------------------------------------------------------------------
+Embedding-based pruning of redundant training images.
+
+Every image in `image_dir` is reduced to a compact embedding (either a cheap
+CPU descriptor built with OpenCV, or the pooled YOLO backbone features used by
+`auto_label`). Embeddings are appended to a float16 matrix on disk and read
+back through `np.memmap`, so re-running after a new crawl only embeds the
+images that are not in the store yet; the store is keyed on the backend and,
+for YOLO, a hash of the weights. A greedy k-center (farthest-point) coreset
+then picks a subset that covers the embedding space.
+
+Nothing is moved: the names outside the coreset are added to an exclude list
+(`<store_dir>/pruned.txt`), which `preprocess.py --exclude` reads to delete
+those outputs and never generate them again. Images that could not be
+embedded are always kept.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from logs.log import get_logger
+
+log = get_logger("prune")
+
+IMAGE_EXTS = (".jpg", ".png")
+
+
+# ==============================================================================
+# Descriptors
+# ==============================================================================
+def cpu_descriptor(img_path: Path, thumb_size: int = 16, hsv_bins=(8, 8, 4)) -> np.ndarray:
+    """Gray thumbnail + HSV colour histogram, L2-normalised."""
+    import cv2
+    img = cv2.imread(str(img_path))
+    if img is None:
+        raise FileNotFoundError(f"Cannot load image {img_path}")
+
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    thumb = cv2.resize(gray, (thumb_size, thumb_size), interpolation=cv2.INTER_AREA)
+    thumb = thumb.astype(np.float32).ravel()
+    thumb -= thumb.mean()
+    thumb /= (np.linalg.norm(thumb) + 1e-6)
+
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1, 2], None, list(hsv_bins), [0, 180, 0, 256, 0, 256])
+    hist = hist.astype(np.float32).ravel()
+    hist /= (np.linalg.norm(hist) + 1e-6)
+
+    vec = np.concatenate([thumb, hist])
+    return vec / (np.linalg.norm(vec) + 1e-6)
+
+
+def make_yolo_descriptor(model_path: str = "yolov8x.pt"):
+    """Return a descriptor function backed by the YOLO backbone (pooled features)."""
+    from ultralytics import YOLO
+
+    model = YOLO(model_path)
+
+    def _descriptor(img_path: Path) -> np.ndarray:
+        vec = model.embed(str(img_path), verbose=False)[0]
+        vec = vec.detach().cpu().numpy().astype(np.float32).ravel()
+        return vec / (np.linalg.norm(vec) + 1e-6)
+
+    return _descriptor
+
+
+# ==============================================================================
+# Embedding store (float16 memmap + json index)
+# ==============================================================================
+class EmbeddingStore:
+    """
+    Append-only embedding matrix stored as raw float16 rows in `embeddings.f16`,
+    with the row -> image name mapping in `index.json`.
+    """
+
+    def __init__(self, store_dir: Path, backend: str):
+        # `backend`: descriptor key, e.g. "cpu" or "yolo:<md5 of weights>" (see `descriptor_key`)
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.matrix_path = self.store_dir / "embeddings.f16"
+        self.index_path = self.store_dir / "index.json"
+        self.backend = backend
+        self.names = []
+        self.dim = None
+
+        if self.index_path.exists():
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            if index.get("backend") != backend:
+                raise ValueError(
+                    f"Store {self.store_dir} was built with backend '{index.get('backend')}', "
+                    f"not '{backend}'. Use another --store_dir."
+                )
+            self.names = index["names"]
+            self.dim = index["dim"]
+            # Truncate rows that were written after the last index save (crash mid-run)
+            expected = len(self.names) * self.dim * 2
+            if self.matrix_path.exists() and self.matrix_path.stat().st_size > expected:
+                with open(self.matrix_path, "r+b") as f:
+                    f.truncate(expected)
+
+    def __len__(self):
+        return len(self.names)
+
+    def missing(self, names):
+        known = set(self.names)
+        return [n for n in names if n not in known]
+
+    def append(self, names, vectors: np.ndarray):
+        if len(names) == 0:
+            return
+        vectors = np.asarray(vectors, dtype=np.float16)
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dim {vectors.shape[1]} != store dim {self.dim}")
+
+        with open(self.matrix_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors).tobytes())
+        self.names.extend(names)
+        self._save_index()
+
+    def matrix(self) -> np.ndarray:
+        if not self.names:
+            return np.zeros((0, self.dim or 0), dtype=np.float16)
+        return np.memmap(self.matrix_path, dtype=np.float16, mode="r",
+                         shape=(len(self.names), self.dim))
+
+    def _save_index(self):
+        tmp = self.index_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"backend": self.backend, "dim": self.dim, "names": self.names}, f)
+        tmp.replace(self.index_path)
+
+
+def update_store(store: EmbeddingStore, image_paths, descriptor, flush_every: int = 256):
+    """Embed only images not yet in the store. Returns number of new embeddings."""
+    by_name = {p.name: p for p in image_paths}
+    todo = store.missing(sorted(by_name))
+    log.info(f"{len(store)} embeddings cached, {len(todo)} new images to embed")
+
+    buf_names, buf_vecs = [], []
+    added = 0
+    for name in todo:
+        try:
+            vec = descriptor(by_name[name])
+        except Exception as e:
+            log.warning(f"Error embedding {name}: {e}")
+            continue
+        buf_names.append(name)
+        buf_vecs.append(vec)
+        if len(buf_names) >= flush_every:
+            store.append(buf_names, np.stack(buf_vecs))
+            added += len(buf_names)
+            buf_names, buf_vecs = [], []
+
+    if buf_names:
+        store.append(buf_names, np.stack(buf_vecs))
+        added += len(buf_names)
+    return added
+
+
+# ==============================================================================
+# k-center coreset
+# ==============================================================================
+def _sq_dist_to(emb: np.ndarray, center: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    out = np.empty(len(emb), dtype=np.float32)
+    for start in range(0, len(emb), chunk):
+        block = emb[start:start + chunk].astype(np.float32)
+        diff = block - center
+        out[start:start + chunk] = np.einsum("ij,ij->i", diff, diff)
+    return out
+
+
+def k_center_greedy(emb: np.ndarray, k: int, initial=None, seed: int = 0):
+    """
+    Greedy farthest-point selection. `initial` are row indices that are already
+    selected (e.g. the coreset from a previous run) and act as fixed centers.
+    Returns the list of selected indices (initial first) and the covering radius.
+    """
+    n = len(emb)
+    if n == 0 or k <= 0:
+        return [], 0.0
+    k = min(k, n)
+
+    selected = list(dict.fromkeys(int(i) for i in (initial or []) if 0 <= int(i) < n))
+    min_dist = np.full(n, np.inf, dtype=np.float32)
+    for idx in selected:
+        np.minimum(min_dist, _sq_dist_to(emb, emb[idx].astype(np.float32)), out=min_dist)
+
+    if not selected:
+        first = int(np.random.default_rng(seed).integers(n))
+        selected.append(first)
+        min_dist = _sq_dist_to(emb, emb[first].astype(np.float32))
+
+    while len(selected) < k:
+        nxt = int(np.argmax(min_dist))
+        if min_dist[nxt] <= 0:
+            break  # everything left is an exact duplicate of a center
+        selected.append(nxt)
+        np.minimum(min_dist, _sq_dist_to(emb, emb[nxt].astype(np.float32)), out=min_dist)
+
+    # Selections are stored in greedy order, so a prefix is itself a valid coreset.
+    # More initial centers than k: the radius must come from the kept centers only.
+    if len(selected) > k:
+        selected = selected[:k]
+        min_dist = np.full(n, np.inf, dtype=np.float32)
+        for idx in selected:
+            np.minimum(min_dist, _sq_dist_to(emb, emb[idx].astype(np.float32)), out=min_dist)
+    radius = float(np.sqrt(min_dist.max()))
+    return selected, radius
+
+
+def descriptor_key(backend: str, model_path: str) -> str:
+    """Store key: embeddings from different YOLO weights must not be mixed."""
+    if backend == "cpu":
+        return "cpu"
+    from auto_label.backends import file_md5, _resolve_weights
+    return f"{backend}:{file_md5(_resolve_weights(model_path))[:12]}"
+
+
+def load_selection(path: Path):
+    if not path.exists():
+        return []
+    with open(path, "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def save_selection(names, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        for name in names:
+            f.write(name + "\n")
+    tmp.replace(path)
+
+
+def list_images(image_dir: Path):
+    return sorted(p for p in image_dir.iterdir() if p.suffix.lower() in IMAGE_EXTS)
+
+
+def main():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Prune redundant images with a k-center coreset over embeddings")
+    parser.add_argument("--image_dir", type=str, default="data/processed/train/images", help="Input image folder")
+    parser.add_argument("--store_dir", type=str, default="data/embeddings/train", help="Embedding cache folder")
+    parser.add_argument("--backend", choices=["cpu", "yolo"], default="cpu", help="Descriptor backend")
+    parser.add_argument("--model", type=str, default="yolov8x.pt", help="YOLO weights for --backend yolo")
+    parser.add_argument("--target", type=int, default=None, help="Number of images to keep")
+    parser.add_argument("--ratio", type=float, default=0.8, help="Fraction to keep when --target is not set")
+    parser.add_argument("--selection", type=str, default=None,
+                        help="Coreset file (default: <store_dir>/coreset.txt)")
+    parser.add_argument("--fresh", action="store_true",
+                        help="Ignore the previous coreset and exclude list instead of extending them")
+    parser.add_argument("--exclude_list", type=str, default=None,
+                        help="Pruned names for preprocess.py --exclude (default: <store_dir>/pruned.txt)")
+    args = parser.parse_args()
+
+    image_dir = Path(args.image_dir)
+    store_dir = Path(args.store_dir)
+    selection_path = Path(args.selection) if args.selection else store_dir / "coreset.txt"
+    exclude_path = Path(args.exclude_list) if args.exclude_list else store_dir / "pruned.txt"
+
+    descriptor = cpu_descriptor if args.backend == "cpu" else make_yolo_descriptor(args.model)
+    store = EmbeddingStore(store_dir, descriptor_key(args.backend, args.model))
+
+    image_paths = list_images(image_dir)
+    added = update_store(store, image_paths, descriptor)
+    log.info(f"Embedded {added} new images ({len(store)} total in store)")
+
+    # Only select among images that are still present in image_dir
+    present = {p.name for p in image_paths}
+    rows = [i for i, name in enumerate(store.names) if name in present]
+    emb = store.matrix() if len(rows) == len(store) else store.matrix()[rows]
+    names = [store.names[i] for i in rows]
+
+    target = args.target if args.target is not None else int(round(len(names) * args.ratio))
+    row_of = {name: i for i, name in enumerate(names)}
+    previous = [] if args.fresh else [row_of[n] for n in load_selection(selection_path) if n in row_of]
+
+    selected, radius = k_center_greedy(emb, target, initial=previous)
+    keep = [names[i] for i in selected]
+    save_selection(keep, selection_path)
+    log.info(f"Coreset: kept {len(keep)}/{len(names)} images "
+             f"(covering radius {radius:.4f}) -> {selection_path}")
+
+    # Không embed được (ảnh lỗi, ...) thì không có cơ sở để prune: luôn giữ lại
+    failed = present - set(store.names)
+    if failed:
+        log.info(f"{len(failed)} images could not be embedded, kept")
+
+    # Exclude list cộng dồn: ảnh prune ở run trước đã bị preprocess xoá nên không còn trong
+    # image_dir, nhưng vẫn phải nằm trong list để không bị tạo lại
+    previous_pruned = set() if args.fresh else set(load_selection(exclude_path))
+    pruned = (previous_pruned | (set(names) - set(keep))) - set(keep) - failed
+    save_selection(sorted(pruned), exclude_path)
+    log.info(f"Excluded {len(pruned)} images -> {exclude_path} (preprocess.py --exclude)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Các module của pipeline được import theo package từ gốc repo (auto_label.*, utils.*, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
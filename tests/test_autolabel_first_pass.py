@@ -0,0 +1,72 @@
+import cv2
+import numpy as np
+import pytest
+
+import auto_label.autolabel as autolabel
+from auto_label.boxes import Detections
+
+NAMES = {0: "apple", 1: "banana"}
+
+
+class StubBackend:
+    names = NAMES
+
+    def __init__(self, dets):
+        self.dets = dets
+        self.calls = 0
+
+    def predict(self, sources, augment=False):
+        self.calls += len(sources)
+        return [self.dets for _ in sources]
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    for i in range(4):
+        cv2.imwrite(str(raw / f"img_{i}.jpg"), np.zeros((64, 64, 3), np.uint8))
+    yaml_path = tmp_path / "data.yaml"
+    yaml_path.write_text("names:\n  0: apple\n  1: banana\n")
+    return raw, tmp_path / "labels", yaml_path
+
+
+def run_with(monkeypatch, dataset, first, main):
+    backends = {"small.pt": first, "big.pt": main}
+    monkeypatch.setattr(autolabel, "load_backend", lambda kind, path, **kw: backends[path])
+    raw, labels, yaml_path = dataset
+    return autolabel.auto_label(raw, labels, yaml_path, model_path="big.pt",
+                                first_pass_model="small.pt", first_pass_accept=0.7)
+
+
+def test_empty_first_pass_escalates_to_main_model(monkeypatch, dataset):
+    first = StubBackend(Detections())
+    main = StubBackend(Detections([[8, 8, 40, 40]], [0.9], [1]))
+    labeled = run_with(monkeypatch, dataset, first, main)
+
+    raw, labels, _ = dataset
+    assert main.calls == 4
+    assert len(labeled) == 4
+    assert len(list(raw.glob("*.jpg"))) == 4
+    assert all((labels / f"img_{i}.txt").read_text().startswith("1 ") for i in range(4))
+
+
+def test_confident_first_pass_is_accepted(monkeypatch, dataset):
+    first = StubBackend(Detections([[8, 8, 40, 40]], [0.95], [0]))
+    main = StubBackend(Detections())
+    labeled = run_with(monkeypatch, dataset, first, main)
+
+    assert main.calls == 0
+    assert len(labeled) == 4
+
+
+def test_unsure_first_pass_escalates(monkeypatch, dataset):
+    first = StubBackend(Detections([[8, 8, 40, 40]], [0.5], [0]))
+    main = StubBackend(Detections())
+    labeled = run_with(monkeypatch, dataset, first, main)
+
+    raw, _, _ = dataset
+    # Main model không thấy gì: ảnh bị xoá theo kết quả của main model, không phải first pass
+    assert main.calls == 4
+    assert labeled == []
+    assert list(raw.glob("*.jpg")) == []
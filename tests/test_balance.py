@@ -0,0 +1,41 @@
+import numpy as np
+
+from processing import balance
+
+CLASSES = {0: "apple", 1: "banana", 2: "cherry"}
+
+
+def make_split(root, n, rng):
+    images, labels = root / "images", root / "labels"
+    images.mkdir(parents=True, exist_ok=True)
+    labels.mkdir(parents=True, exist_ok=True)
+    for i in range(n):
+        stem = f"img_{i:04d}"
+        (images / f"{stem}.jpg").write_bytes(b"")
+        # apple phổ biến, banana vừa, cherry hiếm
+        cls = rng.choice(3, p=[0.75, 0.2, 0.05], size=rng.integers(1, 4))
+        (labels / f"{stem}.txt").write_text("".join(f"{c} 0.5 0.5 0.1 0.1\n" for c in cls))
+    return images, labels
+
+
+def plan_for(images, labels, root):
+    return balance.build_plan(images, labels, root / "stats.json", CLASSES, threshold=0.3,
+                              max_copies=4, max_ratio=1.5, max_drop=0.25, seed=0)
+
+
+def test_adding_an_image_keeps_the_plan_of_existing_images(tmp_path):
+    images, labels = make_split(tmp_path, 200, np.random.default_rng(1))
+    before = plan_for(images, labels, tmp_path)
+    assert before["drop"] and before["augment"]
+
+    # Tên xếp trước mọi ảnh cũ: vị trí của chúng trong list stem đều bị dịch đi
+    (images / "a_new.jpg").write_bytes(b"")
+    (labels / "a_new.txt").write_text("0 0.5 0.5 0.1 0.1\n")
+    after = plan_for(images, labels, tmp_path)
+
+    stems = [f"img_{i:04d}" for i in range(200)]
+    copies = lambda plan: {s: plan["augment"].get(s, 1) for s in stems if s not in plan["drop"]}
+    changed = {s for s in copies(before).keys() & copies(after).keys() if copies(before)[s] != copies(after)[s]}
+    assert changed == set()
+    # Thứ tự drop theo hash của stem: ảnh mới chỉ dịch ranh giới, không xáo trộn cả tập drop
+    assert len(set(before["drop"]) ^ set(after["drop"])) <= 2
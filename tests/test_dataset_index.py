@@ -0,0 +1,91 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+from analysis import dataset_index
+
+
+def make_dataset(root, name, labels):
+    """<root>/<name>/train/{images,labels} với cùng tên file giữa các dataset (như labeled/processed)."""
+    ds = root / name
+    (ds / "train" / "images").mkdir(parents=True)
+    (ds / "train" / "labels").mkdir(parents=True)
+    for stem, line in labels.items():
+        cv2.imwrite(str(ds / "train" / "images" / f"{stem}.jpg"), np.zeros((16, 16, 3), dtype=np.uint8))
+        (ds / "train" / "labels" / f"{stem}.txt").write_text(line)
+    return ds
+
+
+@pytest.fixture
+def index(tmp_path):
+    labeled = make_dataset(tmp_path, "labeled", {"a": "0 0.5 0.5 0.2 0.2\n", "b": "1 0.5 0.5 0.2 0.2\n"})
+    processed = make_dataset(tmp_path, "processed", {"a": "0 0.4 0.4 0.1 0.1\n", "a_aug": "0 0.3 0.3 0.1 0.1\n"})
+    conn = dataset_index.connect(tmp_path / "index.sqlite")
+    conn.executemany("INSERT INTO classes VALUES (?, ?)", [(0, "apple"), (1, "banana")])
+    dataset_index.build_index(conn, [labeled, processed])
+    yield conn, labeled, processed
+    conn.close()
+
+
+def test_export_rejects_rows_from_several_datasets(index, tmp_path):
+    conn, _, _ = index
+    rows = dataset_index.find_images(conn, classes=["apple"])
+    assert len({r["dataset"] for r in rows}) == 2
+    with pytest.raises(ValueError):
+        dataset_index.export_yolo(conn, rows, tmp_path / "subset")
+
+
+def test_export_pairs_image_with_its_own_label_and_reports_skips(index, tmp_path):
+    conn, _, processed = index
+    rows = dataset_index.find_images(conn, dataset=processed.as_posix(), classes=["apple"])
+    out = tmp_path / "subset"
+    assert dataset_index.export_yolo(conn, rows, out) == (2, 0)
+    assert (out / "train" / "labels" / "a.txt").read_text() == "0 0.4 0.4 0.1 0.1\n"
+    assert dataset_index.export_yolo(conn, rows, out) == (0, 2)
+
+
+def test_export_cli_requires_dataset(index, tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["dataset_index.py", "--db", str(tmp_path / "index.sqlite"),
+                                      "export", str(tmp_path / "subset"), "--class", "apple"])
+    with pytest.raises(SystemExit):
+        dataset_index.main()
+
+
+def count_updates(conn, dataset_dirs):
+    """Số dataset thật sự được quét lại (không bị skip theo stamp)."""
+    calls = []
+    real = dataset_index.index_split
+
+    def spy(conn, dataset, *args):
+        calls.append(dataset)
+        return real(conn, dataset, *args)
+
+    dataset_index.index_split = spy
+    try:
+        dataset_index.build_index(conn, dataset_dirs)
+    finally:
+        dataset_index.index_split = real
+    return len(set(calls))
+
+
+def test_incremental_build_follows_images_and_labels_not_stats(index):
+    conn, labeled, processed = index
+    assert count_updates(conn, [labeled, processed]) == 0
+
+    (labeled / "stats.json").write_text("{}")  # stats.json ghi lại: không cần quét
+    assert count_updates(conn, [labeled, processed]) == 0
+
+    label = labeled / "train" / "labels" / "b.txt"
+    st = label.stat()
+    with open(label, "w") as f:  # sửa tay tại chỗ
+        f.write("0 0.5 0.5 0.2 0.2\n")
+    os.utime(label, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert count_updates(conn, [labeled, processed]) == 1
+    assert dataset_index.find_images(conn, dataset=labeled.as_posix(), classes=["banana"]) == []
+
+    (processed / "train" / "images" / "a_aug.jpg").unlink()  # vd: prune
+    assert count_updates(conn, [labeled, processed]) == 1
+    assert len(dataset_index.find_images(conn, dataset=processed.as_posix())) == 1
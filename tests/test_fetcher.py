@@ -0,0 +1,163 @@
+import asyncio
+
+from aiohttp import web
+
+from crawler import fetcher
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 4000
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 4000
+
+
+def run(routes, paths, cfg=None, max_num=None, tmp_path=None, log=None):
+    """Serve `routes` on a local aiohttp server and fetch `paths` from it into tmp_path/out."""
+
+    async def main():
+        app = web.Application()
+        if log is not None:
+            @web.middleware
+            async def record(request, handler):
+                log.append(request.path)
+                return await handler(request)
+            app.middlewares.append(record)
+        app.router.add_routes(routes)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            f = fetcher.AsyncImageFetcher(cfg or fetcher.FetchConfig(min_bytes=100, backoff=0.01))
+            saved = await f.fetch_all([f"http://127.0.0.1:{port}{p}" for p in paths], tmp_path / "out",
+                                      lambda i: f"img_{i:04d}", max_num)
+            return saved, f.stats
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def listing(tmp_path):
+    return sorted(p.name for p in (tmp_path / "out").iterdir())
+
+
+def body(data, content_type="image/jpeg"):
+    async def handler(request):
+        return web.Response(body=data, content_type=content_type)
+    return handler
+
+
+def test_content_type_rejected(tmp_path):
+    routes = [web.get("/page", body(b"<html>" + b"x" * 4000, "text/html"))]
+    saved, stats = run(routes, ["/page"], tmp_path=tmp_path)
+    assert saved == []
+    assert stats.rejected == {"content_type": 1}
+    assert listing(tmp_path) == []
+
+
+def test_max_bytes_from_content_length(tmp_path):
+    routes = [web.get("/big", body(JPEG * 10))]
+    cfg = fetcher.FetchConfig(min_bytes=100, max_bytes=10_000)
+    saved, stats = run(routes, ["/big"], cfg, tmp_path=tmp_path)
+    assert saved == []
+    assert stats.rejected == {"too_large": 1}
+
+
+def test_max_bytes_cap_while_streaming(tmp_path):
+    async def chunked(request):
+        resp = web.StreamResponse(headers={"Content-Type": "image/jpeg"})
+        resp.enable_chunked_encoding()  # không có Content-Length: chỉ bị chặn khi đang stream
+        await resp.prepare(request)
+        for _ in range(20):
+            await resp.write(JPEG)
+        await resp.write_eof()
+        return resp
+
+    routes = [web.get("/stream", chunked)]
+    cfg = fetcher.FetchConfig(min_bytes=100, max_bytes=10_000, head_check=False, chunk_size=1024)
+    saved, stats = run(routes, ["/stream"], cfg, tmp_path=tmp_path)
+    assert saved == []
+    assert stats.rejected == {"too_large": 1}
+    assert listing(tmp_path) == []  # .part đã bị xoá
+
+
+def test_head_not_allowed_falls_back_to_get(tmp_path):
+    async def no_head(request):
+        return web.Response(status=405)
+
+    routes = [web.head("/img", no_head), web.get("/img", body(JPEG), allow_head=False)]
+    saved, stats = run(routes, ["/img"], tmp_path=tmp_path)
+    assert [p.name for p in saved] == ["img_0000.jpg"]
+    assert stats.saved == 1
+
+
+def test_retries_on_429_and_5xx(tmp_path):
+    calls = []
+
+    async def flaky(request):
+        calls.append(request.method)
+        n = calls.count("GET")
+        if request.method == "GET" and n == 1:
+            return web.Response(status=429)
+        if request.method == "GET" and n == 2:
+            return web.Response(status=503)
+        return web.Response(body=JPEG, content_type="image/jpeg")
+
+    routes = [web.route("*", "/flaky", flaky)]
+    cfg = fetcher.FetchConfig(min_bytes=100, retries=2, backoff=0.01)
+    saved, stats = run(routes, ["/flaky"], cfg, tmp_path=tmp_path)
+    assert calls.count("GET") == 3
+    assert len(saved) == 1
+    assert stats.failed == 0
+
+
+def test_client_error_is_not_retried(tmp_path):
+    calls = []
+
+    async def missing(request):
+        calls.append(request.method)
+        return web.Response(status=404)
+
+    routes = [web.route("*", "/missing", missing)]
+    cfg = fetcher.FetchConfig(min_bytes=100, retries=3, backoff=0.01, head_check=False)
+    saved, stats = run(routes, ["/missing"], cfg, tmp_path=tmp_path)
+    assert calls == ["GET"]
+    assert stats.rejected == {"status_404": 1}
+
+
+def test_extension_comes_from_magic_bytes(tmp_path):
+    routes = [web.get("/png_as_jpeg", body(PNG, "image/jpeg")),
+              web.get("/not_image", body(b"GIF89a" + b"\x00" * 4000, "image/jpeg"))]
+    saved, stats = run(routes, ["/png_as_jpeg", "/not_image"], tmp_path=tmp_path)
+    assert [p.name for p in saved] == ["img_0000.png"]
+    assert stats.rejected == {"not_image": 1}
+    assert listing(tmp_path) == ["img_0000.png"]
+
+
+def test_host_slot_released_during_backoff(tmp_path):
+    log = []
+    attempts = {"n": 0}
+
+    async def slow_fail(request):
+        attempts["n"] += 1
+        if attempts["n"] == 1:
+            return web.Response(status=503)
+        return web.Response(body=JPEG, content_type="image/jpeg")
+
+    routes = [web.get("/a", slow_fail), web.get("/b", body(PNG))]
+    cfg = fetcher.FetchConfig(concurrency=2, per_host=1, min_bytes=100, retries=1, backoff=0.3,
+                              head_check=False)
+    saved, _ = run(routes, ["/a", "/b"], cfg, tmp_path=tmp_path, log=log)
+    assert len(saved) == 2
+    # /b được tải trong lúc /a đang backoff, không phải chờ /a retry xong
+    assert log == ["/a", "/b", "/a"]
+
+
+def test_leftover_part_files_are_never_images(tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    stale = out / ".tmp-999999999-fetch_000000.part"
+    stale.write_bytes(JPEG)
+    routes = [web.get("/img", body(JPEG))]
+    saved, _ = run(routes, ["/img"], tmp_path=tmp_path)
+    assert [p.name for p in saved] == ["img_0000.jpg"]
+    assert not stale.exists()  # .part của process đã chết được dọn khi bắt đầu
@@ -0,0 +1,18 @@
+from analysis.stats import analyze_split
+from utils.memory import iter_images
+from utils.safe_io import TMP_PREFIX
+
+
+def test_temp_and_hidden_files_are_not_images(tmp_path):
+    images, labels = tmp_path / "train" / "images", tmp_path / "train" / "labels"
+    images.mkdir(parents=True)
+    labels.mkdir(parents=True)
+    (images / "a.jpg").write_bytes(b"x")
+    (images / f"{TMP_PREFIX}1234-b.jpg").write_bytes(b"x")  # atomic_imwrite của stage khác đang ghi
+    (images / ".c.png").write_bytes(b"x")
+    (labels / "a.txt").write_text("0 0.5 0.5 0.1 0.1\n")
+    (labels / f"{TMP_PREFIX}1234-b.txt").write_text("0 0.5 0.5 0.1 0.1\n")
+
+    assert [p.name for p in iter_images(images)] == ["a.jpg"]
+    stats = analyze_split(tmp_path, "train")
+    assert (stats["total_images"], stats["total_labels"], stats["total_objects"]) == (1, 1, 1)
@@ -0,0 +1,67 @@
+import json
+from argparse import Namespace
+
+import cv2
+import numpy as np
+import pytest
+
+from processing import preprocess
+
+
+@pytest.fixture
+def labeled(tmp_path, monkeypatch):
+    """data/labeled/train với 3 ảnh có nhãn; augment pipeline thay bằng identity (không cần albumentations)."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(preprocess, "_AUG_PIPELINE",
+                        lambda image, bboxes, category_ids: {"image": image.copy(), "bboxes": bboxes,
+                                                             "category_ids": category_ids})
+    images = tmp_path / "data" / "labeled" / "train" / "images"
+    labels = tmp_path / "data" / "labeled" / "train" / "labels"
+    images.mkdir(parents=True)
+    labels.mkdir(parents=True)
+    for i, stem in enumerate(["a", "b", "c"]):
+        cv2.imwrite(str(images / f"{stem}.jpg"), np.full((32, 32, 3), 40 * i, dtype=np.uint8))
+        (labels / f"{stem}.txt").write_text(f"{i} 0.5 0.5 0.4 0.4\n")
+    return tmp_path
+
+
+def run(root, plan=None, exclude=None):
+    plan_path = None
+    if plan is not None:
+        plan_path = root / "plan.json"
+        plan_path.write_text(json.dumps({"version": 1, "default_copies": 1, **plan}))
+    preprocess.run(Namespace(image_dir="data/labeled/train/images", label_dir="data/labeled/train/labels",
+                             output_dir="data/processed", plan=plan_path and str(plan_path),
+                             exclude=exclude and str(exclude), memory_budget="64M", workers=1))
+    out = root / "data" / "processed" / "train"
+    images = sorted(p.name for p in (out / "images").iterdir())
+    labels = sorted(p.stem for p in (out / "labels").iterdir())
+    assert [n.rsplit(".", 1)[0] for n in images] == labels  # mỗi ảnh đều có nhãn
+    return images
+
+
+def test_plan_reconciles_outputs_of_earlier_runs(labeled):
+    assert run(labeled) == ["a.jpg", "a_aug.jpg", "b.jpg", "b_aug.jpg", "c.jpg", "c_aug.jpg"]
+
+    # Plan lập trên toàn bộ train: b cần 3 bản, c bị drop, dù cả hai đã được xử lý trước đó
+    assert run(labeled, {"augment": {"b": 3}, "drop": ["c"]}) == [
+        "a.jpg", "a_aug.jpg", "b.jpg", "b_aug.jpg", "b_aug2.jpg", "b_aug3.jpg"]
+
+    # Plan mới giảm số bản của b: bản thừa bị xoá
+    assert run(labeled, {"augment": {}, "drop": ["c"]}) == ["a.jpg", "a_aug.jpg", "b.jpg", "b_aug.jpg"]
+
+
+def test_plan_applies_to_new_images(labeled):
+    assert run(labeled, {"augment": {"a": 2}, "drop": ["b"]}) == [
+        "a.jpg", "a_aug.jpg", "a_aug2.jpg", "c.jpg", "c_aug.jpg"]
+
+
+def test_excluded_files_are_removed_and_never_regenerated(labeled):
+    run(labeled)
+    exclude = labeled / "pruned.txt"
+    exclude.write_text("a.jpg\nb_aug.jpg\n")  # format của processing/prune.py
+    assert run(labeled, exclude=exclude) == ["a_aug.jpg", "b.jpg", "c.jpg", "c_aug.jpg"]
+    assert run(labeled, exclude=exclude) == ["a_aug.jpg", "b.jpg", "c.jpg", "c_aug.jpg"]
+    # Plan vẫn áp dụng, bản bị prune không được tạo lại
+    assert run(labeled, {"augment": {"b": 2}, "drop": []}, exclude=exclude) == [
+        "a_aug.jpg", "b.jpg", "b_aug2.jpg", "c.jpg", "c_aug.jpg"]
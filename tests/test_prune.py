@@ -0,0 +1,58 @@
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+from processing import prune
+
+
+def test_radius_counts_only_kept_centers():
+    emb = np.array([[0.0], [1.0], [2.0], [10.0]], dtype=np.float16)
+    # 3 center cũ nhưng chỉ giữ 2: [0, 1] -> điểm xa nhất là 10.0, radius 9
+    selected, radius = prune.k_center_greedy(emb, 2, initial=[0, 1, 3])
+    assert selected == [0, 1]
+    assert radius == pytest.approx(9.0)
+
+
+def test_store_rejects_embeddings_from_other_weights(tmp_path):
+    store = prune.EmbeddingStore(tmp_path, "yolo:aaaaaaaaaaaa")
+    store.append(["a.jpg"], np.ones((1, 4)))
+    with pytest.raises(ValueError):
+        prune.EmbeddingStore(tmp_path, "yolo:bbbbbbbbbbbb")
+    assert len(prune.EmbeddingStore(tmp_path, "yolo:aaaaaaaaaaaa")) == 1
+
+
+def test_descriptor_key_hashes_weights(tmp_path):
+    w1, w2 = tmp_path / "a.pt", tmp_path / "b.pt"
+    w1.write_bytes(b"weights-1")
+    w2.write_bytes(b"weights-2")
+    assert prune.descriptor_key("cpu", str(w1)) == "cpu"
+    assert prune.descriptor_key("yolo", str(w1)) != prune.descriptor_key("yolo", str(w2))
+
+
+def test_exclude_list_keeps_failed_and_accumulates(tmp_path, monkeypatch):
+    images = tmp_path / "images"
+    images.mkdir()
+    rng = np.random.default_rng(0)
+    for i in range(6):
+        cv2.imwrite(str(images / f"img_{i}.jpg"), rng.integers(0, 255, (32, 32, 3), dtype=np.uint8))
+    (images / "broken.jpg").write_bytes(b"not an image")
+    store = tmp_path / "store"
+
+    def main(*extra):
+        monkeypatch.setattr(sys, "argv", ["prune.py", "--image_dir", str(images), "--store_dir", str(store),
+                                          "--target", "3", *extra])
+        prune.main()
+        return (prune.load_selection(store / "coreset.txt"), prune.load_selection(store / "pruned.txt"))
+
+    keep, pruned = main()
+    assert len(keep) == 3 and len(pruned) == 3
+    assert "broken.jpg" not in pruned  # không embed được thì giữ lại
+    assert (images / "broken.jpg").exists() and all((images / n).exists() for n in pruned)
+
+    # preprocess --exclude đã xoá các file bị prune: list vẫn giữ chúng ở run sau
+    for name in pruned:
+        (images / name).unlink()
+    _, again = main()
+    assert set(pruned) <= set(again)
@@ -0,0 +1,177 @@
+import socket
+
+import boto3
+import pytest
+import yaml
+from moto.server import ThreadedMotoServer
+
+from utils import remote_sync
+
+BUCKET = "dvc-test"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def s3_endpoint():
+    port = _free_port()
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    yield f"http://127.0.0.1:{port}"
+    server.stop()
+
+
+@pytest.fixture
+def repo(tmp_path, s3_endpoint, monkeypatch):
+    """Minimal DVC workspace: .dvc/config pointing at the moto server, .dvcignore, one tracked dir."""
+    for var in ("MINIO_ENDPOINT", "MINIO_ACCESS_KEY", "MINIO_SECRET_KEY", "MINIO_BUCKET"):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(remote_sync.time, "sleep", lambda _: None)  # _retry backoff
+
+    (tmp_path / ".dvc").mkdir()
+    (tmp_path / ".dvc" / "config").write_text(
+        "[core]\n    remote = test\n"
+        "['remote \"test\"']\n"
+        f"    url = s3://{BUCKET}/store\n"
+        f"    endpointurl = {s3_endpoint}\n"
+        "    access_key_id = testing\n    secret_access_key = testing\n")
+    (tmp_path / ".dvcignore").write_text(".journal/\n.tmp-*\n")
+
+    client = boto3.client("s3", endpoint_url=s3_endpoint, aws_access_key_id="testing",
+                          aws_secret_access_key="testing")
+    if not any(b["Name"] == BUCKET for b in client.list_buckets()["Buckets"]):
+        client.create_bucket(Bucket=BUCKET)
+    for obj in client.list_objects_v2(Bucket=BUCKET).get("Contents", []):
+        client.delete_object(Bucket=BUCKET, Key=obj["Key"])
+
+    data = tmp_path / "data" / "labeled"
+    (data / "train" / "images").mkdir(parents=True)
+    for i in range(5):
+        (data / "train" / "images" / f"img_{i}.jpg").write_bytes(bytes([i]) * (1000 + i))
+    (data / "stats.json").write_text("{}")
+    track(tmp_path, data)
+    return tmp_path, client
+
+
+def track(repo_root, path):
+    """Write `<path>.dvc` the way `dvc add` would (dir md5 over the non-ignored files)."""
+    index = remote_sync.SyncIndex(repo_root / ".dvc" / "tmp" / "hash.db")
+    entries = remote_sync.hash_tree(path, index, 2, remote_sync.DvcIgnore(repo_root))
+    _, md5 = remote_sync.dir_manifest(entries)
+    dvc_file = path.with_name(path.name + ".dvc")
+    dvc_file.write_text(yaml.safe_dump({"outs": [{"md5": md5, "path": path.name}]}))
+    return dvc_file
+
+
+def count_uploads(monkeypatch):
+    calls = []
+    real = remote_sync.upload_object
+
+    def spy(client, remote, src, md5, size, cfg):
+        calls.append(md5)
+        return real(client, remote, src, md5, size, cfg)
+
+    monkeypatch.setattr(remote_sync, "upload_object", spy)
+    return calls
+
+
+def test_push_uploads_files_and_dir_manifest(repo, monkeypatch):
+    root, client = repo
+    uploads = count_uploads(monkeypatch)
+
+    assert remote_sync.push([root / "data" / "labeled.dvc"], jobs=4, repo_root=root)
+    keys = {o["Key"] for o in client.list_objects_v2(Bucket=BUCKET)["Contents"]}
+    # 5 ảnh (nội dung khác nhau) + stats.json + .dir manifest
+    assert len(uploads) == 7
+    assert len(keys) == 7
+    assert all(k.startswith("store/files/md5/") for k in keys)
+
+
+def test_repeat_push_skips_everything(repo, monkeypatch):
+    root, _ = repo
+    target = root / "data" / "labeled.dvc"
+    assert remote_sync.push([target], jobs=4, repo_root=root)
+
+    uploads = count_uploads(monkeypatch)
+    assert remote_sync.push([target], jobs=4, repo_root=root)
+    assert uploads == []
+
+
+def test_dvcignored_files_do_not_change_dir_md5(repo, monkeypatch):
+    root, client = repo
+    data = root / "data" / "labeled"
+    (data / ".journal").mkdir()
+    (data / ".journal" / "autolabel.jsonl").write_text('{"key": "x"}\n')
+    (data / "train" / "images" / ".tmp-123-img_9.jpg").write_bytes(b"partial")
+
+    assert remote_sync.push([root / "data" / "labeled.dvc"], jobs=4, repo_root=root)
+    assert len(client.list_objects_v2(Bucket=BUCKET)["Contents"]) == 7
+
+
+def test_pull_restores_workspace(repo):
+    root, _ = repo
+    target = root / "data" / "labeled.dvc"
+    images = root / "data" / "labeled" / "train" / "images"
+    original = {p.name: p.read_bytes() for p in images.iterdir()}
+    assert remote_sync.push([target], jobs=4, repo_root=root)
+
+    for p in images.iterdir():
+        p.unlink()
+    (root / "data" / "labeled" / "stats.json").unlink()
+
+    assert remote_sync.pull([target], jobs=4, repo_root=root)
+    assert {p.name: p.read_bytes() for p in images.iterdir()} == original
+    assert (root / "data" / "labeled" / "stats.json").read_text() == "{}"
+
+
+def test_pull_marks_only_downloaded_objects(repo):
+    root, client = repo
+    target = root / "data" / "labeled.dvc"
+    assert remote_sync.push([target], jobs=4, repo_root=root)
+
+    lost = root / "data" / "labeled" / "train" / "images" / "img_0.jpg"
+    lost_md5 = remote_sync.file_md5(lost)
+    client.delete_object(Bucket=BUCKET, Key=remote_sync.object_key({"prefix": "store"}, lost_md5))
+    lost.unlink()
+    index = remote_sync.SyncIndex(root / ".dvc" / "tmp" / "remote_sync.db")
+    index.conn.execute("DELETE FROM remote")
+    index.conn.commit()
+
+    assert not remote_sync.pull([target], jobs=4, repo_root=root)
+    known = index.on_remote(BUCKET)
+    assert lost_md5 not in known
+    assert not lost.exists()
+
+
+def test_multipart_upload(repo, monkeypatch):
+    root, client = repo
+    monkeypatch.setattr(remote_sync, "MULTIPART_THRESHOLD", 5 * 1024 * 1024)
+    monkeypatch.setattr(remote_sync, "MULTIPART_CHUNK", 5 * 1024 * 1024)
+    big = root / "data" / "labeled" / "train" / "images" / "big.png"
+    big.write_bytes(b"\x89PNG" + bytes(range(256)) * (11 * 4096))
+    target = track(root, root / "data" / "labeled")
+
+    assert remote_sync.push([target], jobs=4, repo_root=root)
+    head = client.head_object(Bucket=BUCKET,
+                              Key=remote_sync.object_key({"prefix": "store"}, remote_sync.file_md5(big)))
+    assert "-" in head["ETag"]  # ETag multipart: <md5 of parts>-<n>
+    assert head["ContentLength"] == big.stat().st_size
+
+    big.unlink()
+    assert remote_sync.pull([target], jobs=4, repo_root=root)
+    assert big.stat().st_size == 4 + 256 * 11 * 4096
+
+
+def test_pull_with_missing_dir_manifest_fails_cleanly(repo):
+    root, client = repo
+    target = root / "data" / "labeled.dvc"
+    assert remote_sync.push([target], jobs=4, repo_root=root)
+    (_, recorded), = remote_sync.load_outs([target], root)
+    client.delete_object(Bucket=BUCKET, Key=remote_sync.object_key({"prefix": "store"}, recorded))
+
+    assert not remote_sync.pull([target], jobs=4, repo_root=root)
@@ -0,0 +1,72 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from utils import safe_io
+
+
+@pytest.fixture
+def other_process():
+    """pid của một process khác đang chạy."""
+    proc = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    yield proc.pid
+    proc.kill()
+    proc.wait()
+
+
+def dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def test_clean_temp_files_keeps_files_of_running_writers(tmp_path, other_process):
+    live = tmp_path / f".tmp-{other_process}-img.jpg"
+    live_old = tmp_path / f".tmp-old-{other_process}-val"
+    dead = tmp_path / f".tmp-{dead_pid()}-img.jpg"
+    legacy = tmp_path / ".tmp-img.jpg"
+    for p in (live, dead, legacy):
+        p.write_bytes(b"x")
+    live_old.mkdir()
+    (tmp_path / "img.jpg").write_bytes(b"x")
+
+    assert safe_io.clean_temp_files(tmp_path) == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted([live.name, live_old.name, "img.jpg"])
+
+
+def write_journal(path, records):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("".join(json.dumps({"key": k, "state": s}) + "\n" for k, s in records))
+
+
+def test_journal_is_per_run_and_adopts_dead_runs_only(tmp_path, other_process):
+    base = tmp_path / ".journal" / "autolabel.jsonl"
+    running = base.with_name(f"autolabel-{other_process}.jsonl")
+    crashed = base.with_name(f"autolabel-{dead_pid()}.jsonl")
+    write_journal(running, [("a", "labeled")])
+    write_journal(crashed, [("b", "labeled"), ("c", "split")])
+
+    journal = safe_io.RunJournal(base, "autolabel")
+    assert journal.resumed
+    assert journal.keys("labeled") == ["b"]
+    assert journal.path.name == f"autolabel-{os.getpid()}.jsonl"
+    assert not crashed.exists()
+    assert running.exists()  # run song song: không động vào
+
+    journal.record("d", "labeled")
+    journal.finish()
+    assert sorted(p.name for p in base.parent.iterdir()) == [running.name]
+
+
+def test_journal_without_orphans_starts_fresh(tmp_path):
+    journal = safe_io.RunJournal(tmp_path / ".journal" / "augment.jsonl", "augment")
+    assert not journal.resumed
+    journal.record("x", "done")
+    journal.close()
+    # Run bị ngắt (cùng pid, vd: job trước trong warm worker): được nhận lại
+    again = safe_io.RunJournal(tmp_path / ".journal" / "augment.jsonl", "augment")
+    assert again.resumed and again.keys("done") == ["x"]
+    again.finish()
@@ -0,0 +1,80 @@
+import sys
+
+import numpy as np
+import pytest
+
+from auto_label import autolabel
+from auto_label.boxes import Detections
+from auto_label.tiling import TileConfig, merge_detections, sliced_predict
+
+
+def boxes(*rows):
+    """rows: (x1, y1, x2, y2, conf, cls)"""
+    a = np.array(rows, dtype=np.float32)
+    return Detections(a[:, :4], a[:, 4], a[:, 5].astype(np.int64))
+
+
+@pytest.mark.parametrize("merge", ["nms", "wbf"])
+def test_pieces_cut_at_tile_borders_become_one_box(merge):
+    # Vật 400..900, tile x0 = 0 / 512 / 640: ba mảnh, IoU giữa chúng < 0.5
+    dets = boxes((400, 100, 640, 200, 0.9, 0), (512, 100, 900, 200, 0.8, 0), (640, 100, 900, 200, 0.7, 0))
+    merged = merge_detections(dets, TileConfig(merge=merge), cut=[True, True, True])
+    assert len(merged) == 1
+    np.testing.assert_allclose(merged.xyxy[0], [400, 100, 900, 200])
+
+
+@pytest.mark.parametrize("merge", ["nms", "wbf"])
+def test_cut_piece_inside_full_box_is_absorbed(merge):
+    # Tile trái thấy một phần (IoU 0.4), tile phải thấy cả vật
+    dets = boxes((560, 100, 640, 200, 0.95, 0), (520, 100, 720, 200, 0.7, 0))
+    merged = merge_detections(dets, TileConfig(merge=merge), cut=[True, False])
+    assert len(merged) == 1
+    np.testing.assert_allclose(merged.xyxy[0], [520, 100, 720, 200])
+
+
+def test_uncut_overlapping_objects_are_kept():
+    # Hai vật thật chồng lên nhau (IoS 1, IoU 0.25), không bị cắt bởi tile: NMS như cũ
+    dets = boxes((100, 100, 300, 300, 0.9, 0), (150, 150, 250, 250, 0.8, 0))
+    assert len(merge_detections(dets, TileConfig())) == 2
+
+
+def test_neighbours_and_other_classes_are_kept():
+    dets = boxes((0, 0, 100, 100, 0.9, 0), (90, 0, 190, 100, 0.8, 0),  # chạm nhau, IoS 0.1
+                 (10, 10, 90, 90, 0.7, 1))  # nằm trong box class 0 nhưng khác class
+    assert len(merge_detections(dets, TileConfig(), cut=[True, True, True])) == 3
+
+
+def test_wbf_averages_duplicates():
+    dets = boxes((100, 100, 200, 200, 0.9, 0), (104, 104, 204, 204, 0.3, 0))
+    merged = merge_detections(dets, TileConfig(merge="wbf"))
+    np.testing.assert_allclose(merged.xyxy[0], [101, 101, 201, 201])
+    assert merged.conf[0] == pytest.approx(0.6)
+
+
+class CutBackend:
+    """Fake detector: một vật 400..900 x 100..200, mỗi crop chỉ thấy phần nằm trong nó."""
+
+    def predict(self, crops):
+        out = []
+        for crop in crops:
+            x0 = int(crop[0, 0, 0]) * 8  # toạ độ x của crop được mã hoá trong pixel
+            h, w = crop.shape[:2]
+            x1, x2 = max(400, x0), min(900, x0 + w)
+            out.append(boxes((x1 - x0, 100, x2 - x0, 200, 0.9, 0)) if x1 < x2 else Detections())
+        return out
+
+
+@pytest.mark.parametrize("merge", ["nms", "wbf"])
+def test_sliced_predict_joins_object_cut_by_tiles(merge):
+    img = np.zeros((640, 1280, 3), dtype=np.uint8)
+    img[:, :, 0] = (np.arange(1280) // 8).astype(np.uint8)[None, :]
+    cfg = TileConfig(tile_size=640, overlap=0.2, min_side=1000, merge=merge, full_pass=False)
+    merged = sliced_predict(CutBackend(), img, cfg)
+    assert len(merged) == 1
+    np.testing.assert_allclose(merged.xyxy[0], [400, 100, 900, 200])
+
+
+def test_tile_with_ensemble_is_rejected(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["autolabel.py", "--tile", "--ensemble_views", "orig,hflip"])
+    with pytest.raises(SystemExit):
+        autolabel.main()
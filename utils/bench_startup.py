@@ -0,0 +1,121 @@
+"""
+bench_startup.py
+--------------------------------------------------------------------
+Startup cost of the pipeline entry points.
+
+- `--help` wall time of each stage script in a fresh interpreter (what every
+  `dvc.sh` step pays before doing any work)
+- import time of the heavy modules on their own (`python -X importtime`)
+- optionally: one autolabel job cold (new interpreter) vs. through a running
+  warm worker (`utils/warm_worker.py serve`)
+
+Usage:
+    python utils/bench_startup.py
+    python utils/bench_startup.py --job_args "--input_dir data/raw/images" --repeat 3
+"""
+
+import argparse
+import json
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from logs.log import get_logger
+
+log = get_logger("bench_startup")
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+ENTRY_POINTS = [
+    "auto_label/autolabel.py",
+    "processing/preprocess.py",
+    "processing/prune.py",
+    "analysis/run_analysis.py",
+    "crawler/crawler.py",
+]
+HEAVY_MODULES = ["cv2", "numpy", "matplotlib.pyplot", "albumentations", "ultralytics",
+                 "onnxruntime", "googleapiclient.discovery", "icrawler"]
+
+
+def _timed(cmd, repeat: int):
+    times = []
+    ok = True
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = subprocess.run(cmd, cwd=REPO_ROOT, capture_output=True)
+        times.append(time.perf_counter() - t0)
+        ok = ok and res.returncode == 0
+    return statistics.median(times), ok
+
+
+def bench_help(repeat: int) -> dict:
+    out = {}
+    for script in ENTRY_POINTS:
+        if not (REPO_ROOT / script).exists():
+            continue
+        out[script] = _timed([sys.executable, script, "--help"], repeat)
+    return out
+
+
+def bench_imports() -> dict:
+    """Cumulative import time (s) per module, each in its own interpreter, None if not installed."""
+    out = {}
+    for mod in HEAVY_MODULES:
+        res = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {mod}"],
+                             cwd=REPO_ROOT, capture_output=True, text=True)
+        if res.returncode != 0:
+            out[mod] = None
+            continue
+        # last line is the top-level module: "import time: self | cumulative | name"
+        last = [l for l in res.stderr.splitlines() if l.startswith("import time:")][-1]
+        out[mod] = int(last.split("|")[1]) / 1e6
+    return out
+
+
+def bench_job(job_args: str, repeat: int) -> dict:
+    from utils.warm_worker import ping
+    argv = shlex.split(job_args)
+    cold, cold_ok = _timed([sys.executable, "auto_label/autolabel.py", *argv], repeat)
+    result = {"cold": cold, "cold_ok": cold_ok, "warm": None}
+    if ping():
+        warm, warm_ok = _timed([sys.executable, "auto_label/autolabel.py", *argv, "--worker"], repeat)
+        result.update({"warm": warm, "warm_ok": warm_ok})
+    else:
+        log.warning("Warm worker không chạy, bỏ qua phần warm (python utils/warm_worker.py serve)")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure stage startup and import time")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần chạy mỗi lệnh (lấy median)")
+    parser.add_argument("--job_args", type=str, default=None,
+                        help="Chạy thêm autolabel với các args này, cold vs warm worker")
+    parser.add_argument("--json", type=str, default=None, help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    report = {"help": bench_help(args.repeat), "imports": bench_imports()}
+    log.info("⏱️  Startup (--help, median):")
+    for script, (t, ok) in report["help"].items():
+        log.info(f"  {script:<28} {t * 1000:8.0f} ms{'' if ok else '  (failed)'}")
+    log.info("📦 Heavy imports (cumulative):")
+    for mod, t in report["imports"].items():
+        log.info(f"  {mod:<28} {'not installed' if t is None else f'{t * 1000:8.0f} ms'}")
+
+    if args.job_args is not None:
+        report["job"] = bench_job(args.job_args, args.repeat)
+        job = report["job"]
+        log.info(f"🏷️  autolabel job: cold {job['cold']:.2f}s"
+                 + (f", warm worker {job['warm']:.2f}s" if job["warm"] is not None else ""))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        log.info(f"✅ Đã lưu kết quả vào: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+dataset_version.py
+--------------------------------------------------------------------
+Dataset release tags (labeled_vN / augmented_vN) and manifest-level diffs.
+
+Tags: local tags come from `git tag -l`, remote tags from ONE `git ls-remote
+--tags` call cached in `.git/dataset_tags.json`, so picking the next version
+and a free tag name costs one network round trip per run instead of one per
+candidate.
+
+Diff: two versions are compared through their `.dvc` files and the `.dir`
+manifests they point to. Only label files that differ are read (from the
+local DVC cache, or the remote as fallback) to get per-class count deltas;
+image bytes are never fetched.
+
+Usage:
+    python utils/dataset_version.py next-version
+    python utils/dataset_version.py free-tag labeled_v 7
+    python utils/dataset_version.py diff labeled_v3 labeled_v4
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import yaml
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from logs.log import get_logger
+
+log = get_logger("dataset_version")
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+TAG_CACHE = REPO_ROOT / ".git" / "dataset_tags.json"
+TAG_CACHE_TTL = 300
+PREFIXES = ("labeled_v", "augmented_v")
+DVC_FILES = {"labeled_v": "data/labeled.dvc", "augmented_v": "data/processed.dvc"}
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+
+def _git(*args) -> str:
+    return subprocess.run(["git", *args], cwd=REPO_ROOT, check=True,
+                          capture_output=True, text=True).stdout
+
+
+# ==============================================================================
+# Tags
+# ==============================================================================
+def remote_tags(remote: str = "origin", refresh: bool = False) -> set:
+    """Tag names on `remote`, from a cached `git ls-remote` listing."""
+    if not refresh and TAG_CACHE.exists():
+        with open(TAG_CACHE, "r") as f:
+            cached = json.load(f)
+        if cached.get("remote") == remote and time.time() - cached.get("time", 0) < TAG_CACHE_TTL:
+            return set(cached["tags"])
+
+    try:
+        out = _git("ls-remote", "--tags", remote)
+    except subprocess.CalledProcessError as e:
+        log.warning(f"git ls-remote {remote} failed, using local tags only: {e.stderr.strip()}")
+        return set()
+
+    tags = sorted({line.split("refs/tags/", 1)[1].removesuffix("^{}")
+                   for line in out.splitlines() if "refs/tags/" in line})
+    with open(TAG_CACHE, "w") as f:
+        json.dump({"remote": remote, "time": time.time(), "tags": tags}, f)
+    return set(tags)
+
+
+def all_tags(remote: str = "origin", refresh: bool = False) -> set:
+    return set(_git("tag", "-l").split()) | remote_tags(remote, refresh)
+
+
+def versions(tags, prefixes=PREFIXES) -> set:
+    pattern = re.compile(rf"^(?:{'|'.join(map(re.escape, prefixes))})(\d+)$")
+    return {int(m.group(1)) for t in tags if (m := pattern.match(t))}
+
+
+def next_version(tags) -> int:
+    found = versions(tags)
+    return max(found) + 1 if found else 1
+
+
+def free_tag(prefix: str, start: int, tags) -> str:
+    v = start
+    while f"{prefix}{v}" in tags:
+        v += 1
+    return f"{prefix}{v}"
+
+
+# ==============================================================================
+# Manifests
+# ==============================================================================
+def dvc_out_at(rev: str, dvc_file: str) -> str:
+    """md5 recorded in `dvc_file` at git revision `rev` (a tag, branch or commit)."""
+    data = yaml.safe_load(_git("show", f"{rev}:{dvc_file}"))
+    return data["outs"][0]["md5"]
+
+
+class ObjectReader:
+    """Reads content-addressed objects from the local DVC cache, falling back to the remote."""
+
+    def __init__(self, repo_root: Path = REPO_ROOT):
+        self.cache = repo_root / ".dvc" / "cache"
+        self._client = None
+        self._remote = None
+
+    def _local(self, md5: str):
+        for path in (self.cache / "files" / "md5" / md5[:2] / md5[2:],
+                     self.cache / md5[:2] / md5[2:]):
+            if path.exists():
+                return path
+        return None
+
+    def read(self, md5: str) -> bytes:
+        path = self._local(md5)
+        if path is not None:
+            return path.read_bytes()
+        if self._client is None:
+            from utils.remote_sync import load_remote_config, make_client, object_key
+            self._remote = load_remote_config()
+            self._client = make_client(self._remote, jobs=4)
+            self._object_key = object_key
+        key = self._object_key(self._remote, md5)
+        return self._client.get_object(Bucket=self._remote["bucket"], Key=key)["Body"].read()
+
+    def manifest(self, dir_md5: str) -> dict:
+        return {e["relpath"]: e["md5"] for e in json.loads(self.read(dir_md5))}
+
+
+def _split_and_kind(relpath: str):
+    """('train', 'images', 'x.jpg') style split for the `<split>/<images|labels>/<file>` layout."""
+    parts = relpath.split("/")
+    if len(parts) >= 3 and parts[-2] in ("images", "labels"):
+        return "/".join(parts[:-2]), parts[-2], parts[-1]
+    return "", "", relpath
+
+
+def _class_counts(content: bytes) -> Counter:
+    counts = Counter()
+    for line in content.decode("utf-8", errors="ignore").splitlines():
+        parts = line.split()
+        if len(parts) >= 5:
+            counts[int(parts[0])] += 1
+    return counts
+
+
+def diff_manifests(old: dict, new: dict, reader: ObjectReader = None) -> dict:
+    """Added / removed / relabeled images and per-class object deltas between two manifests."""
+    old_keys, new_keys = set(old), set(new)
+    is_image = lambda rel: rel.lower().endswith(IMAGE_EXTS)
+    is_label = lambda rel: rel.endswith(".txt") and _split_and_kind(rel)[1] == "labels"
+
+    added = sorted(r for r in new_keys - old_keys if is_image(r))
+    removed = sorted(r for r in old_keys - new_keys if is_image(r))
+    changed_images = sorted(r for r in old_keys & new_keys if is_image(r) and old[r] != new[r])
+
+    label_changes = sorted(r for r in old_keys | new_keys
+                           if is_label(r) and old.get(r) != new.get(r))
+    relabeled = sorted(r for r in label_changes if r in old and r in new)
+
+    class_delta = defaultdict(int)
+    split_delta = defaultdict(int)
+    if reader is not None:
+        # Label files are tiny; read the changed ones concurrently (remote round trips dominate)
+        jobs = [(old[r], -1) for r in label_changes if r in old] + \
+               [(new[r], +1) for r in label_changes if r in new]
+        with ThreadPoolExecutor(16) as pool:
+            for (_, sign), counts in zip(jobs, pool.map(lambda j: _class_counts(reader.read(j[0])), jobs)):
+                for c, n in counts.items():
+                    class_delta[c] += sign * n
+    for rel in added:
+        split_delta[_split_and_kind(rel)[0]] += 1
+    for rel in removed:
+        split_delta[_split_and_kind(rel)[0]] -= 1
+
+    return {
+        "added_images": added,
+        "removed_images": removed,
+        "modified_images": changed_images,
+        "relabeled": relabeled,
+        "class_object_delta": {c: d for c, d in sorted(class_delta.items()) if d},
+        "split_image_delta": {s: d for s, d in sorted(split_delta.items()) if d},
+    }
+
+
+def diff_versions(rev_a: str, rev_b: str, dvc_file: str = None, with_counts: bool = True) -> dict:
+    if dvc_file is None:
+        prefix = next((p for p in PREFIXES if rev_a.startswith(p)), "labeled_v")
+        dvc_file = DVC_FILES[prefix]
+    md5_a, md5_b = dvc_out_at(rev_a, dvc_file), dvc_out_at(rev_b, dvc_file)
+    if md5_a == md5_b:
+        return {"identical": True, "md5": md5_a}
+    reader = ObjectReader()
+    result = diff_manifests(reader.manifest(md5_a), reader.manifest(md5_b),
+                            reader if with_counts else None)
+    result.update({"identical": False, "from": md5_a, "to": md5_b})
+    return result
+
+
+def load_class_names(yaml_path: Path) -> dict:
+    with open(yaml_path, "r") as f:
+        names = yaml.safe_load(f)["names"]
+    return {int(k): v for k, v in names.items()} if isinstance(names, dict) else dict(enumerate(names))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dataset version tags and diffs")
+    parser.add_argument("--remote", type=str, default="origin")
+    parser.add_argument("--refresh", action="store_true", help="Ignore the cached remote tag listing")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("next-version", help="Print next free version number across both prefixes")
+    p_free = sub.add_parser("free-tag", help="Print first free tag name starting at a version")
+    p_free.add_argument("prefix", choices=PREFIXES)
+    p_free.add_argument("version", type=int)
+
+    p_diff = sub.add_parser("diff", help="Manifest diff between two dataset versions")
+    p_diff.add_argument("rev_a")
+    p_diff.add_argument("rev_b")
+    p_diff.add_argument("--dvc_file", type=str, default=None,
+                        help="Tracked .dvc file (default: from the tag prefix)")
+    p_diff.add_argument("--yaml", type=str, default="data/data.yaml", help="Class names")
+    p_diff.add_argument("--no_counts", action="store_true", help="Skip reading changed label files")
+    p_diff.add_argument("--json", action="store_true", help="Print the full diff as JSON")
+    args = parser.parse_args()
+
+    if args.command == "next-version":
+        print(next_version(all_tags(args.remote, args.refresh)))
+    elif args.command == "free-tag":
+        print(free_tag(args.prefix, args.version, all_tags(args.remote, args.refresh)))
+    else:
+        result = diff_versions(args.rev_a, args.rev_b, args.dvc_file, not args.no_counts)
+        if args.json:
+            print(json.dumps(result, indent=2))
+            return
+        if result["identical"]:
+            log.info(f"{args.rev_a} và {args.rev_b} giống nhau ({result['md5']})")
+            return
+        names = load_class_names(REPO_ROOT / args.yaml)
+        log.info(f"📊 {args.rev_a} -> {args.rev_b}")
+        log.info(f"  added images    : {len(result['added_images'])}")
+        log.info(f"  removed images  : {len(result['removed_images'])}")
+        log.info(f"  modified images : {len(result['modified_images'])}")
+        log.info(f"  relabeled       : {len(result['relabeled'])}")
+        log.info(f"  per split       : {result['split_image_delta']}")
+        log.info(f"  per class       : "
+                 f"{ {names.get(c, c): d for c, d in result['class_object_delta'].items()} }")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+memory.py
+--------------------------------------------------------------------
+Memory-bounded processing helpers.
+
+- `iter_images`   : os.scandir-based generator, no materialized path lists
+- `image_nbytes`  : decoded size of a JPEG/PNG read from its header only
+- `MemoryBudget`  : byte-counting semaphore; a producer reserves the decoded
+                    size of an image before handing it to a worker, so the
+                    number of in-flight images adapts to their size
+- `peak_rss_bytes` / `reset_peak_rss` : per-stage peak RSS (VmHWM on Linux,
+                    getrusage elsewhere)
+
+This module must not import logs.log (logs.log uses it for the RSS line).
+"""
+
+import os
+import re
+import struct
+import sys
+import threading
+from pathlib import Path
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+_UNITS = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+
+
+def parse_size(text) -> int:
+    """'512M', '2G', '1.5g', '1048576' -> bytes."""
+    if isinstance(text, (int, float)):
+        return int(text)
+    m = re.fullmatch(r"\s*([\d.]+)\s*([kmgt]?)i?b?\s*", str(text).lower())
+    if not m:
+        raise ValueError(f"Invalid size: {text!r}")
+    return int(float(m.group(1)) * _UNITS[m.group(2)])
+
+
+# ==============================================================================
+# Listing
+# ==============================================================================
+def iter_images(directory, exts=IMAGE_EXTS):
+    """
+    Image paths in `directory` (not recursive), yielded as os.scandir finds them.
+    Hidden names are skipped, which covers the `.tmp-<pid>-*` files of
+    utils/safe_io.py that another stage may be writing into the same folder.
+    """
+    directory = Path(directory)
+    if not directory.exists():
+        return
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.startswith(".") or not entry.name.lower().endswith(exts):
+                continue
+            if entry.is_file():
+                yield directory / entry.name
+
+
+# ==============================================================================
+# Image size from header
+# ==============================================================================
+def image_shape(path):
+    """(width, height) from the PNG IHDR / JPEG SOF header, or None if unknown."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(26)
+            if head[:8] == b"\x89PNG\r\n\x1a\n":
+                return struct.unpack(">II", head[16:24])
+            if head[:2] != b"\xff\xd8":
+                return None
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                while marker[1] == 0xFF:  # fill bytes before the marker code
+                    marker = b"\xff" + f.read(1)
+                if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+                    continue
+                (length,) = struct.unpack(">H", f.read(2))
+                # SOF0..SOF15 except DHT (C4), JPG (C8), DAC (CC)
+                if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                    h, w = struct.unpack(">xHH", f.read(5))
+                    return w, h
+                f.seek(length - 2, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return None
+
+
+def image_nbytes(path, channels: int = 3) -> int:
+    """Decoded uint8 size of the image; falls back to 10x the file size."""
+    shape = image_shape(path)
+    if shape is not None:
+        return shape[0] * shape[1] * channels
+    try:
+        return os.path.getsize(path) * 10
+    except OSError:
+        return 0
+
+
+# ==============================================================================
+# Budget
+# ==============================================================================
+class MemoryBudget:
+    """
+    Blocks `acquire(n)` while the bytes in flight plus `n` exceed the budget.
+    One item is always admitted when nothing is in flight, so an image larger
+    than the whole budget still gets processed (alone).
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget = int(budget_bytes)
+        self.in_flight = 0
+        self.peak = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes: int):
+        with self._cond:
+            while self.in_flight > 0 and self.in_flight + nbytes > self.budget:
+                self._cond.wait()
+            self.in_flight += nbytes
+            self.peak = max(self.peak, self.in_flight)
+
+    def release(self, nbytes: int):
+        with self._cond:
+            self.in_flight -= nbytes
+            self._cond.notify_all()
+
+
+# ==============================================================================
+# RSS
+# ==============================================================================
+def _status_kb(field: str):
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def rss_bytes() -> int:
+    kb = _status_kb("VmRSS")
+    return kb * 1024 if kb is not None else peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    kb = _status_kb("VmHWM")
+    if kb is not None:
+        return kb * 1024
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, KiB on Linux
+
+
+def reset_peak_rss() -> bool:
+    """Reset the peak-RSS watermark (Linux >= 4.0), so a long-lived worker reports per job."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
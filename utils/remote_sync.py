@@ -0,0 +1,542 @@
+"""
+remote_sync.py
+--------------------------------------------------------------------
+Parallel push/pull of DVC-tracked data to the S3-compatible (MinIO) remote,
+driven by the stage manifests (`data/*.dvc`, `dvc.lock`).
+
+Objects are content-addressed with the same layout DVC 3 uses
+(`files/md5/<2>/<30>`, directories as `<md5>.dir` manifests), so `dvc pull`
+keeps working on anything pushed from here.
+
+Files matched by `.dvcignore` (gitignore syntax, root and nested files) are
+skipped while hashing a tree, like DVC does, so run journals and temp files
+never change a directory's md5.
+
+Two local indexes live in `.dvc/tmp/remote_sync.db` (sqlite):
+- `hashes`: (path, size, mtime_ns) -> md5, so unchanged files are not re-hashed
+- `remote`: md5 already confirmed on the remote, so those objects are never
+  listed, HEAD-checked or uploaded again
+
+Usage:
+    python utils/remote_sync.py push [data/labeled.dvc ...] [--jobs 16]
+    python utils/remote_sync.py pull [data/processed.dvc ...]
+    python utils/remote_sync.py status
+"""
+
+import argparse
+import configparser
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import yaml
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from logs.log import get_logger
+
+log = get_logger("remote_sync")
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DB_PATH = REPO_ROOT / ".dvc" / "tmp" / "remote_sync.db"
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+MULTIPART_CHUNK = 16 * 1024 * 1024
+
+
+# ==============================================================================
+# Remote config
+# ==============================================================================
+def load_remote_config(repo_root: Path = REPO_ROOT, name: str = None) -> dict:
+    """Read the default (or named) remote from `.dvc/config`; MINIO_* env vars override it."""
+    parser = configparser.ConfigParser()
+    parser.read([repo_root / ".dvc" / "config", repo_root / ".dvc" / "config.local"])
+    if name is None and parser.has_section("core"):
+        name = parser["core"].get("remote")
+
+    cfg = {}
+    for section in parser.sections():
+        stripped = section.strip("'")
+        if stripped == f'remote "{name}"':
+            cfg = dict(parser[section])
+            break
+
+    url = cfg.get("url", "")
+    bucket, _, prefix = url.replace("s3://", "", 1).partition("/")
+    if not (bucket or os.getenv("MINIO_BUCKET")):
+        raise ValueError(f"Remote '{name}' not found or has no s3:// url in .dvc/config")
+    return {
+        "endpoint": os.getenv("MINIO_ENDPOINT", cfg.get("endpointurl")),
+        "access_key": os.getenv("MINIO_ACCESS_KEY", cfg.get("access_key_id")),
+        "secret_key": os.getenv("MINIO_SECRET_KEY", cfg.get("secret_access_key")),
+        "bucket": os.getenv("MINIO_BUCKET", bucket),
+        "prefix": prefix.strip("/"),
+    }
+
+
+def make_client(remote: dict, jobs: int):
+    import boto3
+    from botocore.config import Config
+
+    return boto3.client(
+        "s3",
+        endpoint_url=remote["endpoint"],
+        aws_access_key_id=remote["access_key"],
+        aws_secret_access_key=remote["secret_key"],
+        config=Config(max_pool_connections=max(10, jobs * 2),
+                      retries={"max_attempts": 5, "mode": "adaptive"}),
+    )
+
+
+def object_key(remote: dict, md5: str) -> str:
+    key = f"files/md5/{md5[:2]}/{md5[2:]}"
+    return f"{remote['prefix']}/{key}" if remote["prefix"] else key
+
+
+# ==============================================================================
+# .dvcignore
+# ==============================================================================
+def _glob_to_regex(pattern: str) -> str:
+    out, i = [], 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            out.append("/.*")
+            i += 3
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1:]:
+            j = pattern.index("]", i + 1)
+            out.append("[" + pattern[i + 1:j].replace("!", "^", 1) + "]")
+            i = j + 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+
+class DvcIgnore:
+    """
+    gitignore-style rules from `.dvcignore` files. Rules of a nested
+    `.dvcignore` apply below its directory; the last matching rule wins.
+    """
+
+    DEFAULT = (".git/", ".hg/", ".dvc/")
+
+    def __init__(self, repo_root: Path = REPO_ROOT):
+        self.repo_root = os.path.abspath(repo_root)
+        self.rules = []  # (base relpath, regex, negate, dir_only)
+        self._loaded = set()
+        self.add_rules("", self.DEFAULT)
+        self.load(self.repo_root)
+
+    def load(self, directory: Path):
+        """Read `<directory>/.dvcignore` once, if it exists."""
+        base = self._rel(directory)
+        if base is None or base in self._loaded:
+            return
+        self._loaded.add(base)
+        path = Path(directory) / ".dvcignore"
+        if path.is_file():
+            self.add_rules("" if base == "." else base, path.read_text().splitlines())
+
+    def add_rules(self, base: str, lines):
+        for line in lines:
+            line = line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            line = line[1:] if negate else line
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            anchored = "/" in line
+            body = _glob_to_regex(line.lstrip("/"))
+            regex = re.compile(("^" if anchored else "^(?:.*/)?") + body + "$")
+            self.rules.append((base, regex, negate, dir_only))
+
+    def _rel(self, path):
+        """Posix path relative to the repo root (string ops only), None if outside it."""
+        rel = os.path.relpath(os.path.abspath(path), self.repo_root).replace(os.sep, "/")
+        return None if rel == ".." or rel.startswith("../") else rel
+
+    def ignored(self, path, is_dir: bool) -> bool:
+        rel = self._rel(path)
+        if rel is None:
+            return False  # ngoài repo: không có rule nào áp dụng
+        result = False
+        for base, regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if base:
+                if not rel.startswith(base + "/"):
+                    continue
+                sub = rel[len(base) + 1:]
+            else:
+                sub = rel
+            if regex.match(sub):
+                result = not negate
+        return result
+
+
+# ==============================================================================
+# Local index
+# ==============================================================================
+class SyncIndex:
+    def __init__(self, db_path: Path = DB_PATH):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, md5 TEXT);
+            CREATE TABLE IF NOT EXISTS remote (
+                bucket TEXT, md5 TEXT, PRIMARY KEY (bucket, md5));
+        """)
+
+    def cached_md5(self, path: Path, st) -> str:
+        with self.lock:
+            row = self.conn.execute("SELECT size, mtime_ns, md5 FROM hashes WHERE path = ?",
+                                    (str(path),)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        return None
+
+    def save_md5(self, rows):
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)", rows)
+            self.conn.commit()
+
+    def on_remote(self, bucket: str) -> set:
+        with self.lock:
+            return {r[0] for r in self.conn.execute("SELECT md5 FROM remote WHERE bucket = ?", (bucket,))}
+
+    def mark_remote(self, bucket: str, md5s):
+        with self.lock:
+            self.conn.executemany("INSERT OR IGNORE INTO remote VALUES (?, ?)",
+                                  [(bucket, m) for m in md5s])
+            self.conn.commit()
+
+
+def file_md5(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_tree(root: Path, index: SyncIndex, jobs: int, ignore: DvcIgnore = None):
+    """
+    md5 of every file under `root` (relpath -> (md5, size)) not excluded by
+    `.dvcignore`, hashing only changed files.
+    """
+    ignore = ignore or DvcIgnore()
+    entries, todo = {}, []
+    for dirpath, dirnames, filenames in os.walk(root):
+        ignore.load(Path(dirpath))
+        dirnames[:] = [d for d in dirnames if not ignore.ignored(Path(dirpath) / d, is_dir=True)]
+        for fname in filenames:
+            path = Path(dirpath) / fname
+            if ignore.ignored(path, is_dir=False):
+                continue
+            st = path.stat()
+            rel = path.relative_to(root).as_posix()
+            md5 = index.cached_md5(path.resolve(), st)
+            if md5 is None:
+                todo.append((rel, path, st))
+            else:
+                entries[rel] = (md5, st.st_size)
+
+    if todo:
+        log.info(f"Hashing {len(todo)} changed files under {root} ({len(entries)} cached)")
+        rows = []
+        with ThreadPoolExecutor(jobs) as pool:
+            futures = {pool.submit(file_md5, path): (rel, path, st) for rel, path, st in todo}
+            for fut in as_completed(futures):
+                rel, path, st = futures[fut]
+                md5 = fut.result()
+                entries[rel] = (md5, st.st_size)
+                rows.append((str(path.resolve()), st.st_size, st.st_mtime_ns, md5))
+        index.save_md5(rows)
+    return entries
+
+
+def dir_manifest(entries: dict):
+    """DVC `.dir` object content and its md5 for a relpath -> (md5, size) mapping."""
+    manifest = [{"md5": entries[rel][0], "relpath": rel} for rel in sorted(entries)]
+    content = json.dumps(manifest, sort_keys=True).encode()
+    return content, hashlib.md5(content).hexdigest() + ".dir"
+
+
+# ==============================================================================
+# Manifests
+# ==============================================================================
+def load_outs(targets, repo_root: Path = REPO_ROOT):
+    """(workspace path, recorded md5) for every out in the given `.dvc` files / `dvc.lock`."""
+    outs = []
+    for target in targets:
+        target = Path(target)
+        with open(target, "r") as f:
+            data = yaml.safe_load(f) or {}
+        if target.name == "dvc.lock":
+            for stage in (data.get("stages") or {}).values():
+                for out in stage.get("outs", []):
+                    outs.append((repo_root / out["path"], out["md5"]))
+        else:
+            for out in data.get("outs", []):
+                outs.append((target.parent / out["path"], out["md5"]))
+    return outs
+
+
+def default_targets(repo_root: Path = REPO_ROOT):
+    return sorted((repo_root / "data").glob("*.dvc"))
+
+
+# ==============================================================================
+# Transfer
+# ==============================================================================
+class Progress:
+    def __init__(self):
+        self.bytes = 0
+        self.objects = 0
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def add(self, n_bytes: int):
+        with self.lock:
+            self.bytes += n_bytes
+            self.objects += 1
+
+    def rate(self) -> str:
+        elapsed = time.perf_counter() - self.start
+        mbps = self.bytes / elapsed / 1024 / 1024 if elapsed > 0 else 0.0
+        return f"{self.objects} objects, {self.bytes / 1024 / 1024:.1f} MB in {elapsed:.1f}s ({mbps:.2f} MB/s)"
+
+
+def _transfer_config(jobs: int):
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(multipart_threshold=MULTIPART_THRESHOLD, multipart_chunksize=MULTIPART_CHUNK,
+                          max_concurrency=max(1, min(8, jobs // 2)), use_threads=True)
+
+
+def _is_missing(exc: Exception) -> bool:
+    """botocore ClientError for a key that is not on the remote (get_object / head_object)."""
+    code = getattr(exc, "response", {}).get("Error", {}).get("Code")
+    return code in ("NoSuchKey", "404")
+
+
+def _retry(fn, attempts: int = 3, backoff: float = 1.0):
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == attempts - 1 or _is_missing(e):  # object thiếu thì retry cũng vô ích
+                raise
+            time.sleep(backoff * (2 ** attempt))
+
+
+def upload_object(client, remote: dict, src, md5: str, size: int, transfer_cfg):
+    """Upload one object and verify it (ETag for single-part, size for multipart)."""
+    key = object_key(remote, md5)
+
+    def _do():
+        if isinstance(src, bytes):
+            client.put_object(Bucket=remote["bucket"], Key=key, Body=src)
+        else:
+            client.upload_file(str(src), remote["bucket"], key, Config=transfer_cfg)
+        head = client.head_object(Bucket=remote["bucket"], Key=key)
+        etag = head["ETag"].strip('"')
+        if head["ContentLength"] != size or ("-" not in etag and etag != md5.replace(".dir", "")):
+            raise IOError(f"Verification failed for {key}")
+
+    _retry(_do)
+
+
+def download_object(client, remote: dict, md5: str, dest: Path, transfer_cfg):
+    key = object_key(remote, md5)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(dest.name + ".sync_tmp")
+
+    def _do():
+        client.download_file(remote["bucket"], key, str(tmp), Config=transfer_cfg)
+        if file_md5(tmp) != md5:
+            raise IOError(f"Checksum mismatch for {key}")
+        tmp.replace(dest)
+
+    try:
+        _retry(_do)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _index_path(repo_root: Path) -> Path:
+    return Path(repo_root) / ".dvc" / "tmp" / "remote_sync.db"
+
+
+def push(targets, jobs: int = 16, remote_name: str = None, verify_manifest: bool = True,
+         repo_root: Path = REPO_ROOT) -> bool:
+    remote = load_remote_config(repo_root, name=remote_name)
+    index = SyncIndex(_index_path(repo_root))
+    ignore = DvcIgnore(repo_root)
+    client = make_client(remote, jobs)
+    transfer_cfg = _transfer_config(jobs)
+    known = index.on_remote(remote["bucket"])
+
+    uploads = {}  # md5 -> (source path or bytes, size)
+    ok = True
+    for path, recorded in load_outs(targets, repo_root):
+        if not path.exists():
+            log.warning(f"{path} does not exist, skipping")
+            continue
+        if path.is_dir():
+            entries = hash_tree(path, index, jobs, ignore)
+            content, dir_md5 = dir_manifest(entries)
+            if verify_manifest and dir_md5 != recorded:
+                log.error(f"{path}: workspace ({dir_md5}) differs from manifest ({recorded}). "
+                          f"Run `dvc add` / `dvc commit` first.")
+                ok = False
+                continue
+            uploads[dir_md5] = (content, len(content))
+            for rel, (md5, size) in entries.items():
+                uploads.setdefault(md5, (path / rel, size))
+        else:
+            md5 = file_md5(path)
+            if verify_manifest and md5 != recorded:
+                log.error(f"{path}: workspace md5 differs from manifest. Run `dvc add` first.")
+                ok = False
+                continue
+            uploads[md5] = (path, path.stat().st_size)
+
+    todo = {m: v for m, v in uploads.items() if m not in known}
+    log.info(f"{len(uploads)} objects in manifests, {len(uploads) - len(todo)} already on remote "
+             f"(local index), {len(todo)} to upload")
+
+    progress = Progress()
+    done, failed = [], 0
+    with ThreadPoolExecutor(jobs) as pool:
+        futures = {pool.submit(upload_object, client, remote, src, md5, size, transfer_cfg): (md5, size)
+                   for md5, (src, size) in todo.items()}
+        for fut in as_completed(futures):
+            md5, size = futures[fut]
+            try:
+                fut.result()
+            except Exception as e:
+                failed += 1
+                log.error(f"Upload failed for {md5}: {e}")
+                continue
+            progress.add(size)
+            done.append(md5)
+            if len(done) % 500 == 0:
+                index.mark_remote(remote["bucket"], done[-500:])
+                log.info(f"push progress: {progress.rate()}")
+    index.mark_remote(remote["bucket"], done)
+
+    log.info(f"⬆️  push: {progress.rate()}, {failed} failed")
+    return ok and failed == 0
+
+
+def pull(targets, jobs: int = 16, remote_name: str = None, repo_root: Path = REPO_ROOT) -> bool:
+    remote = load_remote_config(repo_root, name=remote_name)
+    index = SyncIndex(_index_path(repo_root))
+    ignore = DvcIgnore(repo_root)
+    client = make_client(remote, jobs)
+    transfer_cfg = _transfer_config(jobs)
+
+    downloads = []  # (md5, dest)
+    present = []    # .dir manifests đọc được từ remote
+    failed = 0
+    for path, recorded in load_outs(targets, repo_root):
+        if recorded.endswith(".dir"):
+            key = object_key(remote, recorded)
+            try:
+                body = _retry(lambda: client.get_object(Bucket=remote["bucket"], Key=key)["Body"].read())
+            except Exception as e:
+                failed += 1
+                reason = "not on remote" if _is_missing(e) else e
+                log.error(f"Dir manifest {recorded} for {path}: {reason}")
+                continue
+            present.append(recorded)
+            local = hash_tree(path, index, jobs, ignore) if path.exists() else {}
+            for entry in json.loads(body):
+                rel, md5 = entry["relpath"], entry["md5"]
+                if local.get(rel, (None,))[0] != md5:
+                    downloads.append((md5, path / rel))
+        elif not path.exists() or file_md5(path) != recorded:
+            downloads.append((recorded, path))
+
+    log.info(f"{len(downloads)} objects to download")
+    progress = Progress()
+    with ThreadPoolExecutor(jobs) as pool:
+        futures = {pool.submit(download_object, client, remote, md5, dest, transfer_cfg): (md5, dest)
+                   for md5, dest in downloads}
+        for fut in as_completed(futures):
+            md5, dest = futures[fut]
+            try:
+                fut.result()
+            except Exception as e:
+                failed += 1
+                log.error(f"Download failed for {dest}: {e}")
+                continue
+            progress.add(dest.stat().st_size)
+            present.append(md5)
+    # Chỉ đánh dấu object đã thật sự tải về (đã kiểm checksum) là có trên remote
+    index.mark_remote(remote["bucket"], present)
+
+    log.info(f"⬇️  pull: {progress.rate()}, {failed} failed")
+    return failed == 0
+
+
+def status(targets, jobs: int = 16, remote_name: str = None, repo_root: Path = REPO_ROOT):
+    remote = load_remote_config(repo_root, name=remote_name)
+    index = SyncIndex(_index_path(repo_root))
+    ignore = DvcIgnore(repo_root)
+    known = index.on_remote(remote["bucket"])
+    for path, recorded in load_outs(targets, repo_root):
+        if not path.exists():
+            log.info(f"{path}: missing in workspace")
+            continue
+        if path.is_dir():
+            entries = hash_tree(path, index, jobs, ignore)
+            _, dir_md5 = dir_manifest(entries)
+            pending = sum(1 for md5, _ in entries.values() if md5 not in known)
+            state = "clean" if dir_md5 == recorded else "modified"
+            log.info(f"{path}: {state}, {len(entries)} files, {pending} not yet pushed")
+        else:
+            state = "clean" if file_md5(path) == recorded else "modified"
+            log.info(f"{path}: {state}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel push/pull of DVC data to the MinIO remote")
+    parser.add_argument("command", choices=["push", "pull", "status"])
+    parser.add_argument("targets", nargs="*", help=".dvc files or dvc.lock (default: data/*.dvc)")
+    parser.add_argument("--jobs", "-j", type=int, default=16, help="Parallel transfers / hashers")
+    parser.add_argument("--remote", "-r", type=str, default=None, help="DVC remote name")
+    parser.add_argument("--no_verify_manifest", action="store_true",
+                        help="Push even if the workspace no longer matches the recorded md5")
+    args = parser.parse_args()
+
+    targets = args.targets or default_targets()
+    if args.command == "push":
+        ok = push(targets, args.jobs, args.remote, verify_manifest=not args.no_verify_manifest)
+    elif args.command == "pull":
+        ok = pull(targets, args.jobs, args.remote)
+    else:
+        status(targets, args.jobs, args.remote)
+        ok = True
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+safe_io.py
+--------------------------------------------------------------------
+Crash-safe outputs for the pipeline stages.
+
+- `atomic_write` / `atomic_copy` / `atomic_imwrite` / `atomic_copytree`:
+  data goes to a hidden temp file next to the target and is moved into place
+  with os.replace, so a reader (or the next run's `exists()` skip check) only
+  ever sees complete files. Temp names carry the writer's pid, and
+  `clean_temp_files` only removes those of processes that are gone.
+- `RunJournal`: append-only JSON-lines journal of per-item progress, one file
+  per run (`<name>-<pid>.jsonl`) so parallel runs never interleave. It is
+  deleted when a run finishes; journals left by dead processes are adopted at
+  start-up: their records tell the stage what was already done and what was
+  planned but not committed (e.g. a split assignment), so it can resume
+  without re-running inference or rescanning outputs.
+"""
+
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from logs.log import get_logger
+
+log = get_logger("safe_io")
+
+TMP_PREFIX = ".tmp-"
+
+
+def _tmp_path(path: Path) -> Path:
+    return path.with_name(f"{TMP_PREFIX}{os.getpid()}-{path.name}")
+
+
+def pid_alive(pid: int) -> bool:
+    if pid <= 0:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by another user
+    return True
+
+
+def _temp_owner(name: str):
+    """Writer pid of a temp name (`.tmp-<pid>-x`, `.tmp-old-<pid>-x`), None if it has none."""
+    rest = name[len(TMP_PREFIX):]
+    if rest.startswith("old-"):
+        rest = rest[len("old-"):]
+    pid = rest.split("-", 1)[0]
+    return int(pid) if pid.isdigit() else None
+
+
+# ==============================================================================
+# Atomic writes
+# ==============================================================================
+@contextmanager
+def atomic_write(path, mode: str = "w", fsync: bool = False, **kwargs):
+    """`open()` replacement: the file appears at `path` only if the block finishes."""
+    path = Path(path)
+    tmp = _tmp_path(path)
+    try:
+        with open(tmp, mode, **kwargs) as f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def atomic_write_text(path, text: str):
+    with atomic_write(path, "w") as f:
+        f.write(text)
+
+
+def atomic_copy(src, dst):
+    dst = Path(dst)
+    tmp = _tmp_path(dst)
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def atomic_imwrite(path, img) -> bool:
+    """cv2.imwrite through an in-memory encode, so the extension still picks the format."""
+    import cv2
+    path = Path(path)
+    ok, buf = cv2.imencode(path.suffix, img)
+    if not ok:
+        return False
+    with atomic_write(path, "wb") as f:
+        f.write(buf.tobytes())
+    return True
+
+
+def atomic_copytree(src, dst):
+    """Replace directory `dst` with a copy of `src`; `dst` is never left half-copied."""
+    src, dst = Path(src), Path(dst)
+    tmp = _tmp_path(dst)
+    old = dst.with_name(f"{TMP_PREFIX}old-{os.getpid()}-{dst.name}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    shutil.copytree(src, tmp)
+    if dst.exists():
+        os.replace(dst, old)
+    os.replace(tmp, dst)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def clean_temp_files(directory) -> int:
+    """
+    Remove temp files left by a killed run. Returns how many were removed.
+    Files whose writer is still running (another process, same folder) are kept.
+    """
+    directory = Path(directory)
+    if not directory.exists():
+        return 0
+    removed = 0
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.startswith(TMP_PREFIX):
+                owner = _temp_owner(entry.name)
+                if owner is not None and pid_alive(owner):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.unlink(entry.path)
+                removed += 1
+    return removed
+
+
+# ==============================================================================
+# Journal
+# ==============================================================================
+class RunJournal:
+    """
+    Per-run progress journal. `path` names the stage journal (e.g.
+    `.journal/autolabel.jsonl`); this run writes `.journal/autolabel-<pid>.jsonl`.
+    `record(key, state, **fields)` appends one line; `last(key)` is the latest
+    record for that key, including those of interrupted previous runs.
+    `finish()` removes the journal.
+    """
+
+    def __init__(self, path, stage: str):
+        base = Path(path)
+        self.path = base.with_name(f"{base.stem}-{os.getpid()}{base.suffix}")
+        self.stage = stage
+        self.records = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Journal của run đã chết (hoặc job trước trong cùng warm worker) được nhận lại;
+        # journal của run khác đang chạy song song thì để nguyên
+        adopted = 0
+        for orphan in self._orphans(base):
+            claim = self.path.with_name(f"{base.stem}-{os.getpid()}.{adopted}{base.suffix}")
+            try:
+                os.replace(orphan, claim)  # atomic: hai run cùng khởi động không nhận cùng một journal
+            except FileNotFoundError:
+                continue
+            with open(claim, "r") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # last line cut short by the crash
+                    self.records[rec["key"]] = rec
+            adopted += 1
+        self.resumed = adopted > 0
+
+        self._f = open(self.path, "a")
+        if self.resumed:
+            for rec in self.records.values():
+                self._f.write(json.dumps(rec) + "\n")
+            self._f.flush()
+            for i in range(adopted):
+                self.path.with_name(f"{base.stem}-{os.getpid()}.{i}{base.suffix}").unlink(missing_ok=True)
+            log.info(f"♻️  {stage}: journal của lần chạy bị ngắt ({len(self.records)} items), tiếp tục")
+
+    @staticmethod
+    def _orphans(base: Path):
+        """Journals of `base` whose process is gone, oldest first (plus a pre-pid `base` file)."""
+        pattern = re.compile(rf"{re.escape(base.stem)}-(\d+)(?:\.\d+)?{re.escape(base.suffix)}")
+        found = []
+        for p in base.parent.iterdir():
+            m = pattern.fullmatch(p.name)
+            if p != base and not m:
+                continue
+            if m and int(m.group(1)) != os.getpid() and pid_alive(int(m.group(1))):
+                continue  # run khác đang chạy
+            try:
+                found.append((p.stat().st_mtime, p))
+            except FileNotFoundError:
+                continue  # vừa được run khác nhận
+        return [p for _, p in sorted(found)]
+
+    def last(self, key: str):
+        return self.records.get(key)
+
+    def state(self, key: str):
+        rec = self.records.get(key)
+        return rec["state"] if rec else None
+
+    def keys(self, state: str):
+        return [k for k, rec in self.records.items() if rec["state"] == state]
+
+    def record(self, key: str, state: str, **fields):
+        rec = {"key": key, "state": state, "time": round(time.time(), 3), **fields}
+        self.records[key] = rec
+        self._f.write(json.dumps(rec) + "\n")
+        self._f.flush()
+
+    def compact(self, final_states):
+        """Drop records in `final_states` (memory and file); for long-running services."""
+        self.records = {k: r for k, r in self.records.items() if r["state"] not in final_states}
+        self._f.close()
+        with atomic_write(self.path) as f:
+            for rec in self.records.values():
+                f.write(json.dumps(rec) + "\n")
+        self._f = open(self.path, "a")
+
+    def finish(self):
+        """Run completed: nothing to resume next time."""
+        self._f.close()
+        self.path.unlink(missing_ok=True)
+
+    def close(self):
+        self._f.close()
@@ -1,8 +1,18 @@
-import cv2
 import random
 import yaml
+import sys
+import os
+import time
+import logging
 from pathlib import Path
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from logs.log import ProgressLogger, get_logger
+from utils.memory import iter_images
+from utils.safe_io import RunJournal, atomic_imwrite, clean_temp_files
+
+log = get_logger("visualize")
+
 def load_class_names(yaml_path):
     with open(yaml_path, "r") as f:
         data = yaml.safe_load(f)
@@ -46,6 +56,7 @@ def load_yolo_labels(txt_path, img_width, img_height):
     return boxes, labels
 
 def draw_boxes(image, boxes, labels=None, class_names=None, colors=None, thickness=2):
+    import cv2
     for i, (x1, y1, x2, y2) in enumerate(boxes):
         cls_id = labels[i]
         color = colors.get(cls_id, (0, 255, 0)) if colors else (0, 255, 0)
@@ -57,27 +68,41 @@ def draw_boxes(image, boxes, labels=None, class_names=None, colors=None, thickne
     return image
 
 def visualize_folder(img_dir: Path, label_dir: Path, output_dir: Path, yaml_path: Path):
+    import cv2
     class_names = load_class_names(yaml_path)
     colors = generate_colors(len(class_names))
 
     output_dir.mkdir(parents=True, exist_ok=True)
-    image_paths = list(img_dir.glob("*.[jp][pn]g"))
+    clean_temp_files(output_dir)
 
-    print(f"[INFO] Visualizing {len(image_paths)} images from {img_dir}")
+    # Run trước bị ngắt: bỏ qua ảnh đã vẽ xong (ghi atomic nên file output luôn đầy đủ)
+    journal = RunJournal(output_dir / ".journal" / "visualize.jsonl", "visualize")
+    done = set(journal.keys("saved")) if journal.resumed else set()
+    image_paths = (p for p in iter_images(img_dir) if p.name not in done)
+
+    log.info(f"Visualizing images from {img_dir}")
+    progress = ProgressLogger("visualize")
 
     for img_path in image_paths:
+        t0 = time.perf_counter()
         label_path = label_dir / (img_path.stem + ".txt")
         img = cv2.imread(str(img_path))
         if img is None:
-            print(f"[WARNING] Cannot read image {img_path}, skipping.")
+            progress.item(img_path.name, "unreadable", msg=f"Cannot read image {img_path}, skipping.",
+                          level=logging.WARNING)
             continue
 
         h, w = img.shape[:2]
         boxes, labels = load_yolo_labels(label_path, w, h)
-        vis_image = draw_boxes(img, boxes, labels, class_names, colors)
+        draw_boxes(img, boxes, labels, class_names, colors)  # vẽ in-place lên img
         output_path = output_dir / img_path.name
-        cv2.imwrite(str(output_path), vis_image)
-        print(f"[✓] Saved visualized image to: {output_path}")
+        atomic_imwrite(output_path, img)
+        journal.record(img_path.name, "saved")
+        progress.item(img_path.name, "saved", time.perf_counter() - t0,
+                      msg=f"Saved visualized image to: {output_path}")
+
+    progress.close()
+    journal.finish()
 
 # ==== Ví dụ sử dụng ====
 if __name__ == "__main__":
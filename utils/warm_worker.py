@@ -0,0 +1,206 @@
+"""
+warm_worker.py
+--------------------------------------------------------------------
+Long-lived worker that keeps the heavy imports (torch/ultralytics, cv2,
+albumentations) and the loaded detector in memory, so repeated autolabel /
+augment runs skip the interpreter + import + model load cost.
+
+Jobs are sent over a Unix socket as one JSON line
+`{"job": "autolabel", "argv": [...], "cwd": "..."}` and run one at a time with
+the same argv the CLI would have received. The reply is one JSON line with
+`ok`, `elapsed` and `error`. Logs go to the pipeline log as usual.
+
+Usage:
+    python utils/warm_worker.py serve --preload_model yolov8x.pt &
+    python auto_label/autolabel.py --worker ...      # falls back to in-process if not running
+    python utils/warm_worker.py ping
+    python utils/warm_worker.py shutdown
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from logs.log import get_logger
+
+log = get_logger("warm_worker")
+
+SOCKET_PATH = os.environ.get("PIPELINE_WORKER_SOCKET", "/tmp/dvc_pipeline_worker.sock")
+
+
+# ==============================================================================
+# Jobs
+# ==============================================================================
+def _autolabel(argv):
+    from auto_label.autolabel import build_parser, run
+    run(build_parser().parse_args(argv))
+
+
+def _augment(argv):
+    from processing.preprocess import build_parser, run
+    run(build_parser().parse_args(argv))
+
+
+JOBS = {"autolabel": _autolabel, "augment": _augment}
+
+
+def preload(model=None, backend="torch", imgsz=640, conf=0.4, int8=False, augment=True):
+    """Pay the import / model load cost once, before the first job arrives."""
+    t0 = time.perf_counter()
+    if model:
+        from auto_label.backends import load_backend
+        load_backend(backend, model, conf=conf, imgsz=imgsz, int8=int8)
+    if augment:
+        from processing.preprocess import get_augmentation_pipeline
+        get_augmentation_pipeline()
+    import auto_label.autolabel  # noqa: F401
+    log.info(f"🔥 Preload xong trong {time.perf_counter() - t0:.1f}s")
+
+
+def run_job(job, argv, cwd):
+    if job not in JOBS:
+        return {"ok": False, "error": f"unknown job '{job}'", "elapsed": 0.0}
+    from utils.memory import peak_rss_bytes, reset_peak_rss
+    reset_peak_rss()  # peak RSS của worker được tính riêng cho từng job
+    t0 = time.perf_counter()
+    old_cwd = os.getcwd()
+    try:
+        os.chdir(cwd)
+        JOBS[job](argv)
+        return {"ok": True, "error": None, "elapsed": time.perf_counter() - t0,
+                "peak_rss_mb": round(peak_rss_bytes() / (1 << 20), 1)}
+    except SystemExit as e:
+        # argparse errors / --help inside the job must not kill the worker
+        return {"ok": e.code in (0, None), "error": f"exit {e.code}", "elapsed": time.perf_counter() - t0}
+    except Exception as e:
+        log.error(f"❌ Job {job} lỗi: {e}\n{traceback.format_exc()}")
+        return {"ok": False, "error": str(e), "elapsed": time.perf_counter() - t0}
+    finally:
+        os.chdir(old_cwd)
+
+
+# ==============================================================================
+# Server / client
+# ==============================================================================
+def _recv_line(conn) -> bytes:
+    buf = b""
+    while not buf.endswith(b"\n"):
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        buf += chunk
+    return buf
+
+
+def serve(path=SOCKET_PATH):
+    if os.path.exists(path):
+        if ping(path):
+            raise RuntimeError(f"A worker is already listening on {path}")
+        os.unlink(path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(8)
+    lock = threading.Lock()  # jobs write into the same data/ folders, run them one at a time
+    log.info(f"🟢 Warm worker listening on {path}")
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                try:
+                    request = json.loads(_recv_line(conn) or b"{}")
+                except json.JSONDecodeError as e:
+                    conn.sendall((json.dumps({"ok": False, "error": f"bad request: {e}"}) + "\n").encode())
+                    continue
+                job = request.get("job")
+                if job == "ping":
+                    reply = {"ok": True, "pid": os.getpid()}
+                elif job == "shutdown":
+                    conn.sendall((json.dumps({"ok": True}) + "\n").encode())
+                    break
+                else:
+                    with lock:
+                        log.info(f"▶️  {job} {' '.join(request.get('argv', []))}")
+                        reply = run_job(job, request.get("argv", []), request.get("cwd", os.getcwd()))
+                        log.info(f"⏱️  {job} xong trong {reply['elapsed']:.2f}s (ok={reply['ok']}, "
+                                 f"peak RSS {reply.get('peak_rss_mb', '?')} MB)")
+                conn.sendall((json.dumps(reply) + "\n").encode())
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.unlink(path)
+        log.info("🛑 Warm worker stopped")
+
+
+def _request(payload: dict, path=SOCKET_PATH, timeout=None):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(path)
+        conn.sendall((json.dumps(payload) + "\n").encode())
+        return json.loads(_recv_line(conn))
+
+
+def ping(path=SOCKET_PATH) -> bool:
+    try:
+        return _request({"job": "ping"}, path, timeout=2.0).get("ok", False)
+    except (OSError, ValueError):
+        return False
+
+
+def submit_job(job: str, argv, path=SOCKET_PATH) -> bool:
+    """
+    Run `job` in the warm worker. Returns False if no worker is reachable, so
+    the caller can run in-process instead. A job that fails in the worker
+    exits non-zero, like the in-process run would.
+    """
+    argv = [a for a in argv if a != "--worker"]
+    try:
+        reply = _request({"job": job, "argv": argv, "cwd": os.getcwd()}, path)
+    except (OSError, ValueError):
+        log.info(f"Warm worker không chạy ({path}), chạy trực tiếp")
+        return False
+    if not reply.get("ok"):
+        log.error(f"❌ Warm worker: {job} thất bại: {reply.get('error')}")
+        sys.exit(1)
+    log.info(f"✅ {job} chạy trong warm worker ({reply['elapsed']:.2f}s)")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm worker for autolabel / augment jobs")
+    parser.add_argument("command", choices=["serve", "ping", "shutdown"])
+    parser.add_argument("--socket", type=str, default=SOCKET_PATH, help="Unix socket path")
+    parser.add_argument("--preload_model", type=str, default=None,
+                        help="Load model này trước (vd: yolov8x.pt), cùng settings với autolabel")
+    parser.add_argument("--backend", type=str, default="torch", help="Backend của model preload")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--conf", type=float, default=0.4)
+    parser.add_argument("--int8", action="store_true")
+    parser.add_argument("--no_preload_augment", action="store_true",
+                        help="Không build sẵn augmentation pipeline")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        preload(args.preload_model, args.backend, args.imgsz, args.conf, args.int8,
+                augment=not args.no_preload_augment)
+        serve(args.socket)
+    elif args.command == "ping":
+        alive = ping(args.socket)
+        log.info(f"Warm worker {'đang chạy' if alive else 'không chạy'} ({args.socket})")
+        sys.exit(0 if alive else 1)
+    else:
+        try:
+            _request({"job": "shutdown"}, args.socket, timeout=5.0)
+        except (OSError, ValueError):
+            log.info(f"Warm worker không chạy ({args.socket})")
+
+
+if __name__ == "__main__":
+    main()